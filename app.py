@@ -1,18 +1,73 @@
 import streamlit as st
 import pandas as pd
-import google.generativeai as genai
 import time
-import json
+import random
+import hashlib
 from pathlib import Path
 import io
 from streamlit_extras.switch_page_button import switch_page
-import openpyxl
-from openpyxl.chart import PieChart, BarChart, Reference
-from openpyxl.styles import Alignment, PatternFill, Font
+from pipeline.classifier import (
+    MODEL_NAME,
+    make_batch_classifier,
+)
+from pipeline.background import STATUS_FAILED, STATUS_QUEUED, STATUS_RUNNING, JobRunner
+from pipeline.batching import estimate_compact_output_tokens, estimate_output_tokens, plan_batches, summarize_plan
+from pipeline.cache import ClassificationCache, taxonomy_fingerprint
+from pipeline.compact import SCHEMA_COMPACT, SCHEMA_FULL, TaxonomyCodes
+from pipeline.dedup import collapse_duplicates
+from pipeline.export import write_results_workbook
+from pipeline.gemini import (
+    BACKEND_FAKE,
+    BACKEND_GEMINI,
+    cache_model_name,
+    configure as configure_backend,
+    create_model,
+    create_session,
+    create_session_pool,
+    file_expired,
+    make_session_factory,
+    upload_file,
+    wait_until_active,
+)
+from pipeline.ingest import column_responses, read_csv_with_encoding, split_text_responses
+from pipeline.jobs import JobStore
+from pipeline.lexicon import LexiconClassifier
+from pipeline.pool import (
+    RequestPool,
+    api_keys_from_secrets,
+    model_names_from_secrets,
+    pool_limiter,
+    rate_limits_from_secrets,
+)
+from pipeline.resilience import CIRCUIT_OPEN, Hedger, get_shared_breaker, get_shared_latencies
+from pipeline.selftrain import MAX_TRAINING_LABELS, LabelStore, train_local_model
+from pipeline.taxonomy import TaxonomyIndex
+from pipeline.tracing import configure_tracing, read_trace, span, summarize_spans
+from pipeline.usage import UsageTracker
 
 # Constants
-MIN_BATCH_SIZE = 50  # Minimum batch size for processing
 MAX_BATCH_SIZE = 80  # Maximum batch size for processing
+BATCH_INPUT_TOKEN_BUDGET = 6000  # Estimated prompt tokens per batch
+BATCH_OUTPUT_TOKEN_BUDGET = 7000  # Estimated output tokens per batch (model max is 8192)
+MAX_CONCURRENT_BATCHES = 4  # Batches in flight at once
+LIVE_PREVIEW_LIMIT = 20  # Most recent results shown while a run is in progress
+PREVIEW_CACHE_ENTRIES = 8  # Uploaded files whose local preview counts are kept
+CLASSIFICATION_MODE = "stateless"  # "stateless" (independent requests) or "chat" (shared history)
+CACHE_PATH = Path(__file__).parent / ".cache" / "classifications.sqlite3"
+CACHE_MAX_ENTRIES = 100000  # Least recently used entries are evicted above this
+JOBS_PATH = Path(__file__).parent / ".cache" / "jobs.sqlite3"
+MAX_BACKGROUND_JOBS = 2  # Classification jobs run at once across all sessions
+JOB_POLL_INTERVAL = 1  # Seconds between progress refreshes while a job is running
+TAXONOMY_PATH = Path(__file__).parent / "data" / "Classes.txt"
+GEMINI_RESOURCE_TTL = 47 * 3600  # Uploaded files expire after 48 hours
+LOCAL_CONFIDENCE_THRESHOLD = 0.85  # Lexicon confidence needed to skip the model
+LABELS_PATH = Path(__file__).parent / ".cache" / "labels.sqlite3"
+LOCAL_MODEL_THRESHOLD = 0.9  # Local model confidence needed to skip Gemini
+LOCAL_MODEL_RETRAIN_INTERVAL = 500  # New Gemini labels before the local model is retrained
+TRACE_PATH = Path(__file__).parent / ".cache" / "trace.jsonl"
+TRACE_SUMMARY_WINDOW = 24 * 3600  # Seconds of spans summarized in the admin panel
+DEBUG_SAMPLE_RATE = 0.1  # Share of batches whose parsed JSON is shown in debug mode
+HEDGE_PERCENTILE = 0.95  # Batch calls slower than this share of recent calls are re-issued
 
 # Configure Gemini API and page settings
 st.set_page_config(
@@ -25,10 +80,46 @@ st.set_page_config(
 with open('static/css/main.css', encoding='utf-8') as f:
     st.markdown(f'<style>{f.read()}</style>', unsafe_allow_html=True)
 
+def configure_trace_log():
+    """Write hot-path spans to the rotating trace file unless disabled in secrets."""
+    try:
+        enabled = st.secrets.get("TRACING", True)
+    except Exception:
+        enabled = True
+    configure_tracing(TRACE_PATH if enabled else None)
+
+configure_trace_log()
+
 #------------------------------------------------------------------------------
 # Gemini Communication
 #------------------------------------------------------------------------------
 
+def get_api_keys():
+    """Gemini API keys from secrets."""
+    return api_keys_from_secrets(st.secrets)
+
+def get_model_names():
+    """Classification models from secrets (GEMINI_MODELS), by default only MODEL_NAME."""
+    return model_names_from_secrets(st.secrets, MODEL_NAME)
+
+def get_rate_limiter():
+    """Process-wide rate limiter of the classification models, sized for every key and model."""
+    return pool_limiter(st.secrets, get_model_names())
+
+def get_backend_name():
+    """Model backend from secrets: "gemini" (default) or the offline "fake" stand-in."""
+    try:
+        return st.secrets.get("GEMINI_BACKEND", BACKEND_GEMINI)
+    except Exception:
+        return BACKEND_GEMINI
+
+def get_output_schema():
+    """Answer format from secrets: "full" (default, with explanations) or "compact" (codes only)."""
+    try:
+        return st.secrets.get("OUTPUT_SCHEMA", SCHEMA_FULL)
+    except Exception:
+        return SCHEMA_FULL
+
 def upload_to_gemini(path, mime_type=None):
     """Uploads the given file to Gemini."""
     try:
@@ -39,9 +130,7 @@ def upload_to_gemini(path, mime_type=None):
         if not file_path.exists():
             raise FileNotFoundError(f"File not found: {path}")
 
-        file = genai.upload_file(str(file_path), mime_type=mime_type)
-        print(f"Uploaded file '{file.display_name}' as: {file.uri}")
-        return file
+        return upload_file(file_path, mime_type=mime_type, limiter=get_rate_limiter())
     except Exception as e:
         st.error(f"Failed to upload file: {e}")
         return None
@@ -54,14 +143,7 @@ def wait_for_files_active(files):
             if file is None:
                 raise Exception("Invalid file object")
 
-            name = file.name
-            file = genai.get_file(name)
-            while file.state.name == "PROCESSING":
-                print(".", end="", flush=True)
-                time.sleep(2)
-                file = genai.get_file(name)
-            if file.state.name != "ACTIVE":
-                raise Exception(f"File {file.name} failed to process")
+            wait_until_active(file, limiter=get_rate_limiter())
         print("...all files ready")
         print()
     except Exception as e:
@@ -69,118 +151,122 @@ def wait_for_files_active(files):
         return False
     return True
 
+@st.cache_resource(ttl=GEMINI_RESOURCE_TTL, show_spinner=False)
+def get_gemini_resources(backend, taxonomy_hash, schema):
+    """Configured model and uploaded categories file shared by all sessions.
+
+    Keyed by the taxonomy content hash, so editing the categories uploads
+    the file again; ``initialize_gemini`` also clears it once the remote
+    file is about to expire.
+    """
+    start_time = time.time()
+    # Get API keys from streamlit secrets (the local fake backend needs none)
+    api_keys = get_api_keys() or [None]
+    model_names = get_model_names()
+    configure_backend(api_keys[0], backend)
+    codes = TaxonomyCodes.from_file(TAXONOMY_PATH) if schema == SCHEMA_COMPACT else None
+
+    if len(api_keys) * len(model_names) > 1:
+        # Several keys or models: batches are spread over a pool of
+        # stateless sessions, one per key and model, each key with its own
+        # upload of the categories file
+        requests_per_minute, tokens_per_minute = rate_limits_from_secrets(st.secrets)
+        pool, files = create_session_pool(api_keys, model_names, TAXONOMY_PATH, backend, schema, codes,
+                                          requests_per_minute, tokens_per_minute, limiter=get_rate_limiter())
+        return {
+            'model': None,
+            'pool': pool,
+            'taxonomy_file': files[0],
+            'codes': codes,
+            'created_at': start_time,
+            'setup_seconds': time.time() - start_time,
+        }
+
+    # Create the model
+    model = create_model(schema=schema)
+
+    # Upload and process the categories file
+    files = [
+        upload_to_gemini("data/Classes.txt", mime_type="text/plain"),
+    ]
+
+    # Check if file upload was successful
+    if None in files:
+        raise Exception("Failed to upload required files")
+
+    # Wait for files to be processed
+    if not wait_for_files_active(files):
+        raise Exception("File processing failed")
+
+    return {
+        'model': model,
+        'pool': None,
+        'taxonomy_file': files[0],
+        'codes': codes,
+        'created_at': start_time,
+        'setup_seconds': time.time() - start_time,
+    }
+
 def initialize_gemini():
     """Initialize Gemini model with categories and types."""
+    start_time = time.time()
     try:
-        # Get API key from streamlit secrets
-        api_key = st.secrets["GEMINI_API_KEY"]
-        if not api_key:
+        backend = get_backend_name()
+        if backend != BACKEND_FAKE and not get_api_keys():
             st.error("API key not found in secrets. Please check your .streamlit/secrets.toml file.")
             return None
 
-        genai.configure(api_key=api_key)
+        taxonomy_hash = taxonomy_fingerprint(TAXONOMY_PATH)
+        schema = get_output_schema()
+        resources = get_gemini_resources(backend, taxonomy_hash, schema)
+        if file_expired(resources['taxonomy_file']):
+            get_gemini_resources.clear()
+            resources = get_gemini_resources(backend, taxonomy_hash, schema)
+        # Taxonomy codes the compact schema's answers are expanded with
+        st.session_state.output_codes = resources['codes']
 
-        # Create the model
-        generation_config = {
-            "temperature": 0,
-            "top_p": 0.95,
-            "top_k": 40,
-            "max_output_tokens": 8192,
-            "response_mime_type": "application/json",
+        # Time this session waited, and what reusing the shared upload saved
+        startup_seconds = time.time() - start_time
+        reused = resources['created_at'] < start_time
+        st.session_state.startup_timing = {
+            'seconds': startup_seconds,
+            'saved_seconds': max(0.0, resources['setup_seconds'] - startup_seconds) if reused else 0.0,
+            'reused': reused,
         }
+        print(f"Gemini ready in {startup_seconds:.2f}s ({'reused' if reused else 'uploaded'} categories file)")
 
-        model = genai.GenerativeModel(
-            model_name="gemini-2.0-flash-exp",
-            generation_config=generation_config,
-            system_instruction=(
-                "You MUST return responses in the following JSON array format EXACTLY:\n"
-                "[\n"
-                "    {\n"
-                '        "response": "the original response text",\n'
-                '        "classification": {\n'
-                '            "type": "one of: إيجابي, سلبي, محايد",\n'
-                '            "category": "main category",\n'
-                '            "subcategory": "subcategory",\n'
-                '            "explanation": "reasoning for the classification"\n'
-                "        }\n"
-                "    }\n"
-                "]\n\n"
-                "Rules:\n"
-                "1. The response MUST be a valid JSON array, even for single items\n"
-                "2. All classification fields MUST be in Arabic\n"
-                "3. The type field MUST be exactly one of: إيجابي, سلبي, محايد\n"
-                "4. Use 'خطأ' for category and subcategory if the response is invalid or unrelated\n"
-                "5. Each response MUST include all required fields\n"
-                "6. The JSON structure MUST match exactly as shown above\n"
-            )
-        )
-
-        if 'uploaded_files' not in st.session_state:
-            # Upload and process the categories file
-            files = [
-                upload_to_gemini("data/Classes.txt", mime_type="text/plain"),
-            ]
-
-            # Check if file upload was successful
-            if None in files:
-                raise Exception("Failed to upload required files")
-
-            # Wait for files to be processed
-            if not wait_for_files_active(files):
-                raise Exception("File processing failed")
-            
-
-        chat_session = model.start_chat(
-            history=[
-                {
-                    "role": "user",
-                    "parts": [
-                        "Please analyze and classify the following responses:",
-                        files[0],
-                    ],
-                },
-            ]
-        )
-        return chat_session
+        if resources['pool'] is not None:
+            return resources['pool']
+        # Stateless mode sends every batch as an independent request so the
+        # prompt does not grow with the history of previous batches
+        return create_session(resources['model'], resources['taxonomy_file'], CLASSIFICATION_MODE,
+                              codes=resources['codes'])
     except Exception as e:
         st.error(f"Failed to initialize Gemini: {e}")
         return None
 
-def read_csv_with_encoding(file):
-    """Read CSV file with multiple encoding attempts."""
-    encodings = ['utf-8', 'utf-8-sig', 'cp1256', 'iso-8859-6']
-    df = None
-    
-    for encoding in encodings:
-        try:
-            df = pd.read_csv(file, encoding=encoding)
-            if not df.empty and len(df.columns) > 0:
-                return df
-        except Exception:
-            continue
-    
-    return None
-
 def process_responses(file, file_type, column_name=None, separator=None):
     """Process uploaded file and extract responses."""
     try:
         # Clear preview data from other tabs
         st.session_state.preview_data = None
         
-        if file_type == 'txt':
-            content = file.getvalue().decode('utf-8')
-            responses = [r.strip() for r in content.split(separator) if r.strip()]
-        elif file_type == 'csv':
-            if st.session_state.current_df is None:
-                raise Exception("لم يتم تحميل الملف بشكل صحيح")
-            
-            df = st.session_state.current_df
-            responses = df[column_name].dropna().tolist()
-        elif file_type == 'excel':
-            df = pd.read_excel(file)
-            if df.empty or len(df.columns) == 0:
-                raise Exception("لم يتم العثور على أعمدة صالحة في الملف. تأكد من تنسيق ملف Excel")
-            responses = df[column_name].dropna().tolist()
+        with span("ingest", file_type=file_type) as attributes:
+            if file_type == 'txt':
+                content = file.getvalue().decode('utf-8')
+                responses = split_text_responses(content, separator)
+            elif file_type == 'csv':
+                if st.session_state.current_df is None:
+                    raise Exception("لم يتم تحميل الملف بشكل صحيح")
+                
+                df = st.session_state.current_df
+                responses = column_responses(df, column_name)
+            elif file_type == 'excel':
+                df = pd.read_excel(file)
+                if df.empty or len(df.columns) == 0:
+                    raise Exception("لم يتم العثور على أعمدة صالحة في الملف. تأكد من تنسيق ملف Excel")
+                responses = column_responses(df, column_name)
+            attributes['responses'] = len(responses)
         
         # Update preview data
         preview_df = pd.DataFrame({"الاستجابات": responses})
@@ -197,121 +283,191 @@ def process_responses(file, file_type, column_name=None, separator=None):
         st.error(f"حدث خطأ أثناء معالجة الملف: {str(e)}")
         return []
 
-def get_optimal_batch_size(total_items, responses=None):
-    """Calculate optimal batch size based on total items."""
-    # For very small datasets, process all at once
-    if total_items <= MIN_BATCH_SIZE:
-        return total_items
-    
-    # Use minimum batch size for consistency
-    return MIN_BATCH_SIZE
+def get_output_estimator():
+    """Per-response output token estimate of the configured answer schema."""
+    return estimate_compact_output_tokens if get_output_schema() == SCHEMA_COMPACT else estimate_output_tokens
+
+def plan_classification_batches(responses):
+    """Pack responses into batches that fit the configured token budgets."""
+    return plan_batches(
+        responses,
+        input_budget=BATCH_INPUT_TOKEN_BUDGET,
+        output_budget=BATCH_OUTPUT_TOKEN_BUDGET,
+        max_items=MAX_BATCH_SIZE,
+        estimate_output=get_output_estimator()
+    )
+
+@st.cache_data(max_entries=PREVIEW_CACHE_ENTRIES, show_spinner=False)
+def preview_local_responses(file_hash, column_name, taxonomy_hash, _responses):
+    """Unique responses of an uploaded file and the ones the lexicon classifies.
+
+    Computed once per file, column and taxonomy; ``_responses`` is left out
+    of the cache key since the file hash and column identify it.
+    """
+    unique_responses, _ = collapse_duplicates(_responses)
+    lexicon = get_lexicon_classifier(taxonomy_hash)
+    local = {
+        str(r) for r in unique_responses
+        if lexicon.classify(str(r))[1] >= LOCAL_CONFIDENCE_THRESHOLD
+    } if lexicon is not None else set()
+    return unique_responses, local
 
-def classify_responses_batch(responses_batch):
-    """Classify a batch of responses using Gemini."""
+def get_max_concurrent_batches():
+    """Number of batches sent to Gemini in parallel (overridable from secrets)."""
     try:
-        if not st.session_state.model:
-            raise Exception("Gemini model is not initialized")
-        
-        # Format the responses for processing
-        batch_text = "\n---\n".join([f"response_{i+1}: {str(r)}" for i, r in enumerate(responses_batch)])
-        
-        # Time the model response
-        start_time = time.perf_counter()
-        chat_response = st.session_state.model.send_message(batch_text)
-        end_time = time.perf_counter()
-        batch_time = end_time - start_time
-        
-        try:
-            # Sanitize the response text
-            response_text = chat_response.text.strip()
-            
-            # Basic validation of JSON structure
-            if not response_text:
-                raise ValueError("Empty response from model")
-                
-            if not (response_text.startswith('[') and response_text.endswith(']')):
-                # Try to wrap non-array response in array
-                if response_text.startswith('{') and response_text.endswith('}'):
-                    response_text = f"[{response_text}]"
-                else:
-                    raise ValueError("Invalid JSON structure: Response must be an array")
-            
-            # Parse and validate JSON response
-            classifications = json.loads(response_text)
-            
-            if not isinstance(classifications, list):
-                if isinstance(classifications, dict):
-                    classifications = [classifications]
-                else:
-                    raise ValueError("Invalid response format: expected list or object")
-            
-            # Validate each classification
-            validated_results = []
-            for classification in classifications:
-                if not isinstance(classification, dict):
-                    continue
-                    
-                if 'response' not in classification or 'classification' not in classification:
-                    continue
-                    
-                class_data = classification.get('classification', {})
-                if not isinstance(class_data, dict):
-                    continue
-                    
-                # Validate and normalize type values
-                type_value = class_data.get('type', '').strip()
-                if type_value in ['إيجابي', 'ايجابي', 'ايجابية', 'إيجابية']:
-                    normalized_type = 'إيجابي'
-                elif type_value in ['سلبي', 'سلبية']:
-                    normalized_type = 'سلبي'
-                elif type_value in ['محايد', 'محايدة']:
-                    normalized_type = 'محايد'
-                else:
-                    normalized_type = 'محايد'
-                
-                # Create validated result
-                result = {
-                    'response': str(classification.get('response', '')).strip(),
-                    'classification': {
-                        'type': normalized_type,
-                        'category': str(class_data.get('category', 'خطأ')).strip(),
-                        'subcategory': str(class_data.get('subcategory', 'خطأ')).strip(),
-                        'explanation': str(class_data.get('explanation', '')).strip()
-                    }
-                }
-                
-                if result['response']:
-                    validated_results.append(result)
-            
-            # Return both the classifications and the batch time
-            return validated_results, batch_time
-            
-        except json.JSONDecodeError as e:
-            st.error(f"فشل في تحليل استجابة النموذج: {str(e)}")
-            st.error(f"الاستجابة الأصلية: {response_text}")
-            # Try to recover partial results
-            try:
-                import re
-                pattern = r'\{[^{}]*\}'
-                matches = re.finditer(pattern, response_text)
-                partial_results = []
-                for match in matches:
-                    try:
-                        obj = json.loads(match.group())
-                        if isinstance(obj, dict) and 'response' in obj and 'classification' in obj:
-                            partial_results.append(obj)
-                    except:
-                        continue
-                if partial_results:
-                    st.warning("تم استرداد بعض النتائج الجزئية")
-                    return partial_results, batch_time
-            except:
-                pass
-            return [], batch_time
-            
+        return max(1, int(st.secrets.get("MAX_CONCURRENT_BATCHES", MAX_CONCURRENT_BATCHES)))
+    except Exception:
+        return MAX_CONCURRENT_BATCHES
+
+def get_hedger():
+    """Hedger for one job, learning from the process-wide call latencies, or None when disabled in secrets."""
+    try:
+        if not st.secrets.get("HEDGING", True):
+            return None
+    except Exception:
+        pass
+    return Hedger(get_shared_latencies(), HEDGE_PERCENTILE)
+
+def format_circuit_status(status):
+    """Arabic explanation of an open circuit breaker."""
+    return (
+        f"تم إيقاف الطلبات إلى Gemini مؤقتاً بعد {status['consecutive_failures']} أخطاء متتالية. "
+        f"ستُعاد المحاولة بعد {format_duration(status['retry_in'])}. آخر خطأ: {status['last_error']}"
+    )
+
+@st.cache_resource
+def get_classification_cache(taxonomy_hash):
+    """Open the on-disk classification cache, reopened whenever the taxonomy file changes."""
+    try:
+        return ClassificationCache(
+            CACHE_PATH,
+            cache_model_name(get_model_names()[0], get_backend_name(), get_output_schema()),
+            taxonomy_hash,
+            max_entries=CACHE_MAX_ENTRIES
+        )
+    except Exception as e:
+        print(f"Classification cache disabled: {e}")
+        return None
+
+@st.cache_resource
+def get_lexicon_classifier(taxonomy_hash):
+    """Local lexicon pre-classifier, rebuilt whenever the taxonomy file changes."""
+    try:
+        return LexiconClassifier.from_file(TAXONOMY_PATH)
+    except Exception as e:
+        print(f"Local pre-classifier disabled: {e}")
+        return None
+
+@st.cache_resource
+def get_taxonomy_index_for(taxonomy_hash):
+    """Index validating model labels, rebuilt whenever the taxonomy file changes."""
+    try:
+        return TaxonomyIndex.from_file(TAXONOMY_PATH)
+    except Exception as e:
+        print(f"Label validation disabled: {e}")
+        return None
+
+def get_taxonomy_index():
+    """Label index for the current taxonomy."""
+    return get_taxonomy_index_for(taxonomy_fingerprint(TAXONOMY_PATH))
+
+def get_local_classifier():
+    """Lexicon for the current taxonomy, or None when disabled in secrets."""
+    try:
+        if not st.secrets.get("LOCAL_PRECLASSIFIER", True):
+            return None
+    except Exception:
+        pass
+    return get_lexicon_classifier(taxonomy_fingerprint(TAXONOMY_PATH))
+
+@st.cache_resource
+def get_label_store(taxonomy_hash, backend):
+    """Open the on-disk store of Gemini labels for one taxonomy and backend."""
+    try:
+        return LabelStore(
+            LABELS_PATH,
+            cache_model_name(get_model_names()[0], backend),
+            taxonomy_hash
+        )
     except Exception as e:
-        st.error(f"خطأ في التصنيف: {str(e)}")
-        return [], 0
+        print(f"Label store disabled: {e}")
+        return None
+
+@st.cache_resource(max_entries=1, show_spinner="جاري تدريب النموذج المحلي...")
+def train_cached_local_model(taxonomy_hash, backend, generation):
+    """Local model trained on the stored labels; retrained when ``generation`` changes."""
+    start_time = time.time()
+    model = train_local_model(get_label_store(taxonomy_hash, backend).load(limit=MAX_TRAINING_LABELS))
+    if model is not None:
+        print(f"Local model trained on {model.num_labels} labels in {time.time() - start_time:.1f}s")
+    return model
+
+def get_local_model():
+    """Current local model, or None until enough labels have accumulated."""
+    taxonomy_hash, backend = taxonomy_fingerprint(TAXONOMY_PATH), get_backend_name()
+    label_store = get_label_store(taxonomy_hash, backend)
+    try:
+        if label_store is None or not st.secrets.get("LOCAL_MODEL", True):
+            return None
+    except Exception:
+        pass
+    try:
+        generation = label_store.count() // LOCAL_MODEL_RETRAIN_INTERVAL
+        return train_cached_local_model(taxonomy_hash, backend, generation)
+    except Exception as e:
+        print(f"Local model disabled: {e}")
+        return None
+
+@st.cache_resource
+def get_job_store():
+    """Open the on-disk store of classification jobs shared by all sessions."""
+    return JobStore(JOBS_PATH)
+
+@st.cache_resource
+def get_job_runner():
+    """Background job runner shared by all sessions; outlives script reruns."""
+    return JobRunner(MAX_BACKGROUND_JOBS)
+
+def format_duration(seconds):
+    """Format a duration in seconds as a short Arabic string."""
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return f"{seconds} ثانية"
+    return f"{seconds // 60} دقيقة و {seconds % 60} ثانية"
+
+def render_progress(container, completed, total, type_counts, eta_seconds=None):
+    """Render the processing indicator with real progress, live counters and ETA."""
+    # No total yet while the responses left for Gemini are being planned
+    percent = (completed / total) * 100 if total else 0
+    eta_text = f"الوقت المتبقي المتوقع: {format_duration(eta_seconds)}" if eta_seconds is not None else "جاري حساب الوقت المتبقي..."
+    container.markdown(f"""
+        <div class="processing-container">
+            <div class="loader">
+                <div class="loader-ring loader-ring-1"></div>
+                <div class="loader-ring loader-ring-2"></div>
+                <div class="loader-ring loader-ring-3"></div>
+            </div>
+            <div class="processing-text">جاري معالجة الاستجابات... ({completed}/{total} دفعة)</div>
+            <div class="processing-progress">
+                <div class="progress-bar determinate" style="width: {percent:.0f}% !important"></div>
+            </div>
+            <div class="progress-message">{eta_text}</div>
+            <div class="summary-stats live-stats">
+                <div class="stat-card positive-stat">
+                    <div class="stat-number">{type_counts.get('إيجابي', 0)}</div>
+                    <div class="stat-label">تجربة إيجابية</div>
+                </div>
+                <div class="stat-card negative-stat">
+                    <div class="stat-number">{type_counts.get('سلبي', 0)}</div>
+                    <div class="stat-label">تجربة سلبية</div>
+                </div>
+                <div class="stat-card neutral-stat">
+                    <div class="stat-number">{type_counts.get('محايد', 0)}</div>
+                    <div class="stat-label">تجربة محايدة</div>
+                </div>
+            </div>
+        </div>
+    """, unsafe_allow_html=True)
 
 def display_experience(result, experience_type):
     """Enhanced display function for experiences"""
@@ -342,6 +498,277 @@ def display_experience(result, experience_type):
     except Exception as e:
         st.error(f"خطأ في عرض التجربة: {str(e)}")
 
+def start_classification(responses, job_id=None, source_name=""):
+    """Submit responses as a checkpointed background job owned by this session.
+
+    A new job is created unless ``job_id`` names an interrupted one to resume.
+    Returns True once the job is submitted.
+    """
+    if not st.session_state.model:
+        st.markdown("""
+            <div class="toast error">
+                لم يتم تهيئة نموذج Gemini بشكل صحيح. يرجى التحقق من مفتاح API
+            </div>
+        """, unsafe_allow_html=True)
+        return False
+
+    # Fail fast while Gemini keeps failing instead of queueing a doomed job
+    circuit = get_shared_breaker().status()
+    if circuit['state'] == CIRCUIT_OPEN:
+        st.markdown(f"""
+            <div class="toast error">
+                {format_circuit_status(circuit)}
+            </div>
+        """, unsafe_allow_html=True)
+        return False
+
+    try:
+        # Every completed batch is checkpointed so an interrupted job can resume
+        job_store = get_job_store()
+        unique_responses, _ = collapse_duplicates(responses)
+        if job_id is None:
+            job_id = job_store.create_job(responses, source_name, total=len(unique_responses))
+
+        session = st.session_state.model
+        limiter = get_rate_limiter()
+        # Tokens and cost of every call this job makes
+        usage = UsageTracker()
+        # Batches slower than the recent p95 are re-issued and the first answer wins
+        hedger = get_hedger()
+        classify_fn = make_batch_classifier(session, make_session_factory(session), limiter,
+                                            st.session_state.get('output_codes'), usage, get_shared_breaker(),
+                                            get_taxonomy_index())
+        # Duplicates are collapsed first, responses already checkpointed by
+        # this job are restored, obvious ones are classified by the lexicon
+        # and confident ones by the local model, cache hits skip Gemini and
+        # only the remaining misses are batched, all in the runner's worker
+        # thread. Gemini's labels are stored to retrain the local model.
+        get_job_runner().submit(
+            job_id,
+            responses,
+            hedger.wrap(classify_fn) if hedger is not None else classify_fn,
+            job_store=job_store,
+            limiter=limiter,
+            usage=usage,
+            hedger=hedger,
+            max_workers=get_max_concurrent_batches(),
+            cache=get_classification_cache(taxonomy_fingerprint(TAXONOMY_PATH)),
+            lexicon=get_local_classifier(),
+            local_threshold=LOCAL_CONFIDENCE_THRESHOLD,
+            local_model=get_local_model(),
+            local_model_threshold=LOCAL_MODEL_THRESHOLD,
+            label_store=get_label_store(taxonomy_fingerprint(TAXONOMY_PATH), get_backend_name()),
+            planner=plan_classification_batches
+        )
+        st.session_state.active_job_id = job_id
+        st.session_state.active_job_calls_saved = (
+            len(plan_classification_batches(responses)) - len(plan_classification_batches(unique_responses))
+        )
+        st.session_state.results = []
+        st.session_state.debug_sample = None
+        return True
+    except Exception as e:
+        st.markdown(f"""
+            <div class="toast error">
+                حدث خطأ أثناء التصنيف: {str(e)}
+            </div>
+        """, unsafe_allow_html=True)
+        return False
+
+def show_debug_sample(job):
+    """Show the parsed JSON of a sampled batch of the running job.
+
+    A newly finished batch is kept as the sample with probability
+    ``DEBUG_SAMPLE_RATE``, so debug mode renders a few batches instead of
+    every one.
+    """
+    completed = job['completed_batches']
+    if completed != st.session_state.get('debug_seen_batches'):
+        st.session_state.debug_seen_batches = completed
+        if job['last_classifications'] and random.random() < DEBUG_SAMPLE_RATE:
+            st.session_state.debug_sample = (completed, job['last_classifications'])
+
+    sample = st.session_state.get('debug_sample')
+    if sample:
+        with st.expander(f"Debug: Parsed JSON (batch {sample[0]})"):
+            st.json(sample[1])
+
+def show_admin_panel():
+    """Sidebar summary of the trace file and the debug mode switch, if enabled in secrets."""
+    try:
+        if not st.secrets.get("ADMIN_PANEL", False):
+            return
+    except Exception:
+        return
+
+    with st.sidebar.expander("لوحة المراقبة"):
+        st.checkbox("وضع التصحيح", key="debug_mode",
+                    help=f"عرض JSON لعينة من الدفعات ({DEBUG_SAMPLE_RATE:.0%})")
+        circuit = get_shared_breaker().status()
+        latency = get_shared_latencies().summary()
+        st.caption(
+            f"حالة الاتصال بـ Gemini: {circuit['state']} "
+            f"(أخطاء متتالية: {circuit['consecutive_failures']}، مرات الإيقاف: {circuit['trips']}، "
+            f"طلبات مرفوضة: {circuit['rejected']})"
+        )
+        if latency['count']:
+            st.caption(
+                f"زمن آخر {latency['count']} طلب: p50 {latency['p50']:.1f} ث، "
+                f"p95 {latency['p95']:.1f} ث، p99 {latency['p99']:.1f} ث"
+            )
+        pool = st.session_state.get('model')
+        if isinstance(pool, RequestPool):
+            st.caption("توزيع الطلبات على المفاتيح والنماذج")
+            st.dataframe(
+                pd.DataFrame(pool.status()).rename(columns={
+                    'member': 'المفتاح / النموذج',
+                    'model': 'النموذج',
+                    'calls': 'الطلبات',
+                    'in_flight': 'قيد التنفيذ',
+                    'latency': 'الزمن (ث)',
+                    'errors': 'الأخطاء',
+                    'quota_errors': 'أخطاء الحصة',
+                    'sidelined_seconds': 'مستبعد لمدة (ث)',
+                }).round(1),
+                hide_index=True,
+                use_container_width=True
+            )
+        rows = summarize_spans(read_trace(TRACE_PATH, since=time.time() - TRACE_SUMMARY_WINDOW))
+        if not rows:
+            st.caption("لا توجد قياسات مسجلة بعد")
+            return
+        st.caption(f"زمن كل مرحلة خلال آخر {TRACE_SUMMARY_WINDOW // 3600} ساعة (بالملي ثانية)")
+        st.dataframe(
+            pd.DataFrame(rows).rename(columns={
+                'name': 'المرحلة',
+                'count': 'العدد',
+                'total_seconds': 'الإجمالي (ث)',
+                'mean_ms': 'المتوسط',
+                'p50_ms': 'p50',
+                'p95_ms': 'p95',
+                'p99_ms': 'p99',
+                'max_ms': 'الأقصى',
+                'errors': 'الأخطاء',
+            }).round(1),
+            hide_index=True,
+            use_container_width=True
+        )
+
+@st.fragment(run_every=JOB_POLL_INTERVAL)
+def show_job_progress(job_id):
+    """Live progress of a running job; only this panel reruns while it polls."""
+    job = get_job_runner().status(job_id, preview_limit=LIVE_PREVIEW_LIMIT)
+    if job is None or job['status'] not in (STATUS_QUEUED, STATUS_RUNNING):
+        # Rerun the whole page so the job is collected and its results shown
+        st.rerun()
+
+    if job['status'] == STATUS_QUEUED:
+        st.info("المهمة في قائمة الانتظار، ستبدأ عند انتهاء المهام الجارية")
+    render_progress(st.empty(), job['completed_batches'], job['total_batches'],
+                    job['type_counts'], job['eta_seconds'])
+    with span("render_cards", cards=len(job['preview'])):
+        for result in job['preview'][::-1]:
+            experience_type = "positive" if result['classification'].get('type') == 'إيجابي' else "negative"
+            display_experience(result, experience_type)
+
+    if st.session_state.get('debug_mode'):
+        show_debug_sample(job)
+
+def show_active_job():
+    """Render this session's background job and collect it once it is done.
+
+    Returns True while the job is still queued or running; its progress
+    panel then polls on its own without rerunning the page.
+    """
+    job_id = st.session_state.get('active_job_id')
+    if not job_id:
+        return False
+
+    runner = get_job_runner()
+    job = runner.status(job_id, preview_limit=0)
+    if job is None:
+        # The server restarted; the job is offered for resume instead
+        st.session_state.active_job_id = None
+        return False
+
+    if job['status'] in (STATUS_QUEUED, STATUS_RUNNING):
+        show_job_progress(job_id)
+        return True
+
+    st.session_state.active_job_id = None
+    runner.forget(job_id)
+    if job['status'] == STATUS_FAILED:
+        st.markdown(f"""
+            <div class="toast error">
+                حدث خطأ أثناء التصنيف: {job['error']}
+            </div>
+        """, unsafe_allow_html=True)
+        return False
+
+    results, run_stats = job['results'], job['stats']
+    # Batches failed fast by the circuit breaker all carry the same message
+    for error in dict.fromkeys(run_stats['errors']):
+        st.error(f"خطأ في التصنيف: {error}")
+
+    # Calculate timing statistics
+    total_time = job['elapsed']
+    avg_batch_time = run_stats['avg_batch_time']
+    throughput = job['num_responses'] / total_time if total_time > 0 else 0
+    cache_hits = run_stats['cache_hits']
+    # Only responses left after resume and the local classifiers are looked up in the cache
+    cache_lookups = cache_hits + run_stats['cache_misses']
+    cache_hit_rate = (cache_hits / cache_lookups) * 100 if cache_lookups else 0
+    local_responses = run_stats['local_responses']
+    local_rate = (local_responses / run_stats['unique_responses']) * 100 if run_stats['unique_responses'] else 0
+    local_model_responses = run_stats['local_model_responses']
+    local_model_rate = (
+        (local_model_responses / run_stats['unique_responses']) * 100 if run_stats['unique_responses'] else 0
+    )
+    throttling = run_stats['throttling']
+    duplicates_collapsed = run_stats['duplicates_collapsed']
+    calls_saved = st.session_state.get('active_job_calls_saved', 0)
+    usage = run_stats['usage']
+    truncated_calls = usage['finish_reasons'].get('MAX_TOKENS', 0)
+    latency = run_stats['batch_latency']
+    hedging = run_stats.get('hedging', {'hedged': 0, 'hedge_wins': 0})
+    circuit = get_shared_breaker().status()
+
+    # Per-user totals cover every job of this session; the export gets this job's calls
+    st.session_state.user_usage.extend(run_stats['usage_records'])
+    st.session_state.last_usage_records = run_stats['usage_records']
+
+    # Store results in session state for persistence
+    st.session_state.classification_results = results
+    st.session_state.results = results
+
+    # Show success message with timing info
+    st.markdown(f"""
+        <div class="toast success">
+            تم تصنيف الاستجابات بنجاح!<br>
+            الوقت الإجمالي: {total_time:.2f} ثانية<br>
+            متوسط وقت المعالجة لكل دفعة: {avg_batch_time:.2f} ثانية
+            (p50: {latency['p50']:.1f}، p95: {latency['p95']:.1f}، p99: {latency['p99']:.1f} ثانية)<br>
+            دفعات أعيد إرسالها لبطئها: {hedging['hedged']} (وصل الطلب المكرر أولاً: {hedging['hedge_wins']})<br>
+            معدل المعالجة: {throughput:.1f} استجابة/ثانية<br>
+            صُنفت محلياً دون النموذج: {local_responses} ({local_rate:.1f}%)<br>
+            صنفها النموذج المحلي المدرب: {local_model_responses} ({local_model_rate:.1f}%)<br>
+            من الذاكرة المؤقتة: {cache_hits} ({cache_hit_rate:.1f}%)<br>
+            مستعادة من مهمة سابقة: {run_stats['resumed_responses']}<br>
+            الاستجابات المكررة: {duplicates_collapsed} (تم توفير {calls_saved} طلب)<br>
+            الرموز المستهلكة: {usage['prompt_tokens']:,} إدخال و{usage['output_tokens']:,} إخراج
+            في {usage['calls']} طلب (توقف عند حد الرموز: {truncated_calls})<br>
+            التكلفة التقديرية: ${usage['cost']:.4f} (${usage['cost_per_item'] * 1000:.4f} لكل 1000 استجابة)<br>
+            وقت الانتظار بسبب حدود الاستخدام: {throttling['throttled_seconds'] + throttling['backoff_seconds']:.1f} ثانية
+            (إعادة المحاولة: {throttling['retries']})<br>
+            استجابات تعذر تصنيفها: {len(run_stats['failed_responses'])}
+            (طلبات إضافية للاسترداد: {run_stats['recovery_calls']}،
+            لاستكمال النتائج الناقصة: {run_stats['gap_fill_calls']})
+        </div>
+    """, unsafe_allow_html=True)
+    if circuit['state'] == CIRCUIT_OPEN:
+        st.warning(format_circuit_status(circuit))
+    return False
+
 # Initialize session state variables
 if 'preview_data' not in st.session_state:
     st.session_state.preview_data = None
@@ -355,10 +782,24 @@ if 'results' not in st.session_state:
     st.session_state.results = []
 if 'previous_file_type' not in st.session_state:
     st.session_state.previous_file_type = None
+if 'user_usage' not in st.session_state:
+    st.session_state.user_usage = UsageTracker()
 
-# Initialize Gemini at startup if not already initialized
-if st.session_state.model is None:
+# Initialize Gemini at startup if not already initialized, and again
+# after the categories are edited so the session uses the new file
+taxonomy_hash = taxonomy_fingerprint(TAXONOMY_PATH)
+if st.session_state.model is None or st.session_state.get('model_taxonomy_hash') != taxonomy_hash:
     st.session_state.model = initialize_gemini()
+    st.session_state.model_taxonomy_hash = taxonomy_hash
+
+startup_timing = st.session_state.get('startup_timing')
+if startup_timing:
+    st.sidebar.metric(
+        "زمن تهيئة النموذج",
+        f"{startup_timing['seconds']:.2f} ثانية",
+        delta=f"تم توفير {startup_timing['saved_seconds']:.1f} ثانية" if startup_timing['reused'] else None,
+        delta_color="off"
+    )
 
 st.markdown("""
     <div class="header-container">
@@ -370,6 +811,53 @@ st.markdown("""
     </div>
 """, unsafe_allow_html=True)
 
+# Progress of this session's background job, if any
+job_running = show_active_job()
+
+# Tokens and estimated cost of every Gemini call made in this session
+user_usage = st.session_state.user_usage.summary()
+if user_usage['calls']:
+    st.sidebar.metric(
+        "التكلفة التقديرية لهذه الجلسة",
+        f"${user_usage['cost']:.4f}",
+        delta=f"{user_usage['total_tokens']:,} رمز في {user_usage['calls']} طلب",
+        delta_color="off"
+    )
+
+show_admin_panel()
+
+circuit_status = get_shared_breaker().status()
+if circuit_status['state'] == CIRCUIT_OPEN:
+    st.sidebar.error(format_circuit_status(circuit_status))
+
+# Offer to resume jobs that were interrupted before finishing
+unfinished_jobs = [
+    job for job in get_job_store().unfinished_jobs()
+    if not get_job_runner().is_active(job['job_id'])
+]
+if unfinished_jobs:
+    with st.expander(f"مهام تصنيف غير مكتملة ({len(unfinished_jobs)})", expanded=True):
+        for job in unfinished_jobs:
+            job_col1, job_col2, job_col3 = st.columns([3, 1, 1])
+            with job_col1:
+                started = time.strftime('%Y-%m-%d %H:%M', time.localtime(job['created_at']))
+                st.markdown(
+                    f"**{job['name'] or job['job_id']}** — {started}<br>"
+                    f"تم تصنيف {job['completed']} من {job['total']} استجابة",
+                    unsafe_allow_html=True
+                )
+            with job_col2:
+                resume_clicked = st.button("استئناف", key=f"resume_{job['job_id']}", use_container_width=True,
+                                           disabled=job_running)
+            with job_col3:
+                if st.button("حذف", key=f"delete_{job['job_id']}", use_container_width=True):
+                    get_job_store().delete_job(job['job_id'])
+                    st.rerun()
+            if resume_clicked and start_classification(
+                get_job_store().load_responses(job['job_id']), job_id=job['job_id']
+            ):
+                st.rerun()
+
 # Replace tabs with select box for file type
 file_type = st.selectbox(
     "اختر نوع الملف",
@@ -384,6 +872,9 @@ if st.session_state.previous_file_type != file_type:
     st.session_state.previous_file_type = file_type
 
 responses = []
+source_name = ""
+uploaded_file = None
+column_name = None
 if file_type == "ملف نصي":
     st.markdown("""
         <style>
@@ -463,12 +954,17 @@ if file_type == "ملف نصي":
     
     txt_file = st.file_uploader("تحميل ملف نصي", type=['txt'], key="txt_uploader")
     if txt_file:
+        uploaded_file = txt_file
+        source_name = txt_file.name
         responses = process_responses(txt_file, 'txt', separator="\n")
 
 elif file_type == "ملف CSV":
     csv_file = st.file_uploader("تحميل ملف CSV", type=['csv'], key="csv_uploader")
     if csv_file:
-        df = read_csv_with_encoding(csv_file)
+        uploaded_file = csv_file
+        source_name = csv_file.name
+        with span("ingest_read", file_type='csv'):
+            df = read_csv_with_encoding(csv_file)
         if df is not None:
             st.session_state.current_df = df
             columns = df.columns.tolist()
@@ -481,7 +977,10 @@ elif file_type == "ملف CSV":
 else:  # Excel file
     excel_file = st.file_uploader("تحميل ملف Excel", type=['xlsx'], key="excel_uploader")
     if excel_file:
-        df = pd.read_excel(excel_file)
+        uploaded_file = excel_file
+        source_name = excel_file.name
+        with span("ingest_read", file_type='excel'):
+            df = pd.read_excel(excel_file)
         columns = df.columns.tolist()
         column_name = st.selectbox("حدد العمود الذي يحتوي على استجابات الطلاب:", columns, key="excel_column")
         if column_name:
@@ -676,113 +1175,33 @@ if st.session_state.preview_data is not None:
     
     st.markdown('</div></div>', unsafe_allow_html=True)
 
+    # Show the batch plan before the run starts
+    if responses:
+        # Dedup and lexicon scoring run once per file; reruns reuse them
+        unique_responses, local = preview_local_responses(
+            hashlib.sha256(uploaded_file.getvalue()).hexdigest(), column_name, taxonomy_hash, responses
+        )
+        if get_local_classifier() is None:
+            local = set()
+        cache = get_classification_cache(taxonomy_hash)
+        cached = cache.contains_many([str(r) for r in unique_responses]) if cache is not None else set()
+        planned = summarize_plan(plan_classification_batches(unique_responses), get_output_estimator())
+        expected = summarize_plan(plan_classification_batches(
+            [r for r in unique_responses if str(r) not in cached and str(r) not in local]
+        ), get_output_estimator())
+        local_share = len(local) / len(unique_responses) * 100 if unique_responses else 0
+        st.caption(
+            f"عدد الدفعات المخططة: {planned['num_batches']} "
+            f"(متوسط {planned['avg_batch_size']:.0f} استجابة لكل دفعة) | "
+            f"عدد الطلبات المتوقعة: {expected['num_batches']} | "
+            f"تُصنف محلياً: {len(local)} ({local_share:.1f}%)"
+        )
+
     col1, col2, col3 = st.columns([1,2,1])
     with col2:
-        if st.button("تصنيف الاستجابات", key="classify_button"):
-            if not st.session_state.model:
-                st.markdown("""
-                    <div class="toast error">
-                        لم يتم تهيئة نموذج Gemini بشكل صحيح. يرجى التحقق من مفتاح API
-                    </div>
-                """, unsafe_allow_html=True)
-            else:
-                processing_container = st.empty()
-                processing_container.markdown("""
-                    <div class="processing-container">
-                        <div class="loader">
-                            <div class="loader-ring loader-ring-1"></div>
-                            <div class="loader-ring loader-ring-2"></div>
-                            <div class="loader-ring loader-ring-3"></div>
-                        </div>
-                        <div class="processing-text">جاري معالجة الاستجابات...</div>
-                        <div class="processing-progress">
-                            <div class="progress-bar"></div>
-                        </div>
-                    </div>
-                """, unsafe_allow_html=True)
-                
-                results = []
-                
-                try:
-                    # Use a fixed batch size
-                    batch_size = MIN_BATCH_SIZE
-                    total_batches = (len(responses) + batch_size - 1) // batch_size
-                    
-                    # Initialize timing variables
-                    total_start_time = time.perf_counter()
-                    batch_times = []
-                    
-                    # Process responses in batches
-                    i = 0
-                    while i < len(responses):
-                        # Get current batch
-                        end_idx = min(i + batch_size, len(responses))
-                        batch = responses[i:end_idx]
-                        
-                        try:
-                            classifications, batch_time = classify_responses_batch(batch)
-                            batch_times.append(batch_time)
-                            
-                            # Show parsed JSON in expander
-                            with st.expander("Debug: Parsed JSON"):
-                                st.json(classifications)
-                            
-                            # Process results
-                            for response, classification in zip(batch, classifications):
-                                if classification and isinstance(classification, dict):
-                                    # Get the classification directly - it's not nested
-                                    result = {
-                                        "response": response,
-                                        "classification": classification.get('classification', {})
-                                    }
-                                    results.append(result)
-                                
-                            i += len(batch)  # Move to next batch
-                            
-                        except Exception as e:
-                            # If batch fails, try processing one by one
-                            for response in batch:
-                                try:
-                                    single_classifications, single_time = classify_responses_batch([response])
-                                    batch_times.append(single_time)
-                                    if single_classifications and isinstance(single_classifications[0], dict):
-                                        result = {
-                                            "response": response,
-                                            "classification": single_classifications[0].get('classification', {})
-                                        }
-                                        results.append(result)
-                                except Exception as e:
-                                    st.error(f"Error processing single response: {str(e)}")
-                                    continue
-                            i += len(batch)
-                    
-                    # Calculate timing statistics
-                    total_time = time.perf_counter() - total_start_time
-                    avg_batch_time = sum(batch_times) / len(batch_times) if batch_times else 0
-                    
-                    # Clear processing indicator
-                    processing_container.empty()
-                    
-                    # Store results in session state for persistence
-                    st.session_state.classification_results = results
-                    st.session_state.results = results
-                    
-                    # Show success message with timing info
-                    st.markdown(f"""
-                        <div class="toast success">
-                            تم تصنيف الاستجابات بنجاح!<br>
-                            الوقت الإجمالي: {total_time:.2f} ثانية<br>
-                            متوسط وقت المعالجة لكل دفعة: {avg_batch_time:.2f} ثانية
-                        </div>
-                    """, unsafe_allow_html=True)
-                    
-                except Exception as e:
-                    processing_container.empty()
-                    st.markdown(f"""
-                        <div class="toast error">
-                            حدث خطأ أثناء التصنيف: {str(e)}
-                        </div>
-                    """, unsafe_allow_html=True)
+        if st.button("تصنيف الاستجابات", key="classify_button", disabled=job_running):
+            if start_classification(responses, source_name=source_name):
+                st.rerun()
 
 # After classification is complete, display results
 if st.session_state.get('results'):
@@ -797,173 +1216,16 @@ if st.session_state.get('results'):
     output = io.BytesIO()
     excel_created = False
     
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        try:
-            # Create properly structured data for DataFrame
-            df_data = []
-            for result in st.session_state.results:
-                if isinstance(result, dict):
-                    classification = result.get('classification', {})
-                    df_data.append({
-                        'الاستجابة': result.get('response', ''),
-                        'التصنيف': classification.get('category', ''),
-                        'التصنيف الفرعي': classification.get('subcategory', ''),
-                        'النوع': classification.get('type', ''),
-                        'التفسير': classification.get('explanation', '')
-                    })
-            
-            # Create DataFrame from structured data
-            all_results_df = pd.DataFrame(df_data)
-            
-            if not all_results_df.empty:
-                # Create summary sheet
-                total_responses = len(all_results_df)
-                
-                if total_responses > 0:
-                    positive_count = len(all_results_df[all_results_df['النوع'] == 'إيجابي'])
-                    negative_count = len(all_results_df[all_results_df['النوع'] == 'سلبي'])
-                    neutral_count = len(all_results_df[all_results_df['النوع'] == 'محايد'])
-                    
-                    summary_data = {
-                        'المقياس': ['إجمالي الاستجابات', 'التجارب الإيجابية', 'التجارب السلبية', 'التجارب المحايدة',
-                                  'نسبة التجارب الإيجابية', 'نسبة التجارب السلبية', 'نسبة التجارب المحايدة'],
-                        'القيمة': [
-                            total_responses, 
-                            positive_count, 
-                            negative_count, 
-                            neutral_count,
-                            f'{(positive_count/total_responses)*100:.1f}%' if total_responses > 0 else '0%',
-                            f'{(negative_count/total_responses)*100:.1f}%' if total_responses > 0 else '0%',
-                            f'{(neutral_count/total_responses)*100:.1f}%' if total_responses > 0 else '0%'
-                        ]
-                    }
-                    summary_df = pd.DataFrame(summary_data)
-                    
-                    # Category distribution
-                    category_dist = all_results_df['التصنيف'].value_counts().reset_index()
-                    category_dist.columns = ['التصنيف', 'العدد']
-                    category_dist['النسبة'] = (category_dist['العدد'] / total_responses * 100).round(1).astype(str) + '%'
-                    
-                    # Write sheets
-                    summary_df.to_excel(writer, sheet_name='ملخص التحليل', index=False, startrow=1)
-                    category_dist.to_excel(writer, sheet_name='ملخص التحليل', index=False, startrow=9)
-                    
-                    # Sort all results by type and write to sheet
-                    type_order = ['إيجابي', 'سلبي', 'محايد', 'خطأ']
-                    all_results_df['type_order'] = pd.Categorical(all_results_df['النوع'], categories=type_order, ordered=True)
-                    all_results_df = all_results_df.sort_values('type_order')
-                    all_results_df = all_results_df.drop('type_order', axis=1)
-                    all_results_df.to_excel(writer, sheet_name='جميع النتائج', index=False)
-                    
-                    # Write type-specific sheets
-                    for df, sheet_name in [
-                        (all_results_df[all_results_df['النوع'] == 'إيجابي'], 'التجارب الإيجابية'),
-                        (all_results_df[all_results_df['النوع'] == 'سلبي'], 'التجارب السلبية'),
-                        (all_results_df[all_results_df['النوع'] == 'محايد'], 'التجارب المحايدة'),
-                        (all_results_df[all_results_df['النوع'] == 'خطأ'], 'الاستجابات غير المرتبطة')
-                    ]:
-                        if not df.empty:
-                            df.to_excel(writer, sheet_name=sheet_name, index=False)
-
-                    # Apply styling and create charts
-                    workbook = writer.book
-                    
-                    # Create color fills for different sentiments
-                    positive_fill = PatternFill(start_color='C6EFCE', end_color='C6EFCE', fill_type='solid')  # Light green
-                    negative_fill = PatternFill(start_color='FFC7CE', end_color='FFC7CE', fill_type='solid')  # Light red
-                    neutral_fill = PatternFill(start_color='F2F2F2', end_color='F2F2F2', fill_type='solid')   # Light gray
-                    header_fill = PatternFill(start_color='4472C4', end_color='4472C4', fill_type='solid')    # Blue header
-                    
-                    # Create charts sheet
-                    charts_sheet = workbook.create_sheet('الرسوم البيانية')
-                    
-                    # Create pie chart for sentiment distribution
-                    pie = PieChart()
-                    labels = Reference(workbook['ملخص التحليل'], min_row=2, max_row=4, min_col=1)
-                    data = Reference(workbook['ملخص التحليل'], min_row=2, max_row=4, min_col=2)
-                    pie.add_data(data)
-                    pie.set_categories(labels)
-                    pie.title = "توزيع التجارب"
-                    charts_sheet.add_chart(pie, "A1")
-                    
-                    # Create bar chart for top categories
-                    bar = BarChart()
-                    cat_labels = Reference(workbook['ملخص التحليل'], min_row=10, max_row=10+len(category_dist), min_col=1)
-                    cat_data = Reference(workbook['ملخص التحليل'], min_row=10, max_row=10+len(category_dist), min_col=2)
-                    bar.add_data(cat_data)
-                    bar.set_categories(cat_labels)
-                    bar.title = "توزيع التصنيفات"
-                    charts_sheet.add_chart(bar, "A15")
-                    
-                    # Apply styling to all sheets
-                    for sheet_name in workbook.sheetnames:
-                        ws = workbook[sheet_name]
-                        
-                        # Set RTL
-                        ws.sheet_view.rightToLeft = True
-                        
-                        # Style headers
-                        for cell in ws[1]:
-                            if cell.value:
-                                cell.fill = header_fill
-                                cell.font = Font(bold=True, color="FFFFFF")  # White text
-                                cell.alignment = openpyxl.styles.Alignment(horizontal='right', 
-                                                                         vertical='center',
-                                                                         wrap_text=True)
-                        
-                        # Auto-fit columns and apply text wrapping
-                        for column in ws.columns:
-                            max_length = 0
-                            column = list(column)
-                            for cell in column:
-                                try:
-                                    if len(str(cell.value)) > max_length:
-                                        max_length = len(str(cell.value))
-                                except:
-                                    pass
-                            adjusted_width = min(max_length + 2, 50)  # Cap width at 50
-                            ws.column_dimensions[column[0].column_letter].width = adjusted_width
-                            
-                            # Apply text wrapping and alignment to all cells
-                            for cell in column:
-                                if cell.value:
-                                    cell.alignment = openpyxl.styles.Alignment(horizontal='right', 
-                                                                             vertical='center',
-                                                                             wrap_text=True)
-                        
-                        # Apply sentiment colors to data sheets
-                        if sheet_name in ['جميع النتائج', 'التجارب الإيجابية', 'التجارب السلبية', 'التجارب المحايدة']:
-                            # Find the sentiment column index
-                            sentiment_col = None
-                            for idx, cell in enumerate(ws[1], 1):
-                                if cell.value == 'النوع':
-                                    sentiment_col = idx
-                                    break
-                            
-                            if sentiment_col:
-                                # Apply colors based on sentiment
-                                for row in ws.iter_rows(min_row=2):  # Skip header
-                                    sentiment = row[sentiment_col-1].value
-                                    fill = None
-                                    if sentiment == 'إيجابي':
-                                        fill = positive_fill
-                                    elif sentiment == 'سلبي':
-                                        fill = negative_fill
-                                    elif sentiment == 'محايد':
-                                        fill = neutral_fill
-                                    elif sentiment == 'خطأ':
-                                        fill = PatternFill(start_color='808080', end_color='808080', fill_type='solid')  # Gray for errors
-                                    
-                                    if fill:
-                                        for cell in row:
-                                            cell.fill = fill
+    with span("excel_build", results=len(st.session_state.results)):
+        with pd.ExcelWriter(output, engine='openpyxl') as writer:
+            try:
+                excel_created = write_results_workbook(st.session_state.results, writer,
+                                                       st.session_state.get('last_usage_records'))
+                if not excel_created:
+                    st.error("لم يتم العثور على نتائج صالحة للتحليل")
                     
-                    excel_created = True
-            else:
-                st.error("لم يتم العثور على نتائج صالحة للتحليل")
-                
-        except Exception as e:
-            st.error(f"حدث خطأ أثناء إنشاء ملف Excel: {str(e)}")
+            except Exception as e:
+                st.error(f"حدث خطأ أثناء إنشاء ملف Excel: {str(e)}")
     
     # Only proceed with download button if Excel was created successfully
     if excel_created:
@@ -971,75 +1233,76 @@ if st.session_state.get('results'):
         output.seek(0)
         excel_data = output.getvalue()
         
-        # Calculate top categories and their percentages
-        category_stats = {}
-        for r in st.session_state.results:
-            category = r.get('classification', {}).get('category', '')
-            type_ = r.get('classification', {}).get('type', '')
-            if category:
-                if category not in category_stats:
-                    category_stats[category] = {'total': 0, 'positive': 0, 'negative': 0, 'neutral': 0}
-                category_stats[category]['total'] += 1
-                if type_ == 'إيجابي':
-                    category_stats[category]['positive'] += 1
-                elif type_ == 'سلبي':
-                    category_stats[category]['negative'] += 1
-                elif type_ == 'محايد':
-                    category_stats[category]['neutral'] += 1
+        with span("summary", results=len(st.session_state.results)):
+            # Calculate top categories and their percentages
+            category_stats = {}
+            for r in st.session_state.results:
+                category = r.get('classification', {}).get('category', '')
+                type_ = r.get('classification', {}).get('type', '')
+                if category:
+                    if category not in category_stats:
+                        category_stats[category] = {'total': 0, 'positive': 0, 'negative': 0, 'neutral': 0}
+                    category_stats[category]['total'] += 1
+                    if type_ == 'إيجابي':
+                        category_stats[category]['positive'] += 1
+                    elif type_ == 'سلبي':
+                        category_stats[category]['negative'] += 1
+                    elif type_ == 'محايد':
+                        category_stats[category]['neutral'] += 1
         
-        # Calculate percentages and sort by total count
-        for cat in category_stats:
-            total = category_stats[cat]['total']
-            positive = category_stats[cat]['positive']
-            negative = category_stats[cat]['negative']
-            neutral = category_stats[cat]['neutral']
-            category_stats[cat]['positive_pct'] = (positive / total) * 100
-            category_stats[cat]['negative_pct'] = (negative / total) * 100
-            category_stats[cat]['neutral_pct'] = (neutral / total) * 100
+            # Calculate percentages and sort by total count
+            for cat in category_stats:
+                total = category_stats[cat]['total']
+                positive = category_stats[cat]['positive']
+                negative = category_stats[cat]['negative']
+                neutral = category_stats[cat]['neutral']
+                category_stats[cat]['positive_pct'] = (positive / total) * 100
+                category_stats[cat]['negative_pct'] = (negative / total) * 100
+                category_stats[cat]['neutral_pct'] = (neutral / total) * 100
         
-        # Get top 4 categories by total count
-        top_categories = sorted(category_stats.items(), key=lambda x: x[1]['total'], reverse=True)[:4]
+            # Get top 4 categories by total count
+            top_categories = sorted(category_stats.items(), key=lambda x: x[1]['total'], reverse=True)[:4]
         
-        # Display enhanced summary section
-        summary_html = f"""
-            <div class="summary-container">
-                <div class="summary-header">ملخص التحليل</div>
-                <div class="summary-stats">
-                    <div class="stat-card positive-stat">
-                        <div class="stat-number">{len(positive_experiences)}</div>
-                        <div class="stat-label">تجربة إيجابية</div>
-                    </div>
-                    <div class="stat-card negative-stat">
-                        <div class="stat-number">{len(negative_experiences)}</div>
-                        <div class="stat-label">تجربة سلبية</div>
-                    </div>
-                    <div class="stat-card neutral-stat">
-                        <div class="stat-number">{len(neutral_experiences)}</div>
-                        <div class="stat-label">تجربة محايدة</div>
+            # Display enhanced summary section
+            summary_html = f"""
+                <div class="summary-container">
+                    <div class="summary-header">ملخص التحليل</div>
+                    <div class="summary-stats">
+                        <div class="stat-card positive-stat">
+                            <div class="stat-number">{len(positive_experiences)}</div>
+                            <div class="stat-label">تجربة إيجابية</div>
+                        </div>
+                        <div class="stat-card negative-stat">
+                            <div class="stat-number">{len(negative_experiences)}</div>
+                            <div class="stat-label">تجربة سلبية</div>
+                        </div>
+                        <div class="stat-card neutral-stat">
+                            <div class="stat-number">{len(neutral_experiences)}</div>
+                            <div class="stat-label">تجربة محايدة</div>
+                        </div>
                     </div>
-                </div>
-                <div class="top-categories">
-                    <div class="top-categories-header">أبرز التصنيفات</div>
-                    <div class="category-grid">"""
+                    <div class="top-categories">
+                        <div class="top-categories-header">أبرز التصنيفات</div>
+                        <div class="category-grid">"""
         
-        # Add category cards with enhanced structure
-        for cat, stats in top_categories:
-            summary_html += f"""
-                <div class="category-card">
-                    <div class="category-count">{stats['total']}</div>
-                    <div class="category-name">{cat}</div>
-                    <div class="category-percentages">
-                        <span class="positive-pct">{stats['positive_pct']:.1f}% إيجابي</span>
-                        <span class="negative-pct">{stats['negative_pct']:.1f}% سلبي</span>
-                        <span class="neutral-pct">{stats['neutral_pct']:.1f}% محايد</span>
-                    </div>
-                </div>"""
+            # Add category cards with enhanced structure
+            for cat, stats in top_categories:
+                summary_html += f"""
+                    <div class="category-card">
+                        <div class="category-count">{stats['total']}</div>
+                        <div class="category-name">{cat}</div>
+                        <div class="category-percentages">
+                            <span class="positive-pct">{stats['positive_pct']:.1f}% إيجابي</span>
+                            <span class="negative-pct">{stats['negative_pct']:.1f}% سلبي</span>
+                            <span class="neutral-pct">{stats['neutral_pct']:.1f}% محايد</span>
+                        </div>
+                    </div>"""
         
-        summary_html += """
+            summary_html += """
+                        </div>
                     </div>
                 </div>
-            </div>
-        """
+            """
         
         # Add CSS for neutral styling
         st.markdown("""
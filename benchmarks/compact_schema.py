@@ -0,0 +1,106 @@
+"""Benchmark output tokens and latency per batch of the full vs compact answer schema.
+
+Classifies the same synthetic batches with the full schema (each response
+echoed with its classification and explanation) and the compact one
+(index and codes only) against the fake backend. The fake generates
+``--output-chars-per-second`` characters per second, so latency follows
+the size of the answer as with a real model. Reports output tokens and
+latency per batch, the reduction, and whether both schemas produced the
+same labels.
+
+Usage:
+    python benchmarks/compact_schema.py [--batches 3] [--batch-sizes 20,50,80]
+"""
+import argparse
+import random
+import sys
+import threading
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from pipeline import fake_gemini  # noqa: E402
+from pipeline.classifier import CLASSIFY_PROMPT, SYSTEM_INSTRUCTION, StatelessSession, classify_batch  # noqa: E402
+from pipeline.compact import COMPACT_SYSTEM_INSTRUCTION, TaxonomyCodes  # noqa: E402
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from pipeline_suite import synthetic_responses  # noqa: E402
+
+
+class UsageRecorder:
+    """Collects the output token count of every fake model answer."""
+
+    def __init__(self):
+        self.output_tokens = []
+        self._lock = threading.Lock()
+        self._original = fake_gemini.GenerativeModel.generate_content
+
+    def __enter__(self):
+        recorder = self
+
+        def generate_content(model, contents, stream=False, **kwargs):
+            response = recorder._original(model, contents, stream=stream, **kwargs)
+            with recorder._lock:
+                recorder.output_tokens.append(response.usage_metadata.candidates_token_count)
+            return response
+
+        fake_gemini.GenerativeModel.generate_content = generate_content
+        return self
+
+    def __exit__(self, *exc):
+        fake_gemini.GenerativeModel.generate_content = self._original
+
+
+def run(batches, system_instruction, taxonomy, codes=None):
+    """Classify every batch; return labels, latencies and output tokens per batch."""
+    model = fake_gemini.GenerativeModel(system_instruction=system_instruction)
+    context = [CLASSIFY_PROMPT, taxonomy] + ([codes.legend()] if codes else [])
+    session = StatelessSession(model, context)
+    labels, latencies = [], []
+    with UsageRecorder() as usage:
+        for batch in batches:
+            classifications, batch_time = classify_batch(session, batch, codes=codes)
+            latencies.append(batch_time)
+            labels.extend(
+                (c['classification']['type'], c['classification']['category'], c['classification']['subcategory'])
+                if c else None
+                for c in classifications
+            )
+    return labels, latencies, usage.output_tokens
+
+def mean(values):
+    return sum(values) / len(values) if values else 0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--batches", type=int, default=3, help="batches per schema and batch size")
+    parser.add_argument("--batch-sizes", default="20,50,80")
+    parser.add_argument("--base-latency", type=float, default=0.2, help="seconds per request before output")
+    parser.add_argument("--output-chars-per-second", type=float, default=700,
+                        help="fake generation speed (about 230 tokens/s)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    fake_gemini.configure(latency="fixed", latency_mean=args.base_latency, per_output_item=0,
+                          per_1k_output_chars=1000 / args.output_chars_per_second, seed=args.seed)
+    taxonomy = fake_gemini.upload_file(fake_gemini.DEFAULT_TAXONOMY_PATH, mime_type="text/plain")
+    codes = TaxonomyCodes.from_file(fake_gemini.DEFAULT_TAXONOMY_PATH)
+
+    print(f"{'batch':>5}  {'schema':<8} {'out tokens':>10} {'latency':>9}")
+    for batch_size in (int(s) for s in args.batch_sizes.split(',')):
+        responses = synthetic_responses(batch_size * args.batches, random.Random(args.seed).randint(0, 10**6))
+        batches = [responses[i:i + batch_size] for i in range(0, len(responses), batch_size)]
+        full_labels, full_latencies, full_tokens = run(batches, SYSTEM_INSTRUCTION, taxonomy)
+        compact_labels, compact_latencies, compact_tokens = run(batches, COMPACT_SYSTEM_INSTRUCTION, taxonomy, codes)
+
+        for name, latencies, tokens in (("full", full_latencies, full_tokens),
+                                        ("compact", compact_latencies, compact_tokens)):
+            print(f"{batch_size:>5}  {name:<8} {mean(tokens):>10.0f} {mean(latencies):>8.2f}s")
+        agreement = mean([a == b for a, b in zip(full_labels, compact_labels)])
+        print(f"       output tokens x{mean(compact_tokens) / mean(full_tokens):.2f}  "
+              f"latency x{mean(compact_latencies) / mean(full_latencies):.2f}  "
+              f"same labels {agreement:.1%}")
+
+
+if __name__ == "__main__":
+    main()
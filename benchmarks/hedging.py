@@ -0,0 +1,85 @@
+"""Benchmark tail latency with and without hedged requests, and circuit breaker fail-fast.
+
+Classifies the same synthetic batches through the real classifier and
+engine against the fake backend, where a share of requests stall for
+``--stall-seconds`` on top of the normal latency (the 30-60 s outliers
+seen with Gemini, scaled down). Reports wall time, p50/p95/p99 batch
+latency and extra calls without hedging and with it. Then makes every
+request fail and compares how long a run takes to give up with and
+without the circuit breaker.
+
+Usage:
+    python benchmarks/hedging.py [--batches 120] [--stall-rate 0.03] [--stall-seconds 8]
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from pipeline import fake_gemini  # noqa: E402
+from pipeline.classifier import CLASSIFY_PROMPT, SYSTEM_INSTRUCTION, StatelessSession, make_batch_classifier  # noqa: E402
+from pipeline.engine import classify_concurrently  # noqa: E402
+from pipeline.resilience import CircuitBreaker, Hedger, LatencyTracker  # noqa: E402
+from pipeline.usage import UsageTracker  # noqa: E402
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from pipeline_suite import synthetic_responses  # noqa: E402
+
+
+def run(responses, batch_size, workers, hedger=None, breaker=None):
+    """Classify ``responses``; return wall time, engine stats and model calls made."""
+    model = fake_gemini.GenerativeModel(system_instruction=SYSTEM_INSTRUCTION)
+    taxonomy = fake_gemini.upload_file(fake_gemini.DEFAULT_TAXONOMY_PATH, mime_type="text/plain")
+    usage = UsageTracker()
+    classify_fn = make_batch_classifier(StatelessSession(model, [CLASSIFY_PROMPT, taxonomy]),
+                                        usage=usage, breaker=breaker)
+    if hedger is not None:
+        classify_fn = hedger.wrap(classify_fn)
+    start_time = time.perf_counter()
+    _, stats = classify_concurrently(responses, classify_fn, batch_size, max_workers=workers)
+    return time.perf_counter() - start_time, stats, len(usage.records())
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--batches", type=int, default=120)
+    parser.add_argument("--batch-size", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.3, help="mean seconds per request")
+    parser.add_argument("--stall-rate", type=float, default=0.03, help="share of requests that stall")
+    parser.add_argument("--stall-seconds", type=float, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    responses = synthetic_responses(args.batches * args.batch_size, random.Random(args.seed).randint(0, 10**6))
+    responses = list(dict.fromkeys(responses))
+
+    print(f"{'':<10} {'wall':>7} {'p50':>6} {'p95':>6} {'p99':>6} {'calls':>6}")
+    for name in ("no hedge", "hedged"):
+        fake_gemini.configure(latency="lognormal", latency_mean=args.latency, latency_spread=0.3,
+                              per_output_item=0, stall_rate=args.stall_rate,
+                              stall_seconds=args.stall_seconds, seed=args.seed)
+        # Starts with an empty latency window, so the first calls wait the initial delay
+        hedger = Hedger(LatencyTracker(), min_delay=args.latency) if name == "hedged" else None
+        wall, stats, calls = run(responses, args.batch_size, args.workers, hedger)
+        latency = stats['batch_latency']
+        print(f"{name:<10} {wall:>6.1f}s {latency['p50']:>5.1f}s {latency['p95']:>5.1f}s "
+              f"{latency['p99']:>5.1f}s {calls:>6}")
+        if hedger is not None:
+            summary = hedger.summary()
+            print(f"{'':<10} {summary['hedged']} hedged after {summary['hedge_delay']:.1f}s, "
+                  f"{summary['hedge_wins']} won by the hedge")
+
+    print()
+    failing = responses[:args.batch_size * 8]
+    for name, breaker in (("no breaker", None), ("breaker", CircuitBreaker(failure_threshold=5, reset_timeout=60))):
+        fake_gemini.configure(latency="fixed", latency_mean=0.05, per_output_item=0, error_rate=1.0, seed=args.seed)
+        wall, stats, _ = run(failing, args.batch_size, args.workers, breaker=breaker)
+        print(f"{name:<10} all requests failing: gave up on {len(stats['failed_responses'])} responses "
+              f"after {wall:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
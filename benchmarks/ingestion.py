@@ -0,0 +1,126 @@
+"""Benchmark CSV ingestion: encoding tried parse by parse vs sniffed once from a byte sample.
+
+Writes synthetic survey CSV files of ``--size-mb`` megabytes in each
+encoding, then reads every file with the old approach (a full
+``pd.read_csv`` per candidate encoding until one succeeds) and with
+``pipeline.ingest.read_csv_with_encoding``. Each read runs in a fresh
+process so wall time and peak memory are measured on their own. The
+"arabic" column is the share of the responses' non-ASCII characters that
+decoded to Arabic: below 100% the file was read in the wrong encoding.
+
+An encoding suffixed with "-late" (e.g. "cp1256-late") writes a file whose
+first ``LATE_SHARE`` of rows are ASCII only, as when Arabic comments were
+appended to an export. That is where each failed full parse costs most.
+
+Usage:
+    python benchmarks/ingestion.py [--size-mb 300] [--encodings utf-8-sig,cp1256,cp1256-late,iso-8859-6]
+"""
+import argparse
+import json
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import pandas as pd  # noqa: E402
+
+from pipeline.ingest import arabic_share, detect_csv_encoding, read_csv_with_encoding  # noqa: E402
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from pipeline_suite import synthetic_responses  # noqa: E402
+
+# Encodings the app tried one full parse after another before sniffing
+LEGACY_ENCODINGS = ['utf-8-sig', 'utf-8', 'cp1256', 'iso-8859-6']
+BLOCK_ROWS = 20000  # Rows generated once and repeated until the file is large enough
+LATE_SHARE = 0.75  # Part of a "-late" file written before the first non-ASCII row
+
+
+def legacy_read(path):
+    """The previous ``read_csv_with_encoding``: parse with each encoding until one works."""
+    for encoding in LEGACY_ENCODINGS:
+        try:
+            df = pd.read_csv(path, encoding=encoding)
+            if not df.empty and len(df.columns) > 0:
+                return df, encoding
+        except Exception:
+            continue
+    return None, None
+
+def sniffed_read(path):
+    return read_csv_with_encoding(path), None
+
+def write_csv(path, encoding, size_mb, seed):
+    """Survey-like CSV of about ``size_mb`` MB; returns its row count."""
+    late = encoding.endswith('-late')
+    encoding = encoding.replace('-late', '')
+    rng = random.Random(seed)
+    dates = [f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}" for _ in range(BLOCK_ROWS)]
+    block = "".join(
+        f"{i},{date},\"{response}\"\n"
+        for i, (date, response) in enumerate(zip(dates, synthetic_responses(BLOCK_ROWS, seed)))
+    ).encode(encoding.replace('-sig', ''), errors='replace')
+    ascii_block = "".join(f"{i},{date},\"no comment {i}\"\n" for i, date in enumerate(dates)).encode()
+    rows = 0
+    with open(path, 'wb') as f:
+        f.write(("id,date,response\n" if late else "رقم,التاريخ,تجربة_الطالب\n").encode(encoding))
+        while f.tell() < size_mb * 2**20:
+            f.write(ascii_block if late and f.tell() < LATE_SHARE * size_mb * 2**20 else block)
+            rows += BLOCK_ROWS
+    return rows
+
+def worker(method, path):
+    """Read ``path`` with one method and print its measurements as JSON."""
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start_time = time.perf_counter()
+    df, encoding = (legacy_read if method == "legacy" else sniffed_read)(path)
+    seconds = time.perf_counter() - start_time
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if method != "legacy":
+        encoding = detect_csv_encoding(path)
+    sample = "".join(df.iloc[-2000:, -1].astype(str)) if df is not None else ""
+    print(json.dumps({
+        'seconds': seconds,
+        'peak_mb': (peak - baseline) / 1024,
+        'rows': len(df) if df is not None else 0,
+        'encoding': encoding,
+        'arabic': arabic_share(sample),
+    }))
+
+def measure(method, path):
+    output = subprocess.run(
+        [sys.executable, __file__, "--worker", method, str(path)], capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=300)
+    parser.add_argument("--encodings", default="utf-8-sig,cp1256,cp1256-late,iso-8859-6")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--worker", nargs=2, metavar=("METHOD", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        worker(*args.worker)
+        return
+
+    with tempfile.TemporaryDirectory() as workdir:
+        print(f"{'file':<12} {'method':<8} {'seconds':>8} {'peak MB':>8} {'rows':>9}  {'read as':<11} {'arabic':>6}")
+        for encoding in args.encodings.split(","):
+            path = Path(workdir) / f"responses-{encoding}.csv"
+            rows = write_csv(path, encoding, args.size_mb, args.seed)
+            size_mb = path.stat().st_size / 2**20
+            for method in ("legacy", "sniffed"):
+                run = measure(method, path)
+                print(f"{encoding:<12} {method:<8} {run['seconds']:>8.1f} {run['peak_mb']:>8.0f} {run['rows']:>9}  "
+                      f"{str(run['encoding']):<11} {run['arabic']:>6.0%}")
+            print(f"{'':<12} ({size_mb:.0f} MB, {rows} rows)")
+            path.unlink()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Agreement of the self-trained local model with held-out Gemini labels.
+
+Trains the local model on part of the stored labels (or of a JSONL file
+written by ``classify_cli.py --output results.jsonl``) and compares its
+predictions with the remaining Gemini labels. For each confidence
+threshold it prints the share of responses the local model would keep
+and how often those agree with Gemini on type, category and subcategory,
+which is what ``LOCAL_MODEL_THRESHOLD`` should be chosen from.
+
+Usage:
+    python benchmarks/local_model_report.py [--backend gemini|fake] [--labels results.jsonl]
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from pipeline.cache import taxonomy_fingerprint  # noqa: E402
+from pipeline.classifier import MODEL_NAME  # noqa: E402
+from pipeline.gemini import BACKEND_FAKE, BACKEND_GEMINI, cache_model_name  # noqa: E402
+from pipeline.selftrain import MAX_TRAINING_LABELS, LabelStore, evaluate_local_model  # noqa: E402
+
+BASE_PATH = Path(__file__).resolve().parent.parent
+LABELS_PATH = BASE_PATH / ".cache" / "labels.sqlite3"
+TAXONOMY_PATH = BASE_PATH / "data" / "Classes.txt"
+
+
+def load_labels(args):
+    if args.labels:
+        with open(args.labels, encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
+    store = LabelStore(LABELS_PATH, cache_model_name(MODEL_NAME, args.backend), taxonomy_fingerprint(TAXONOMY_PATH))
+    return store.load(limit=MAX_TRAINING_LABELS)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend", choices=[BACKEND_GEMINI, BACKEND_FAKE], default=BACKEND_GEMINI,
+                        help="whose stored labels to evaluate")
+    parser.add_argument("--labels", help="JSONL file of results to use instead of the label store")
+    parser.add_argument("--test-share", type=float, default=0.2, help="share of labels held out")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="also write the report as JSON to this path")
+    args = parser.parse_args()
+
+    labeled = load_labels(args)
+    start_time = time.perf_counter()
+    report = evaluate_local_model(labeled, test_share=args.test_share, seed=args.seed)
+    if report is None:
+        print(f"not enough labels to train a local model ({len(labeled)} available)")
+        return 1
+
+    print(f"trained on {report['train_labels']} labels, tested on {report['test_labels']} "
+          f"({time.perf_counter() - start_time:.1f}s)")
+    print("accuracy: " + "  ".join(f"{field} {value:.3f}" for field, value in report['accuracy'].items()))
+    print("threshold  coverage  agreement")
+    for row in report['thresholds']:
+        agreement = f"{row['agreement']:.3f}" if row['agreement'] is not None else "-"
+        print(f"{row['threshold']:>9.2f}  {row['coverage']:>8.3f}  {agreement:>9}")
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding='utf-8')
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
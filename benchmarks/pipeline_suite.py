@@ -0,0 +1,254 @@
+"""End-to-end benchmark of the classification pipeline against the fake backend.
+
+For each size, synthetic Arabic responses are written to a CSV file, then
+read back, deduplicated, planned into batches, classified through the real
+classifier/engine code against ``pipeline.fake_gemini`` and exported. The
+report gives wall time, responses/sec, peak memory and a per-stage
+breakdown, and is written as JSON so runs can be compared across commits.
+
+Usage:
+    python benchmarks/pipeline_suite.py [--sizes 1000,10000,100000] [--output report.json]
+    python benchmarks/pipeline_suite.py --compare old.json new.json
+
+Stage times inside the engine (prompt formatting, model calls, JSON parsing,
+validation, alignment) are summed over all worker threads, so with several
+workers they can add up to more than the wall time. Model output is parsed
+while it streams, so ``model_call`` includes the ``parse_json`` time.
+"""
+import argparse
+import json
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import pandas as pd  # noqa: E402
+
+from pipeline import classifier, fake_gemini  # noqa: E402
+from pipeline.batching import plan_batches  # noqa: E402
+from pipeline.dedup import collapse_duplicates  # noqa: E402
+from pipeline.engine import DEFAULT_MAX_WORKERS  # noqa: E402
+from pipeline.export import results_to_rows  # noqa: E402
+from pipeline.ingest import iter_response_chunks  # noqa: E402
+from pipeline.jsonstream import JsonArrayStream  # noqa: E402
+from pipeline.run import classify_responses  # noqa: E402
+
+SUBJECTS = [
+    "المكتبة", "السكن الجامعي", "النقل", "المختبرات", "عضو هيئة التدريس", "الإرشاد الأكاديمي",
+    "المقررات", "الأنشطة الطلابية", "الطعام في الكافتيريا", "المرافق الرياضية", "الخدمات الرقمية",
+]
+OPINIONS = [
+    "ممتازة وتوفر كل ما نحتاجه", "تحتاج إلى صيانة عاجلة", "متعاون جدا ويشرح بوضوح",
+    "غير منتظم ويتأخر دائما", "جيدة لكن الأوقات غير مناسبة", "ساعدتني كثيرا في دراستي",
+    "مزدحمة ولا توجد أماكن كافية", "رائعة ومجهزة بأحدث التقنيات", "لا بأس بها",
+]
+DETAILS = ["", " في الفصل الأول", " هذا العام", " مقارنة بالسنة الماضية", " خاصة في فترة الاختبارات"]
+DUPLICATE_RATE = 0.3  # Share of responses repeating an earlier one, as in real surveys
+
+STAGES = ["ingest", "dedup_and_plan", "format_prompt", "model_call", "parse_json", "validate", "align",
+          "classify_wall", "export_rows"]
+
+
+class StageTimer:
+    """Thread-safe accumulator of seconds spent per stage."""
+
+    def __init__(self):
+        self.seconds = {stage: 0.0 for stage in STAGES}
+        self.calls = {stage: 0 for stage in STAGES}
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.seconds[stage] += seconds
+            self.calls[stage] += 1
+
+    @contextmanager
+    def measure(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    def wrap(self, stage, fn):
+        def timed(*args, **kwargs):
+            with self.measure(stage):
+                return fn(*args, **kwargs)
+        return timed
+
+
+@contextmanager
+def instrumented(timer):
+    """Time the classifier's internal steps by wrapping its module functions."""
+    stages = {
+        "format_batch": "format_prompt",
+        "stream_classifications": "model_call",
+        "validate_classifications": "validate",
+        "align_by_id": "align",
+    }
+    originals = {name: getattr(classifier, name) for name in stages}
+    feed, finish = JsonArrayStream.feed, JsonArrayStream.finish
+    try:
+        for name, fn in originals.items():
+            setattr(classifier, name, timer.wrap(stages[name], fn))
+        JsonArrayStream.feed = timer.wrap("parse_json", feed)
+        JsonArrayStream.finish = timer.wrap("parse_json", finish)
+        yield
+    finally:
+        for name, fn in originals.items():
+            setattr(classifier, name, fn)
+        JsonArrayStream.feed, JsonArrayStream.finish = feed, finish
+
+def synthetic_responses(count, seed):
+    """Arabic survey-like responses with a realistic share of duplicates."""
+    rng = random.Random(seed)
+    responses = []
+    for _ in range(count):
+        if responses and rng.random() < DUPLICATE_RATE:
+            responses.append(rng.choice(responses))
+        else:
+            responses.append(
+                f"{rng.choice(SUBJECTS)} {rng.choice(OPINIONS)}{rng.choice(DETAILS)} ({rng.randint(1, 10**6)})"
+            )
+    return responses
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=Path(__file__).resolve().parent
+        ).stdout.strip()
+    except Exception:
+        return None
+
+def run_size(size, args, workdir):
+    """Run the whole pipeline on ``size`` responses and return its report entry."""
+    column = "تجربة_الطالب"
+    csv_path = Path(workdir) / f"responses_{size}.csv"
+    pd.DataFrame({column: synthetic_responses(size, args.seed)}).to_csv(csv_path, index=False, encoding='utf-8-sig')
+
+    fake_gemini.configure(latency=args.latency, latency_mean=args.latency_mean, latency_spread=args.latency_spread,
+                          per_output_item=0, seed=args.seed)
+    taxonomy = fake_gemini.upload_file(fake_gemini.DEFAULT_TAXONOMY_PATH, mime_type="text/plain")
+    session = classifier.StatelessSession(
+        fake_gemini.GenerativeModel(system_instruction=classifier.SYSTEM_INSTRUCTION),
+        [classifier.CLASSIFY_PROMPT, taxonomy]
+    )
+
+    timer = StageTimer()
+    if args.memory:
+        tracemalloc.start()
+    wall_start = time.perf_counter()
+
+    with timer.measure("ingest"):
+        responses = [r for chunk in iter_response_chunks(csv_path, 'csv', column) for r in chunk]
+
+    with timer.measure("dedup_and_plan"):
+        unique_responses, _ = collapse_duplicates(responses)
+        num_batches = len(plan_batches(unique_responses))
+
+    with instrumented(timer), timer.measure("classify_wall"):
+        results, stats = classify_responses(
+            responses,
+            classifier.make_batch_classifier(session),
+            max_workers=args.concurrency,
+            planner=plan_batches
+        )
+
+    with timer.measure("export_rows"):
+        pd.DataFrame(results_to_rows(results))
+
+    wall = time.perf_counter() - wall_start
+    peak_memory = tracemalloc.get_traced_memory()[1] if args.memory else None
+    if args.memory:
+        tracemalloc.stop()
+
+    return {
+        'responses': size,
+        'unique_responses': len(unique_responses),
+        'classified': len(results),
+        'failed': len(stats['failed_responses']),
+        'num_batches': num_batches,
+        'model_calls': timer.calls["model_call"],
+        'parse_json_calls': timer.calls["parse_json"],
+        'wall_seconds': round(wall, 4),
+        'responses_per_second': round(size / wall, 2) if wall > 0 else None,
+        'peak_memory_mb': round(peak_memory / 2**20, 2) if peak_memory is not None else None,
+        'stage_seconds': {stage: round(seconds, 4) for stage, seconds in timer.seconds.items()},
+    }
+
+def print_run(run):
+    print(f"{run['responses']:>7} responses  {run['wall_seconds']:8.2f}s  "
+          f"{run['responses_per_second']:9.1f} resp/s  "
+          f"peak {run['peak_memory_mb'] if run['peak_memory_mb'] is not None else '-'} MB  "
+          f"{run['model_calls']} model calls")
+    print("         " + "  ".join(f"{stage} {seconds:.2f}s" for stage, seconds in run['stage_seconds'].items()))
+
+def compare(old_path, new_path):
+    """Print per-size ratios of wall time, throughput and memory between two reports."""
+    old = {run['responses']: run for run in json.loads(Path(old_path).read_text())['runs']}
+    new_report = json.loads(Path(new_path).read_text())
+    print(f"{old_path} -> {new_path}")
+    for run in new_report['runs']:
+        before = old.get(run['responses'])
+        if before is None:
+            continue
+        line = [f"{run['responses']:>7} responses"]
+        for key in ('wall_seconds', 'responses_per_second', 'peak_memory_mb'):
+            if before.get(key) and run.get(key) is not None:
+                line.append(f"{key} x{run[key] / before[key]:.2f}")
+        print("  ".join(line))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,100000", help="comma-separated response counts")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_MAX_WORKERS)
+    parser.add_argument("--latency", default="fixed", choices=["fixed", "uniform", "normal", "lognormal"])
+    parser.add_argument("--latency-mean", type=float, default=0.01, help="fake model seconds per request")
+    parser.add_argument("--latency-spread", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-memory", dest="memory", action="store_false",
+                        help="skip tracemalloc (faster, no peak memory figure)")
+    parser.add_argument("--output", help="JSON report path (default: benchmarks/results/pipeline-<commit>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two reports and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    commit = git_commit()
+    report = {
+        'benchmark': "pipeline_suite",
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        'runs': [],
+    }
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in (int(s) for s in args.sizes.split(',')):
+            run = run_size(size, args, workdir)
+            report['runs'].append(run)
+            print_run(run)
+    report['max_rss_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2)
+
+    output = Path(args.output) if args.output else (
+        Path(__file__).resolve().parent / "results" / f"pipeline-{commit or 'unknown'}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding='utf-8')
+    print(f"report written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Benchmark per-batch latency of chat-session vs stateless classification.
+
+Uses the local fake Gemini backend with a latency that grows linearly with
+the size of the prompt it receives, then classifies the same synthetic survey through a chat
+session (history replayed on every call) and through a StatelessSession.
+
+Usage:
+    python benchmarks/stateless_vs_chat.py [--responses 10000] [--batch-size 50]
+"""
+import argparse
+import random
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from pipeline import fake_gemini  # noqa: E402
+from pipeline.classifier import CLASSIFY_PROMPT, StatelessSession, classify_batch  # noqa: E402
+
+SAMPLE_RESPONSES = [
+    "المكتبة ممتازة وتوفر مصادر كثيرة",
+    "السكن الجامعي يحتاج إلى صيانة",
+    "عضو هيئة التدريس متعاون جدا",
+    "لا يوجد",
+    "النقل غير منتظم ويتأخر دائما",
+    "الإرشاد الأكاديمي ساعدني في اختيار المقررات",
+]
+
+
+def run(session, responses, batch_size):
+    """Classify responses sequentially and return per-batch latencies."""
+    latencies = []
+    for i in range(0, len(responses), batch_size):
+        _, batch_time = classify_batch(session, responses[i:i + batch_size])
+        latencies.append(batch_time)
+    return latencies
+
+def summarize(name, latencies, buckets=10):
+    """Print mean latency for each tenth of the run."""
+    size = max(1, len(latencies) // buckets)
+    means = [
+        sum(latencies[i:i + size]) / len(latencies[i:i + size])
+        for i in range(0, len(latencies), size)
+    ]
+    print(f"{name:<10} total {sum(latencies):7.2f}s  "
+          f"first {means[0] * 1000:7.1f}ms  last {means[-1] * 1000:7.1f}ms  "
+          f"growth x{means[-1] / means[0]:.1f}")
+    print("           per-decile ms: " + " ".join(f"{m * 1000:.0f}" for m in means))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--responses", type=int, default=10000)
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--base-latency", type=float, default=0.002)
+    parser.add_argument("--per-1k-chars", type=float, default=0.00005)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    responses = [rng.choice(SAMPLE_RESPONSES) for _ in range(args.responses)]
+    fake_gemini.configure(latency="fixed", latency_mean=args.base_latency,
+                          per_1k_prompt_chars=args.per_1k_chars, per_output_item=0)
+    model = fake_gemini.GenerativeModel()
+    taxonomy = fake_gemini.upload_file(fake_gemini.DEFAULT_TAXONOMY_PATH, mime_type="text/plain")
+    context = [CLASSIFY_PROMPT, taxonomy]
+
+    print(f"{args.responses} responses, batch size {args.batch_size}")
+    summarize("chat", run(model.start_chat(history=[{"role": "user", "parts": context}]), responses, args.batch_size))
+    summarize("stateless", run(StatelessSession(model, context), responses, args.batch_size))
+
+
+if __name__ == "__main__":
+    main()
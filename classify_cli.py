@@ -0,0 +1,276 @@
+"""Headless batch classification of student responses.
+
+Runs the same pipeline as the Streamlit app (dedup, local lexicon and model, cache, concurrent
+token-budget batches, rate limiting) without a browser:
+
+    python classify_cli.py responses.csv --column "الاستجابة" --output results.xlsx
+
+The input is read in chunks of ``--chunk-size`` responses. CSV and JSONL
+outputs are appended chunk by chunk; an Excel workbook is written once at
+the end because its summary sheets need every result.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from functools import partial
+from pathlib import Path
+
+from pipeline.batching import estimate_compact_output_tokens, plan_batches
+from pipeline.cache import ClassificationCache, taxonomy_fingerprint
+from pipeline.classifier import MODEL_NAME, make_batch_classifier
+from pipeline.compact import SCHEMA_COMPACT, SCHEMA_FULL, TaxonomyCodes
+from pipeline.engine import DEFAULT_MAX_WORKERS
+from pipeline.export import build_results_workbook, results_to_rows
+from pipeline.gemini import (
+    BACKEND_FAKE,
+    BACKEND_GEMINI,
+    cache_model_name,
+    configure,
+    create_model,
+    create_session,
+    create_session_pool,
+    make_session_factory,
+    upload_file,
+    wait_until_active,
+)
+from pipeline.ingest import DEFAULT_CHUNK_SIZE, file_type_from_path, iter_response_chunks
+from pipeline.lexicon import DEFAULT_CONFIDENCE_THRESHOLD, LexiconClassifier
+from pipeline.ratelimit import (
+    DEFAULT_REQUESTS_PER_MINUTE,
+    DEFAULT_TOKENS_PER_MINUTE,
+    get_shared_limiter,
+)
+from pipeline.resilience import DEFAULT_HEDGE_PERCENTILE, Hedger, get_shared_breaker, latency_percentiles
+from pipeline.run import classify_responses
+from pipeline.selftrain import DEFAULT_MODEL_THRESHOLD, MAX_TRAINING_LABELS, LabelStore, train_local_model
+from pipeline.taxonomy import TaxonomyIndex
+from pipeline.tracing import configure_tracing, trace_iter
+from pipeline.usage import UsageTracker
+
+BASE_PATH = Path(__file__).parent
+TAXONOMY_PATH = BASE_PATH / "data" / "Classes.txt"
+CACHE_PATH = BASE_PATH / ".cache" / "classifications.sqlite3"
+LABELS_PATH = BASE_PATH / ".cache" / "labels.sqlite3"
+
+
+def log(message):
+    print(message, file=sys.stderr, flush=True)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Classify student responses with Gemini.")
+    parser.add_argument("input", help="TXT, CSV or Excel file of responses")
+    parser.add_argument("--column", help="column holding the responses (CSV/Excel)")
+    parser.add_argument("--separator", default="\n", help="response separator for TXT files (default: newline)")
+    parser.add_argument("--output", required=True, help="output file: .xlsx, .csv or .jsonl")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_MAX_WORKERS, help="batches in flight at once")
+    parser.add_argument("--batch-size", type=int, help="fixed batch size (default: token-budget planning)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="responses read per chunk")
+    parser.add_argument("--mode", choices=["stateless", "chat"], default="stateless", help="session mode")
+    parser.add_argument("--schema", choices=[SCHEMA_FULL, SCHEMA_COMPACT], default=SCHEMA_FULL,
+                        help="answer format; \"compact\" returns codes only (no explanations, fewer output tokens)")
+    parser.add_argument("--backend", choices=[BACKEND_GEMINI, BACKEND_FAKE], default=BACKEND_GEMINI,
+                        help="model backend; \"fake\" is the offline stand-in (FAKE_GEMINI_* env vars)")
+    parser.add_argument("--api-key", default=os.environ.get("GEMINI_API_KEY"),
+                        help="Gemini API key (default: $GEMINI_API_KEY)")
+    parser.add_argument("--api-keys", default=os.environ.get("GEMINI_API_KEYS"),
+                        help="comma-separated API keys to spread requests over (default: $GEMINI_API_KEYS)")
+    parser.add_argument("--models", default=MODEL_NAME,
+                        help=f"comma-separated models to spread requests over (default: {MODEL_NAME})")
+    parser.add_argument("--requests-per-minute", type=int, default=DEFAULT_REQUESTS_PER_MINUTE)
+    parser.add_argument("--tokens-per-minute", type=int, default=DEFAULT_TOKENS_PER_MINUTE)
+    parser.add_argument("--no-cache", action="store_true", help="do not read or write the result cache")
+    parser.add_argument("--local-threshold", type=float, default=DEFAULT_CONFIDENCE_THRESHOLD,
+                        help="lexicon confidence needed to classify a response without the model")
+    parser.add_argument("--no-local", action="store_true", help="send every response to the model")
+    parser.add_argument("--local-model-threshold", type=float, default=DEFAULT_MODEL_THRESHOLD,
+                        help="confidence the local model trained on past labels needs to skip the model")
+    parser.add_argument("--no-local-model", action="store_true", help="do not use the trained local model")
+    parser.add_argument("--hedge-percentile", type=float, default=DEFAULT_HEDGE_PERCENTILE,
+                        help="re-issue batch calls slower than this percentile of recent calls")
+    parser.add_argument("--no-hedge", action="store_true", help="never re-issue slow batch calls")
+    parser.add_argument("--trace", help="write per-stage timing spans to this JSONL file")
+    args = parser.parse_args(argv)
+
+    args.file_type = file_type_from_path(args.input)
+    if args.file_type != 'txt' and not args.column:
+        parser.error("--column is required for CSV and Excel input")
+    args.output_format = Path(args.output).suffix.lower().lstrip('.')
+    if args.output_format not in ('xlsx', 'csv', 'jsonl'):
+        parser.error("--output must end in .xlsx, .csv or .jsonl")
+    args.api_keys = [key.strip() for key in (args.api_keys or "").split(",") if key.strip()]
+    if not args.api_keys:
+        args.api_keys = [args.api_key]
+    args.models = [name.strip() for name in args.models.split(",") if name.strip()]
+    args.pool_size = len(args.api_keys) * len(args.models)
+    if not all(args.api_keys) and args.backend != BACKEND_FAKE:
+        parser.error("a Gemini API key is required (--api-key or GEMINI_API_KEY)")
+    if args.pool_size > 1 and args.mode != "stateless":
+        parser.error("several API keys or models need --mode stateless")
+    return args
+
+def open_session(args, limiter, codes=None):
+    """Configure Gemini, upload the taxonomy and open a classification session.
+
+    With several API keys or models the session is a ``RequestPool`` over
+    all of them.
+    """
+    configure(args.api_keys[0], args.backend)
+    if args.pool_size > 1:
+        pool, _ = create_session_pool(args.api_keys, args.models, TAXONOMY_PATH, args.backend, args.schema, codes,
+                                      args.requests_per_minute, args.tokens_per_minute, limiter=limiter)
+        return pool
+    taxonomy_file = upload_file(TAXONOMY_PATH, mime_type="text/plain", limiter=limiter)
+    wait_until_active(taxonomy_file, limiter=limiter)
+    return create_session(create_model(args.models[0], args.schema), taxonomy_file, args.mode, codes=codes)
+
+class ResultWriter:
+    """Writes results to the output file as each chunk finishes."""
+
+    def __init__(self, path, output_format):
+        self.path = path
+        self.output_format = output_format
+        self.results = []
+        self._file = None
+        self._csv = None
+        if output_format in ('csv', 'jsonl'):
+            self._file = open(path, 'w', encoding='utf-8-sig' if output_format == 'csv' else 'utf-8', newline='')
+
+    def write(self, results):
+        if self.output_format == 'xlsx':
+            self.results.extend(results)
+        elif self.output_format == 'jsonl':
+            for result in results:
+                self._file.write(json.dumps(result, ensure_ascii=False) + "\n")
+            self._file.flush()
+        else:
+            rows = results_to_rows(results)
+            if rows and self._csv is None:
+                self._csv = csv.DictWriter(self._file, fieldnames=list(rows[0]))
+                self._csv.writeheader()
+            if self._csv is not None:
+                self._csv.writerows(rows)
+            self._file.flush()
+
+    def close(self, usage_records=None):
+        if self._file is not None:
+            self._file.close()
+            return True
+        workbook = build_results_workbook(self.results, usage_records)
+        if workbook is None:
+            return False
+        Path(self.path).write_bytes(workbook)
+        return True
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.trace:
+        configure_tracing(args.trace)
+    # The limits are per key and model; the pool keeps each member within them
+    limiter = get_shared_limiter(args.requests_per_minute * args.pool_size, args.tokens_per_minute * args.pool_size)
+    codes = TaxonomyCodes.from_file(TAXONOMY_PATH) if args.schema == SCHEMA_COMPACT else None
+    session = open_session(args, limiter, codes)
+    usage = UsageTracker()
+    breaker = get_shared_breaker()
+    # Near-miss labels are snapped to the taxonomy; invalid ones are requested again
+    classify_fn = make_batch_classifier(session, make_session_factory(session), limiter, codes, usage, breaker,
+                                        TaxonomyIndex.from_file(TAXONOMY_PATH))
+    hedger = None if args.no_hedge else Hedger(hedge_percentile=args.hedge_percentile)
+    if hedger is not None:
+        classify_fn = hedger.wrap(classify_fn)
+    planner = partial(plan_batches, estimate_output=estimate_compact_output_tokens) if codes else plan_batches
+    cache = None if args.no_cache else ClassificationCache(
+        CACHE_PATH, cache_model_name(args.models[0], args.backend, args.schema), taxonomy_fingerprint(TAXONOMY_PATH)
+    )
+    lexicon = None if args.no_local else LexiconClassifier.from_file(TAXONOMY_PATH)
+    # Every model label is kept to train the local model for later runs
+    label_store = LabelStore(
+        LABELS_PATH, cache_model_name(args.models[0], args.backend), taxonomy_fingerprint(TAXONOMY_PATH)
+    )
+    local_model = None
+    if not args.no_local and not args.no_local_model:
+        train_start = time.perf_counter()
+        local_model = train_local_model(label_store.load(limit=MAX_TRAINING_LABELS))
+        if local_model is not None:
+            log(f"local model trained on {local_model.num_labels} labels in {time.perf_counter() - train_start:.1f}s")
+
+    writer = ResultWriter(args.output, args.output_format)
+    totals = {'responses': 0, 'classified': 0, 'failed': 0, 'cache_hits': 0, 'local_responses': 0}
+    batch_times = []
+    start_time = time.perf_counter()
+    try:
+        chunks = trace_iter(
+            "ingest",
+            iter_response_chunks(args.input, args.file_type, args.column, args.separator, args.chunk_size),
+            file_type=args.file_type
+        )
+        for chunk_index, chunk in enumerate(chunks, 1):
+            results, stats = classify_responses(
+                chunk,
+                classify_fn,
+                cache=cache,
+                lexicon=lexicon,
+                local_threshold=args.local_threshold,
+                local_model=local_model,
+                local_model_threshold=args.local_model_threshold,
+                label_store=label_store,
+                max_workers=args.concurrency,
+                batch_size=args.batch_size,
+                planner=planner
+            )
+            writer.write(results)
+            for error in stats['errors']:
+                log(f"  error: {error}")
+
+            totals['responses'] += len(chunk)
+            totals['classified'] += len(results)
+            totals['failed'] += len(stats['failed_responses'])
+            totals['cache_hits'] += stats['cache_hits']
+            totals['local_responses'] += stats['local_responses'] + stats['local_model_responses']
+            batch_times.extend(stats['batch_times'])
+            elapsed = time.perf_counter() - start_time
+            local = stats['local_responses'] + stats['local_model_responses']
+            log(
+                f"chunk {chunk_index}: {len(chunk)} responses in {stats['total_time']:.1f}s "
+                f"({stats['num_batches']} batches, {local} local, {stats['cache_hits']} cached, "
+                f"{len(stats['failed_responses'])} failed) | "
+                f"total {totals['responses']} at {totals['responses'] / elapsed:.1f} responses/s, "
+                f"${usage.summary()['cost']:.4f}"
+            )
+    finally:
+        written = writer.close(usage.records())
+
+    elapsed = time.perf_counter() - start_time
+    run_usage = usage.summary()
+    log(
+        f"done: {totals['classified']}/{totals['responses']} classified in {elapsed:.1f}s "
+        f"({totals['responses'] / elapsed if elapsed > 0 else 0:.1f} responses/s, "
+        f"{totals['local_responses']} local, {totals['cache_hits']} cache hits, {totals['failed']} failed)"
+    )
+    log(
+        f"usage: {run_usage['calls']} calls, {run_usage['prompt_tokens']} prompt + "
+        f"{run_usage['output_tokens']} output tokens, estimated ${run_usage['cost']:.4f} "
+        f"(finish reasons: {run_usage['finish_reasons'] or '-'})"
+    )
+    latency = latency_percentiles(batch_times)
+    hedged = f", {hedger.stats['hedged']} hedged ({hedger.stats['hedge_wins']} won by the hedge)" if hedger else ""
+    log(f"batch latency: p50 {latency['p50']:.1f}s, p95 {latency['p95']:.1f}s, p99 {latency['p99']:.1f}s{hedged}")
+    circuit = breaker.status()
+    if circuit['trips']:
+        log(f"circuit breaker opened {circuit['trips']} times and rejected {circuit['rejected']} calls "
+            f"(now {circuit['state']}; last error: {circuit['last_error']})")
+    if args.pool_size > 1:
+        for member in session.status():
+            log(f"  {member['member']}: {member['calls']} calls, {member['latency']:.1f}s latency, "
+                f"{member['errors']} errors ({member['quota_errors']} quota)")
+    if not written:
+        log("no valid results to write")
+        return 1
+    log(f"results written to {args.output}")
+    return 1 if totals['failed'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
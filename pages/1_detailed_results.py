@@ -4,10 +4,21 @@ import plotly.express as px
 import plotly.graph_objects as go
 import yaml
 import os
-import google.generativeai as genai
 import io
 from openpyxl.styles import Font, PatternFill, Alignment
 import time
+from pathlib import Path
+from pipeline.batching import estimate_text_tokens
+from pipeline.export import write_usage_sheet
+from pipeline.gemini import BACKEND_FAKE, BACKEND_GEMINI, KeyClient, configure as configure_backend
+from pipeline.pool import api_keys_from_secrets, build_pool, pool_limiter, rate_limits_from_secrets
+from pipeline.ratelimit import call_with_retry
+from pipeline.resilience import get_shared_breaker
+from pipeline.tracing import configure_tracing, span
+from pipeline.usage import UsageTracker, response_usage
+
+TRACE_PATH = Path(__file__).parent.parent / ".cache" / "trace.jsonl"
+SUGGESTION_MODEL = "gemini-pro"
 
 # Page config
 st.set_page_config(
@@ -16,6 +27,12 @@ st.set_page_config(
     layout="centered"
 )
 
+# Same trace file as the main page, in case this page is opened first
+try:
+    configure_tracing(TRACE_PATH if st.secrets.get("TRACING", True) else None)
+except Exception:
+    configure_tracing(TRACE_PATH)
+
 # Function to load types
 def load_types():
     try:
@@ -743,15 +760,20 @@ def create_charts():
             
             st.plotly_chart(fig_sentiment, use_container_width=True)
 
+def get_rate_limiter():
+    """Process-wide rate limiter of the suggestion model, sized for every API key."""
+    return pool_limiter(st.secrets, [SUGGESTION_MODEL])
+
 def initialize_suggestion_model():
     """Initialize a separate Gemini model for suggestions."""
     try:
-        api_key = st.secrets["GEMINI_API_KEY"]
-        if not api_key:
+        backend = st.secrets.get("GEMINI_BACKEND", BACKEND_GEMINI)
+        api_keys = api_keys_from_secrets(st.secrets)
+        if not api_keys and backend != BACKEND_FAKE:
             st.error("API key not found in secrets.")
             return None
 
-        genai.configure(api_key=api_key)
+        genai = configure_backend(api_keys[0] if api_keys else None, backend)
 
         generation_config = {
             "temperature": 0.7,
@@ -760,8 +782,22 @@ def initialize_suggestion_model():
             "max_output_tokens": 8192,
         }
 
+        if len(api_keys) > 1:
+            # One model per key; suggestions go to the key with quota to spare
+            requests_per_minute, tokens_per_minute = rate_limits_from_secrets(st.secrets)
+            return build_pool(
+                api_keys,
+                [SUGGESTION_MODEL],
+                lambda index, api_key, model_name: KeyClient(api_key, backend).GenerativeModel(
+                    model_name=model_name,
+                    generation_config=generation_config,
+                ),
+                requests_per_minute,
+                tokens_per_minute
+            )
+
         model = genai.GenerativeModel(
-            model_name="gemini-pro",
+            model_name=SUGGESTION_MODEL,
             generation_config=generation_config,
         )
 
@@ -775,6 +811,7 @@ def get_suggestions_batch(model, responses, batch_size=10):
     suggestions = []
     total_time = 0
     batch_times = []
+    usage = UsageTracker()
     
     for i in range(0, len(responses), batch_size):
         batch = responses[i:min(i + batch_size, len(responses))]
@@ -785,11 +822,19 @@ def get_suggestions_batch(model, responses, batch_size=10):
         
         try:
             start_time = time.time()
-            response = model.generate_content(prompt)
+            response = call_with_retry(
+                lambda: model.generate_content(prompt),
+                limiter=get_rate_limiter(),
+                tokens=estimate_text_tokens(prompt) + 100 * len(batch),
+                breaker=get_shared_breaker()
+            )
             end_time = time.time()
             batch_time = end_time - start_time
             total_time += batch_time
             batch_times.append(batch_time)
+            # Pooled answers name the model of the key they were sent with
+            model_name = getattr(response, 'model_name', None) or model.model_name
+            usage.record(response_usage(response, model_name), kind="suggestion", items=len(batch))
             
             suggestions_text = response.text.split('\n')
             
@@ -815,8 +860,15 @@ def get_suggestions_batch(model, responses, batch_size=10):
         'total_time': total_time,
         'avg_time': total_time / len(batch_times) if batch_times else 0,
         'batch_times': batch_times,
-        'num_batches': len(batch_times)
+        'num_batches': len(batch_times),
+        'usage': usage.summary()
     }
+
+    # Token and cost accounting, per run and per user session
+    st.session_state.suggestion_usage_records = usage.records()
+    if 'user_usage' not in st.session_state:
+        st.session_state.user_usage = UsageTracker()
+    st.session_state.user_usage.extend(usage.records())
     
     return suggestions
 
@@ -989,7 +1041,8 @@ if 'results' in st.session_state and st.session_state.results:
     st.session_state.filtered_results = filtered_results
     
     # Display charts with filtered data
-    create_charts()
+    with span("summary", results=len(filtered_results)):
+        create_charts()
     
     # Display filtered experiences
     st.markdown(f'<h2 style="text-align: right;">التجارب <span class="number-badge total">{len(filtered_results)}</span></h2>', unsafe_allow_html=True)
@@ -1034,7 +1087,10 @@ if 'results' in st.session_state and st.session_state.results:
                                         f'تم توليد المقترحات بنجاح! \n\n'
                                         f'الوقت الإجمالي: {timing["total_time"]:.2f} ثانية\n'
                                         f'متوسط الوقت لكل دفعة: {timing["avg_time"]:.2f} ثانية\n'
-                                        f'عدد الدفعات: {timing["num_batches"]}'
+                                        f'عدد الدفعات: {timing["num_batches"]}\n'
+                                        f'الرموز المستهلكة: {timing["usage"]["prompt_tokens"]:,} إدخال و'
+                                        f'{timing["usage"]["output_tokens"]:,} إخراج\n'
+                                        f'التكلفة التقديرية: ${timing["usage"]["cost"]:.4f}'
                                     )
                                 else:
                                     st.success('تم توليد المقترحات بنجاح!')
@@ -1094,6 +1150,10 @@ if 'results' in st.session_state and st.session_state.results:
                             for row in worksheet.iter_rows(min_row=2):
                                 for cell in row:
                                     cell.alignment = Alignment(horizontal='right', vertical='center', wrap_text=True)
+
+                            # Tokens and estimated cost of the suggestion calls
+                            if st.session_state.get('suggestion_usage_records'):
+                                write_usage_sheet(st.session_state.suggestion_usage_records, writer)
                         
                         # Reset pointer and get value
                         output.seek(0)
@@ -1107,7 +1167,8 @@ if 'results' in st.session_state and st.session_state.results:
                             use_container_width=True
                         )
             
-            for exp in experiences:
-                display_experience(exp, type_name)
+            with span("render_cards", cards=len(experiences)):
+                for exp in experiences:
+                    display_experience(exp, type_name)
 else:
     st.warning("لا توجد نتائج للعرض. يرجى العودة إلى الصفحة الرئيسية وتحميل البيانات أولاً.") 
\ No newline at end of file
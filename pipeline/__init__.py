@@ -0,0 +1 @@
+"""Classification pipeline shared by the Streamlit pages."""
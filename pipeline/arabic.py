@@ -0,0 +1,35 @@
+"""Arabic-aware text normalization."""
+import re
+
+# Harakat, tanween, shadda, sukun and superscript alef
+_DIACRITICS = re.compile(r'[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed]')
+_TATWEEL = 'ـ'
+_CHAR_MAP = str.maketrans({
+    'أ': 'ا',
+    'إ': 'ا',
+    'آ': 'ا',
+    'ٱ': 'ا',
+    'ى': 'ي',
+    'ة': 'ه',
+    'ؤ': 'و',
+    'ئ': 'ي',
+    '٠': '0', '١': '1', '٢': '2', '٣': '3', '٤': '4',
+    '٥': '5', '٦': '6', '٧': '7', '٨': '8', '٩': '9',
+})
+_PUNCTUATION = re.compile(r'[^\w\s]|_')
+_REPEATED = re.compile(r'([^\W\d_])\1{2,}')
+
+
+def normalize_arabic(text):
+    """Normalize text so trivially different spellings compare equal.
+
+    Strips diacritics and tatweel, unifies alef/yaa/taa marbuta variants and
+    Arabic-Indic digits, drops punctuation, squeezes letters repeated three
+    or more times ("ممتااااز") and collapses whitespace.
+    """
+    text = str(text).replace(_TATWEEL, '')
+    text = _DIACRITICS.sub('', text)
+    text = text.translate(_CHAR_MAP).lower()
+    text = _PUNCTUATION.sub(' ', text)
+    text = _REPEATED.sub(r'\1', text)
+    return ' '.join(text.split())
@@ -0,0 +1,227 @@
+"""Background classification jobs that outlive Streamlit script reruns.
+
+A ``JobRunner`` owns the classification loop in its own worker threads.
+Pages submit a job and then only poll its status, so widget interactions
+or page switches never interrupt a run and no script thread is held for
+the whole classification.
+"""
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from pipeline.dedup import collapse_duplicates
+from pipeline.ratelimit import throttle_summary
+from pipeline.run import classify_responses
+
+DEFAULT_MAX_JOBS = 2  # Jobs classified at once; later submissions wait in a queue
+JOB_RETENTION_SECONDS = 3600  # Finished jobs nobody collected are dropped after this
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_FINISHED = "finished"
+STATUS_FAILED = "failed"
+
+
+class BackgroundJob:
+    """Live state of one job, written by its worker thread and read by pollers."""
+
+    def __init__(self, job_id, responses, max_workers):
+        self.job_id = job_id
+        self.responses = responses
+        self.max_workers = max_workers
+        self.status = STATUS_QUEUED
+        self.completed_batches = 0
+        self.total_batches = 0
+        self.live_results = []  # Row-level results in completion order
+        self.type_counts = {}
+        self.batch_times = []
+        self.last_classifications = []
+        self.results = None
+        self.stats = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            self.status = STATUS_RUNNING
+            self.started_at = time.time()
+
+    def planned(self, total_batches):
+        """Set the batch total once the responses left for the model are planned."""
+        with self._lock:
+            self.total_batches = total_batches
+
+    def add_results(self, results):
+        with self._lock:
+            self.live_results.extend(results)
+            for result in results:
+                type_ = result['classification'].get('type', '')
+                self.type_counts[type_] = self.type_counts.get(type_, 0) + 1
+
+    def batch_done(self, outcome, completed):
+        with self._lock:
+            self.completed_batches = completed
+            self.batch_times.extend(outcome['batch_times'])
+            self.last_classifications = outcome['classifications']
+
+    def finish(self, results, stats):
+        with self._lock:
+            self.results = results
+            self.stats = stats
+            self.status = STATUS_FINISHED
+            self.finished_at = time.time()
+
+    def fail(self, error):
+        with self._lock:
+            self.error = error
+            self.status = STATUS_FAILED
+            self.finished_at = time.time()
+
+    def eta_seconds(self):
+        """Remaining time from the observed batch times and the batches in flight."""
+        remaining = self.total_batches - self.completed_batches
+        if not self.batch_times:
+            return None
+        if remaining <= 0:
+            return 0
+        avg_time = sum(self.batch_times) / len(self.batch_times)
+        return avg_time * remaining / min(self.max_workers, remaining)
+
+    def snapshot(self, preview_limit):
+        """Copy of the state safe to read from another thread."""
+        with self._lock:
+            end = self.finished_at or time.time()
+            return {
+                'job_id': self.job_id,
+                'status': self.status,
+                'num_responses': len(self.responses),
+                'completed_batches': self.completed_batches,
+                'total_batches': self.total_batches,
+                'num_results': len(self.live_results),
+                'preview': list(self.live_results[-preview_limit:]) if preview_limit else [],
+                'type_counts': dict(self.type_counts),
+                'eta_seconds': self.eta_seconds(),
+                'last_classifications': list(self.last_classifications),
+                'results': self.results,
+                'stats': self.stats,
+                'error': self.error,
+                'elapsed': end - self.started_at if self.started_at else 0,
+            }
+
+
+class JobRunner:
+    """In-process registry of background jobs and the threads that run them."""
+
+    def __init__(self, max_jobs=DEFAULT_MAX_JOBS):
+        self._pool = ThreadPoolExecutor(max_workers=max(1, int(max_jobs)), thread_name_prefix="classification-job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, job_id, responses, classify_fn, job_store=None, limiter=None, usage=None, hedger=None,
+               max_workers=1, **run_kwargs):
+        """Queue ``responses`` for classification under ``job_id``.
+
+        ``run_kwargs`` are passed to ``classify_responses`` (cache, lexicon,
+        planner, batch_size). With a ``job_store`` every completed batch is
+        checkpointed so the job can be resumed after a restart. The calls
+        ``classify_fn`` records in the ``usage`` tracker are added to the
+        final stats as ``usage`` totals and ``usage_records``, and the
+        counters of a ``hedger`` wrapping ``classify_fn`` as ``hedging``.
+        Submitting a job that is already queued or running is a no-op.
+        """
+        with self._lock:
+            self._prune()
+            existing = self._jobs.get(job_id)
+            if existing is not None and existing.status in (STATUS_QUEUED, STATUS_RUNNING):
+                return job_id
+            job = BackgroundJob(job_id, responses, max_workers)
+            self._jobs[job_id] = job
+        self._pool.submit(self._run, job, classify_fn, job_store, limiter, usage, hedger, run_kwargs)
+        return job_id
+
+    def _run(self, job, classify_fn, job_store, limiter, usage, hedger, run_kwargs):
+        # Map each distinct response back to all of its rows so live
+        # counters reflect rows, not unique texts
+        unique_responses, row_groups = collapse_duplicates(job.responses)
+        rows_by_response = {
+            str(representative): [job.responses[row] for row in rows]
+            for representative, rows in zip(unique_responses, row_groups)
+        }
+        # The batch total is known once resumed, local and cached responses
+        # are removed, from the list the engine actually plans
+        job.start()
+
+        def add_live_results(results):
+            job.add_results([
+                {"response": response, "classification": result['classification']}
+                for result in results
+                for response in rows_by_response.get(str(result['response']), [result['response']])
+            ])
+
+        def on_cached(results):
+            if job_store is not None:
+                job_store.checkpoint(job.job_id, results)
+            add_live_results(results)
+
+        def on_batch_done(index, outcome, completed, total):
+            if job_store is not None:
+                job_store.checkpoint(job.job_id, outcome['results'])
+            add_live_results(outcome['results'])
+            job.batch_done(outcome, completed)
+
+        limiter_before = limiter.snapshot() if limiter is not None else None
+        try:
+            results, stats = classify_responses(
+                job.responses,
+                classify_fn,
+                job_store=job_store,
+                job_id=job.job_id,
+                max_workers=job.max_workers,
+                on_batch_done=on_batch_done,
+                on_planned=job.planned,
+                on_cached=on_cached,
+                on_local=on_cached,
+                on_resumed=add_live_results,
+                **run_kwargs
+            )
+            if limiter is not None:
+                # Includes throttling caused by other jobs sharing the limiter
+                stats['throttling'] = throttle_summary(limiter_before, limiter.snapshot())
+            if usage is not None:
+                stats['usage_records'] = usage.records()
+                stats['usage'] = usage.summary()
+            if hedger is not None:
+                stats['hedging'] = hedger.summary()
+            job.finish(results, stats)
+        except Exception as e:
+            traceback.print_exc()
+            job.fail(str(e))
+
+    def status(self, job_id, preview_limit=0):
+        """Snapshot of a job, or None if the runner does not know it."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        return job.snapshot(preview_limit) if job is not None else None
+
+    def is_active(self, job_id):
+        """Whether a job is queued or running in this process."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        return job is not None and job.status in (STATUS_QUEUED, STATUS_RUNNING)
+
+    def forget(self, job_id):
+        """Drop a finished job once its results have been collected."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job.status in (STATUS_FINISHED, STATUS_FAILED):
+                del self._jobs[job_id]
+
+    def _prune(self):
+        cutoff = time.time() - JOB_RETENTION_SECONDS
+        for job_id, job in list(self._jobs.items()):
+            if job.finished_at is not None and job.finished_at < cutoff:
+                del self._jobs[job_id]
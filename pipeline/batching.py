@@ -0,0 +1,79 @@
+"""Token-budget batch planning."""
+import math
+
+CHARS_PER_TOKEN = 3  # Rough ratio for Arabic text with Gemini tokenizers
+PROMPT_ITEM_OVERHEAD = 8  # "response_N: " prefix and "---" separator
+OUTPUT_ITEM_OVERHEAD = 120  # JSON skeleton, labels and explanation per item
+COMPACT_OUTPUT_ITEM_TOKENS = 20  # One {"i", "t", "c", "s"} object in the compact schema
+
+DEFAULT_INPUT_TOKEN_BUDGET = 6000
+DEFAULT_OUTPUT_TOKEN_BUDGET = 7000  # Headroom below max_output_tokens=8192
+DEFAULT_MAX_ITEMS = 80
+
+
+def estimate_text_tokens(text):
+    """Approximate token count of a piece of text."""
+    return math.ceil(len(str(text)) / CHARS_PER_TOKEN)
+
+def estimate_input_tokens(text):
+    """Approximate prompt tokens one response adds to a batch."""
+    return estimate_text_tokens(text) + PROMPT_ITEM_OVERHEAD
+
+def estimate_output_tokens(text):
+    """Approximate output tokens the model spends on one response."""
+    # The model echoes the response text back alongside its classification
+    return estimate_text_tokens(text) + OUTPUT_ITEM_OVERHEAD
+
+def estimate_compact_output_tokens(text):
+    """Output tokens per response in the compact schema, whatever its length."""
+    return COMPACT_OUTPUT_ITEM_TOKENS
+
+def plan_batches(responses, input_budget=DEFAULT_INPUT_TOKEN_BUDGET,
+                 output_budget=DEFAULT_OUTPUT_TOKEN_BUDGET, max_items=DEFAULT_MAX_ITEMS,
+                 estimate_output=estimate_output_tokens):
+    """Pack responses, in order, into batches that fill the token budgets.
+
+    A batch is closed as soon as adding the next response would exceed the
+    input or output budget or ``max_items``. A response too large for any
+    budget on its own gets a batch to itself. ``estimate_output`` gives the
+    output tokens of one response under the output schema in use.
+    """
+    batches = []
+    current = []
+    input_tokens = 0
+    output_tokens = 0
+    for response in responses:
+        item_input = estimate_input_tokens(response)
+        item_output = estimate_output(response)
+        if current and (
+            input_tokens + item_input > input_budget
+            or output_tokens + item_output > output_budget
+            or len(current) >= max_items
+        ):
+            batches.append(current)
+            current = []
+            input_tokens = 0
+            output_tokens = 0
+        current.append(response)
+        input_tokens += item_input
+        output_tokens += item_output
+    if current:
+        batches.append(current)
+    return batches
+
+def summarize_plan(batches, estimate_output=estimate_output_tokens):
+    """Summary numbers for a batch plan, for display before a run starts.
+
+    Pass the ``estimate_output`` the plan was made with (e.g.
+    ``estimate_compact_output_tokens``) so output use is not overstated.
+    """
+    sizes = [len(batch) for batch in batches]
+    return {
+        'num_batches': len(batches),
+        'num_responses': sum(sizes),
+        'avg_batch_size': sum(sizes) / len(sizes) if sizes else 0,
+        'max_output_tokens': max(
+            (sum(estimate_output(r) for r in batch) for batch in batches),
+            default=0
+        ),
+    }
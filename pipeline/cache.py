@@ -0,0 +1,167 @@
+"""Persistent content-addressed cache of classification results."""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+DEFAULT_MAX_ENTRIES = 100000  # LRU eviction kicks in above this many rows
+
+
+def normalize_text(text):
+    """Normalize response text before hashing (trim and collapse whitespace)."""
+    return ' '.join(str(text).split())
+
+def taxonomy_fingerprint(path):
+    """Hash the taxonomy file so cached labels are invalidated when it changes."""
+    return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+
+
+class ClassificationCache:
+    """SQLite-backed cache keyed by response text, model name and taxonomy.
+
+    Entries are evicted least-recently-used first once ``max_entries`` is
+    exceeded. Safe to share between threads and Streamlit sessions.
+    """
+
+    def __init__(self, path, model_name, taxonomy_hash, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.namespace = f"{model_name}\0{taxonomy_hash}"
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS classifications ("
+            " key TEXT PRIMARY KEY,"
+            " classification TEXT NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_classifications_last_used"
+            " ON classifications (last_used)"
+        )
+        self._conn.commit()
+
+    def key(self, text):
+        """Cache key for a response under this model and taxonomy."""
+        payload = f"{self.namespace}\0{normalize_text(text)}"
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get_many(self, texts):
+        """Return {text: classification} for every cached text."""
+        keys = {self.key(text): text for text in texts}
+        found = {}
+        with self._lock:
+            key_list = list(keys)
+            for i in range(0, len(key_list), 500):
+                chunk = key_list[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, classification FROM classifications WHERE key IN ({placeholders})",
+                    chunk
+                ).fetchall()
+                for key, classification in rows:
+                    found[keys[key]] = json.loads(classification)
+                if rows:
+                    now = time.time()
+                    self._conn.executemany(
+                        "UPDATE classifications SET last_used = ? WHERE key = ?",
+                        [(now, key) for key, _ in rows]
+                    )
+            self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def contains_many(self, texts):
+        """Return the subset of texts that are cached, without touching LRU order."""
+        keys = {self.key(text): text for text in texts}
+        found = set()
+        with self._lock:
+            key_list = list(keys)
+            for i in range(0, len(key_list), 500):
+                chunk = key_list[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key FROM classifications WHERE key IN ({placeholders})",
+                    chunk
+                ).fetchall()
+                found.update(keys[key] for (key,) in rows)
+        return found
+
+    def put_many(self, items):
+        """Store (text, classification) pairs and evict the least recently used."""
+        now = time.time()
+        rows = [
+            (self.key(text), json.dumps(classification, ensure_ascii=False), now)
+            for text, classification in items
+        ]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO classifications (key, classification, last_used)"
+                " VALUES (?, ?, ?)",
+                rows
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        count = self._conn.execute("SELECT COUNT(*) FROM classifications").fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM classifications WHERE key IN ("
+                " SELECT key FROM classifications ORDER BY last_used ASC LIMIT ?)",
+                (overflow,)
+            )
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM classifications").fetchone()[0]
+
+    def hit_rate(self):
+        """Fraction of lookups served from the cache since creation."""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+def classify_with_cache(responses, cache, classify_fn, on_cached=None):
+    """Classify responses, sending only cache misses to ``classify_fn``.
+
+    ``classify_fn(misses)`` must return ``(results, stats)`` like
+    ``classify_concurrently``. ``on_cached(results)`` receives the cache
+    hits before any miss is sent. Returns ``(results, stats)`` in input
+    order with ``cache_hits`` and ``cache_misses`` added to the stats.
+    """
+    unique_texts = list(dict.fromkeys(str(r) for r in responses))
+    cached = cache.get_many(unique_texts) if cache is not None else {}
+    if on_cached and cached:
+        on_cached([
+            {"response": response, "classification": cached[str(response)]}
+            for response in responses
+            if str(response) in cached
+        ])
+
+    misses = [r for r in responses if str(r) not in cached]
+    new_results, stats = classify_fn(misses)
+
+    classified = {str(r['response']): r['classification'] for r in new_results}
+    if cache is not None:
+        cache.put_many(classified.items())
+    classified.update(cached)
+
+    results = [
+        {"response": response, "classification": classified[str(response)]}
+        for response in responses
+        if str(response) in classified
+    ]
+    stats = dict(stats)
+    stats['cache_hits'] = len(responses) - len(misses)
+    stats['cache_misses'] = len(misses)
+    return results, stats
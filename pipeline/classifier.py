@@ -0,0 +1,275 @@
+"""Gemini batch classification helpers (no Streamlit dependency)."""
+import re
+import threading
+import time
+
+from pipeline.batching import estimate_compact_output_tokens, estimate_input_tokens, estimate_output_tokens
+from pipeline.jsonstream import JsonArrayStream
+from pipeline.ratelimit import call_with_retry
+from pipeline.tracing import record_span, span
+from pipeline.usage import response_usage
+
+# Accepted spellings for each sentiment type returned by the model
+TYPE_ALIASES = {
+    'إيجابي': 'إيجابي',
+    'ايجابي': 'إيجابي',
+    'ايجابية': 'إيجابي',
+    'إيجابية': 'إيجابي',
+    'سلبي': 'سلبي',
+    'سلبية': 'سلبي',
+    'محايد': 'محايد',
+    'محايدة': 'محايد',
+}
+DEFAULT_TYPE = 'محايد'
+
+MODEL_NAME = "gemini-2.0-flash-exp"
+
+GENERATION_CONFIG = {
+    "temperature": 0,
+    "top_p": 0.95,
+    "top_k": 40,
+    "max_output_tokens": 8192,
+    "response_mime_type": "application/json",
+}
+
+SYSTEM_INSTRUCTION = (
+    "You MUST return responses in the following JSON array format EXACTLY:\n"
+    "[\n"
+    "    {\n"
+    '        "id": "the response_N label the response was given",\n'
+    '        "response": "the original response text",\n'
+    '        "classification": {\n'
+    '            "type": "one of: إيجابي, سلبي, محايد",\n'
+    '            "category": "main category",\n'
+    '            "subcategory": "subcategory",\n'
+    '            "explanation": "reasoning for the classification"\n'
+    "        }\n"
+    "    }\n"
+    "]\n\n"
+    "Rules:\n"
+    "1. The response MUST be a valid JSON array, even for single items\n"
+    "2. All classification fields MUST be in Arabic\n"
+    "3. The type field MUST be exactly one of: إيجابي, سلبي, محايد\n"
+    "4. Use 'خطأ' for category and subcategory if the response is invalid or unrelated\n"
+    "5. Each response MUST include all required fields\n"
+    "6. The JSON structure MUST match exactly as shown above\n"
+    "7. Return exactly one item per response, with its response_N label in the id field\n"
+)
+
+CLASSIFY_PROMPT = "Please analyze and classify the following responses:"
+
+
+class StatelessSession:
+    """Drop-in replacement for a chat session that keeps no history.
+
+    Every ``send_message`` is an independent ``generate_content`` request
+    carrying only the taxonomy context and the current batch, so request
+    size stays constant however many batches were sent before. The model
+    handle holds no per-call state, so one instance can be shared by all
+    worker threads.
+    """
+
+    def __init__(self, model, context_parts):
+        self.model = model
+        self.context_parts = list(context_parts)
+
+    def send_message(self, text, stream=False):
+        return self.model.generate_content(self.context_parts + [text], stream=stream)
+
+
+def format_batch(responses_batch):
+    """Format a batch of responses as the prompt text sent to the model."""
+    return "\n---\n".join([f"response_{i+1}: {str(r)}" for i, r in enumerate(responses_batch)])
+
+def normalize_type(type_value):
+    """Map a type returned by the model onto one of the known types."""
+    return TYPE_ALIASES.get(str(type_value or '').strip(), DEFAULT_TYPE)
+
+def validate_classifications(classifications):
+    """Keep well-formed classifications and normalize their fields."""
+    validated_results = []
+    for classification in classifications:
+        if not isinstance(classification, dict):
+            continue
+
+        if 'classification' not in classification:
+            continue
+        if 'response' not in classification and 'id' not in classification:
+            continue
+
+        class_data = classification.get('classification', {})
+        if not isinstance(class_data, dict):
+            continue
+
+        result = {
+            'id': classification.get('id'),
+            'response': str(classification.get('response', '')).strip(),
+            'classification': {
+                'type': normalize_type(class_data.get('type', '')),
+                'category': str(class_data.get('category', 'خطأ')).strip(),
+                'subcategory': str(class_data.get('subcategory', 'خطأ')).strip(),
+                'explanation': str(class_data.get('explanation', '')).strip()
+            }
+        }
+
+        if result['response'] or result['id'] is not None:
+            validated_results.append(result)
+    return validated_results
+
+def parse_item_id(value):
+    """Extract the 1-based item number from ids like "response_3" or 3."""
+    if value is None:
+        return None
+    match = re.search(r'\d+', str(value))
+    return int(match.group()) if match else None
+
+def align_by_id(responses_batch, classifications):
+    """Match classifications to the batch by id, one slot per response.
+
+    Returns a list as long as the batch with ``None`` for every response
+    the model dropped. Items without a usable id are matched on their
+    echoed response text instead; they are never matched by position, so
+    dropped, reordered or merged items cannot shift labels onto the wrong
+    responses.
+    """
+    aligned = [None] * len(responses_batch)
+    unmatched = []
+    for classification in classifications:
+        item_id = parse_item_id(classification.get('id'))
+        if item_id is not None and 1 <= item_id <= len(aligned) and aligned[item_id - 1] is None:
+            aligned[item_id - 1] = classification
+        else:
+            unmatched.append(classification)
+
+    if unmatched:
+        positions_by_text = {}
+        for position, response in enumerate(responses_batch):
+            positions_by_text.setdefault(' '.join(str(response).split()), []).append(position)
+        for classification in unmatched:
+            for position in positions_by_text.get(' '.join(classification['response'].split()), []):
+                if aligned[position] is None:
+                    aligned[position] = classification
+                    break
+    return aligned
+
+def stream_classifications(chat_session, batch_text):
+    """Send a batch with streaming and parse array elements as they arrive.
+
+    Returns ``(parser, usage)``: the finished ``JsonArrayStream``, whose
+    complete elements are kept even when the output is truncated or partly
+    malformed, and the call's ``response_usage``.
+    """
+    parser = JsonArrayStream()
+    parse_time = 0
+    response = chat_session.send_message(batch_text, stream=True)
+    for chunk in response:
+        try:
+            text = chunk.text
+        except ValueError:
+            # Chunks without text parts (e.g. only a finish reason)
+            continue
+        parse_start = time.perf_counter()
+        parser.feed(text)
+        parse_time += time.perf_counter() - parse_start
+    parse_start = time.perf_counter()
+    parser.finish()
+    parse_time += time.perf_counter() - parse_start
+    # Parsing is interleaved with the stream, so its time is summed separately
+    record_span("parse", parse_time, items=len(parser.items), complete=parser.complete)
+    # Pooled answers name the model of the key they were sent with
+    model_name = getattr(response, 'model_name', None) or getattr(getattr(chat_session, 'model', None),
+                                                                 'model_name', MODEL_NAME)
+    return parser, response_usage(response, model_name)
+
+def estimate_batch_tokens(responses_batch, compact=False):
+    """Estimated prompt plus output tokens of one batch request."""
+    estimate_output = estimate_compact_output_tokens if compact else estimate_output_tokens
+    return sum(estimate_input_tokens(r) + estimate_output(r) for r in responses_batch)
+
+def classify_batch(chat_session, responses_batch, limiter=None, codes=None, usage=None, breaker=None,
+                   taxonomy=None):
+    """Classify a batch of responses and return (classifications, batch_time).
+
+    ``classifications`` has one entry per response, matched by id, with
+    ``None`` for responses missing from the model's answer. With ``codes``
+    (a ``TaxonomyCodes``) the session is expected to answer in the compact
+    schema, which is expanded back to full classifications. Tokens, finish
+    reason and cost of the call are recorded in ``usage`` (a
+    ``UsageTracker``) when given. With a ``breaker`` (a ``CircuitBreaker``)
+    the call fails fast with ``CircuitOpen`` while the API keeps failing.
+    With a ``taxonomy`` (a ``TaxonomyIndex``) near-miss labels are snapped
+    to valid ones and invalid ones come back as ``None``, like dropped
+    items, so only those are requested again.
+
+    The call goes through ``limiter`` and is retried with backoff on rate
+    limits and transient errors. The answer is streamed and parsed element
+    by element, so every complete element survives truncated or malformed
+    output. Raises an exception when the model call fails or no element
+    can be parsed at all, so callers can decide how to fall back.
+    """
+    with span("prompt_build", batch_size=len(responses_batch)):
+        batch_text = format_batch(responses_batch)
+
+    # Time the model response
+    start_time = time.perf_counter()
+    with span("model_call", batch_size=len(responses_batch)) as attributes:
+        parser, call_usage = call_with_retry(
+            lambda: stream_classifications(chat_session, batch_text),
+            limiter=limiter,
+            tokens=estimate_batch_tokens(responses_batch, compact=codes is not None),
+            breaker=breaker
+        )
+        attributes['output_tokens'] = call_usage['output_tokens']
+    batch_time = time.perf_counter() - start_time
+    if usage is not None:
+        usage.record(call_usage, items=len(responses_batch))
+
+    if not parser.items:
+        if not parser.text.strip():
+            raise ValueError("Empty response from model")
+        raise ValueError("Invalid JSON structure: no complete classification in model output")
+    if not parser.complete:
+        print(f"Recovered {len(parser.items)} partial results from malformed output")
+
+    with span("validate", items=len(parser.items)) as attributes:
+        classifications = (
+            codes.expand_all(parser.items) if codes is not None else validate_classifications(parser.items)
+        )
+        aligned = align_by_id(responses_batch, classifications)
+        # Compact codes are checked against the taxonomy when expanded
+        if taxonomy is not None and codes is None:
+            aligned, attributes['snapped'], attributes['invalid'] = taxonomy.validate_all(aligned)
+            if attributes['invalid']:
+                print(f"{attributes['invalid']} classifications with labels outside the taxonomy")
+    return aligned, batch_time
+
+def make_batch_classifier(session, session_factory=None, limiter=None, codes=None, usage=None, breaker=None,
+                          taxonomy=None):
+    """Return a thread-safe ``classify_fn(batch)`` for the given session.
+
+    Stateless sessions are shared directly; chat sessions are cloned per
+    worker thread through ``session_factory``. Pass the session's
+    ``codes`` when it uses the compact output schema, a ``usage`` tracker
+    to account every call's tokens and cost, a circuit ``breaker`` to
+    stop calling an API that keeps failing, and a ``taxonomy`` index to
+    snap near-miss labels.
+    """
+    if isinstance(session, StatelessSession) or session_factory is None:
+        return lambda responses_batch: classify_batch(session, responses_batch, limiter, codes, usage, breaker,
+                                                      taxonomy)
+    return thread_local_classifier(session_factory, limiter, codes, usage, breaker, taxonomy)
+
+def thread_local_classifier(session_factory, limiter=None, codes=None, usage=None, breaker=None, taxonomy=None):
+    """Build a batch classifier that gives each worker thread its own chat session.
+
+    Chat sessions keep mutable history and are not safe to share between
+    threads, so every worker lazily opens its own from ``session_factory``.
+    """
+    local = threading.local()
+
+    def classify(responses_batch):
+        if getattr(local, 'session', None) is None:
+            local.session = session_factory()
+        return classify_batch(local.session, responses_batch, limiter, codes, usage, breaker, taxonomy)
+
+    return classify
@@ -0,0 +1,106 @@
+"""Compact, index-only output schema for classification answers.
+
+Instead of echoing every response with a full Arabic classification and
+explanation, the model answers with one short object per response::
+
+    [{"i": 3, "t": 1, "c": 2, "s": 1}]
+
+``i`` is the N of the ``response_N`` label and ``t``/``c``/``s`` are
+numeric codes for the type, category and subcategory, listed for the
+model in a code table generated from the taxonomy file. The codes are
+expanded back to the taxonomy's names locally, so output tokens no longer
+grow with the length of the responses.
+"""
+import yaml
+
+SCHEMA_FULL = "full"
+SCHEMA_COMPACT = "compact"
+SCHEMA_TAG = "compact-v1"  # Marks the instruction so backends can tell the schemas apart
+UNRELATED = 'خطأ'
+DEFAULT_TYPES = ['إيجابي', 'سلبي', 'محايد']
+
+COMPACT_SYSTEM_INSTRUCTION = (
+    "You MUST return responses as a JSON array with one object per response, EXACTLY in this format:\n"
+    '[\n    {"i": 1, "t": 1, "c": 2, "s": 3}\n]\n\n'
+    "Rules:\n"
+    "1. The response MUST be a valid JSON array, even for single items\n"
+    "2. i is the number N of the response_N label the response was given\n"
+    "3. t, c and s are the type, category and subcategory codes from the code table\n"
+    "4. Use c = 0 and s = 0 if the response is invalid or unrelated\n"
+    "5. Do NOT repeat the response text and do NOT add any other field\n"
+    "6. Return exactly one object per response\n"
+    f"Output schema: {SCHEMA_TAG}\n"
+)
+
+
+class TaxonomyCodes:
+    """Numeric codes for the types, categories and subcategories of a taxonomy.
+
+    Codes are 1-based positions in the taxonomy file, subcategories being
+    numbered within their category; 0 stands for 'خطأ'.
+    """
+
+    def __init__(self, categories, types=None):
+        self.types = list(types or DEFAULT_TYPES)
+        self.categories = [
+            (category, list((info or {}).get('subcategories', []) or []))
+            for category, info in (categories or {}).items()
+        ]
+
+    @classmethod
+    def from_text(cls, text):
+        data = yaml.safe_load(text) or {}
+        return cls(data.get('categories', {}), data.get('types'))
+
+    @classmethod
+    def from_file(cls, path):
+        """Codes for a taxonomy YAML file like data/Classes.txt."""
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls.from_text(f.read())
+
+    def legend(self):
+        """Code table sent to the model alongside the taxonomy file."""
+        lines = ["Code table:", "t (type): " + ", ".join(f"{i}={t}" for i, t in enumerate(self.types, 1))]
+        lines.append(f"c (category) / s (subcategory): 0/0={UNRELATED}")
+        for c, (category, subcategories) in enumerate(self.categories, 1):
+            codes = ", ".join(f"{s}={subcategory}" for s, subcategory in enumerate(subcategories, 1))
+            lines.append(f"c={c} {category}: s {codes}")
+        return "\n".join(lines)
+
+    def encode(self, classification):
+        """Compact codes ``(t, c, s)`` of a full classification (0 for unknown names)."""
+        t = self.types.index(classification['type']) + 1 if classification['type'] in self.types else 0
+        for c, (category, subcategories) in enumerate(self.categories, 1):
+            if category == classification['category'] and classification['subcategory'] in subcategories:
+                return t, c, subcategories.index(classification['subcategory']) + 1
+        return t, 0, 0
+
+    def expand(self, item):
+        """Full validated item for a compact one, or None if its codes are invalid."""
+        try:
+            index, t, c, s = (int(item[key]) for key in ('i', 't', 'c', 's'))
+        except (KeyError, TypeError, ValueError):
+            return None
+        if not 1 <= t <= len(self.types):
+            return None
+        if c == 0 and s == 0:
+            category = subcategory = UNRELATED
+        elif 1 <= c <= len(self.categories) and 1 <= s <= len(self.categories[c - 1][1]):
+            category, subcategories = self.categories[c - 1]
+            subcategory = subcategories[s - 1]
+        else:
+            return None
+        return {
+            'id': index,
+            'response': '',
+            'classification': {
+                'type': self.types[t - 1],
+                'category': category,
+                'subcategory': subcategory,
+            },
+        }
+
+    def expand_all(self, items):
+        """Expand the parsed compact items, dropping malformed ones."""
+        expanded = (self.expand(item) for item in items if isinstance(item, dict))
+        return [item for item in expanded if item is not None]
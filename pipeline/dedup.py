@@ -0,0 +1,47 @@
+"""Collapse duplicate responses so each distinct text is classified once."""
+from pipeline.arabic import normalize_arabic
+
+
+def collapse_duplicates(responses):
+    """Group responses that are equal after Arabic normalization.
+
+    Returns ``(unique_responses, row_groups)`` where ``unique_responses``
+    holds the first original of each group and ``row_groups[i]`` lists the
+    input indices sharing ``unique_responses[i]``'s normalized form.
+    """
+    group_of = {}
+    unique_responses = []
+    row_groups = []
+    for index, response in enumerate(responses):
+        key = normalize_arabic(response)
+        if key not in group_of:
+            group_of[key] = len(unique_responses)
+            unique_responses.append(response)
+            row_groups.append([])
+        row_groups[group_of[key]].append(index)
+    return unique_responses, row_groups
+
+def classify_deduplicated(responses, classify_fn):
+    """Classify each distinct response once and fan results back out.
+
+    ``classify_fn(unique_responses)`` must return ``(results, stats)``.
+    Every original row gets the classification of its group, keeping its
+    own response text. Adds ``unique_responses`` and
+    ``duplicates_collapsed`` to the stats.
+    """
+    unique_responses, row_groups = collapse_duplicates(responses)
+    unique_results, stats = classify_fn(unique_responses)
+
+    classified = {str(r['response']): r['classification'] for r in unique_results}
+    row_results = [None] * len(responses)
+    for representative, rows in zip(unique_responses, row_groups):
+        classification = classified.get(str(representative))
+        if classification is None:
+            continue
+        for row in rows:
+            row_results[row] = {"response": responses[row], "classification": classification}
+
+    stats = dict(stats)
+    stats['unique_responses'] = len(unique_responses)
+    stats['duplicates_collapsed'] = len(responses) - len(unique_responses)
+    return [r for r in row_results if r is not None], stats
@@ -0,0 +1,153 @@
+"""Concurrent batch classification engine."""
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from pipeline.ratelimit import RetriesExhausted
+from pipeline.resilience import latency_percentiles
+from pipeline.tracing import span
+
+DEFAULT_MAX_WORKERS = 4  # Number of batches in flight at once
+MAX_GAP_FILL_ROUNDS = 2  # Follow-up requests for items missing from an answer
+
+
+def split_batches(responses, batch_size):
+    """Split responses into consecutive batches of at most batch_size items."""
+    batch_size = max(1, int(batch_size))
+    return [responses[i:i + batch_size] for i in range(0, len(responses), batch_size)]
+
+def _classify_positions(classify_fn, batch, positions, outcome, gap_rounds):
+    """Classify ``batch[p] for p in positions`` and return {position: classification}.
+
+    Items the model leaves out of its answer are re-requested on their own
+    in a follow-up batch (up to ``gap_rounds`` times). A request that raises
+    is split in halves until the bad items are isolated; only those are
+    marked as failed.
+    """
+    items = [batch[p] for p in positions]
+    try:
+        classifications, batch_time = classify_fn(items)
+        outcome['batch_times'].append(batch_time)
+    except RetriesExhausted as e:
+        # Still throttled after backing off: splitting the batch into more
+        # requests would only make the throttling worse
+        outcome['errors'].append(str(e))
+        outcome['failed'].extend(items)
+        return {}
+    except Exception as e:
+        if len(positions) == 1:
+            outcome['errors'].append(f"Error processing single response: {e}")
+            outcome['failed'].extend(items)
+            return {}
+        outcome['errors'].append(str(e))
+        classified = {}
+        middle = len(positions) // 2
+        for half in (positions[:middle], positions[middle:]):
+            outcome['recovery_calls'] += 1
+            classified.update(_classify_positions(classify_fn, batch, half, outcome, gap_rounds))
+        return classified
+
+    classified = {}
+    missing = []
+    for position, classification in zip(positions, classifications):
+        if classification is None:
+            missing.append(position)
+        else:
+            classified[position] = classification
+    if missing:
+        if gap_rounds > 0:
+            outcome['gap_fill_calls'] += 1
+            classified.update(_classify_positions(classify_fn, batch, missing, outcome, gap_rounds - 1))
+        else:
+            outcome['failed'].extend(batch[p] for p in missing)
+    return classified
+
+def _run_batch(classify_fn, batch):
+    """Classify one batch, recovering from gaps and failures."""
+    outcome = {
+        'batch_times': [],
+        'errors': [],
+        'failed': [],
+        'recovery_calls': 0,
+        'gap_fill_calls': 0,
+    }
+    classified = _classify_positions(classify_fn, batch, list(range(len(batch))), outcome, MAX_GAP_FILL_ROUNDS)
+    pairs = [(batch[p], classified[p]) for p in sorted(classified)]
+
+    results = []
+    for response, classification in pairs:
+        if classification and isinstance(classification, dict):
+            results.append({
+                "response": response,
+                "classification": classification.get('classification', {})
+            })
+    outcome['results'] = results
+    outcome['classifications'] = [c for _, c in pairs]
+    return outcome
+
+def classify_concurrently(responses, classify_fn, batch_size, max_workers=DEFAULT_MAX_WORKERS,
+                          on_batch_done=None, planner=None, on_planned=None):
+    """Classify responses with up to max_workers batches in flight.
+
+    ``classify_fn(batch)`` must return ``(classifications, batch_time)``
+    with one entry per item of the batch, ``None`` where the model gave no
+    answer for that item. Batches are consecutive slices of
+    ``batch_size`` items, or whatever ``planner(responses)`` returns when a
+    planner is given. ``on_batch_done(index, outcome, completed, total)``
+    is called from the calling thread as each batch finishes, in
+    completion order, and ``on_planned(total)`` once the batches are
+    planned, before any is sent. Results are always reassembled in input
+    order.
+
+    Returns ``(results, stats)``.
+    """
+    batches = planner(responses) if planner else split_batches(responses, batch_size)
+    if on_planned:
+        on_planned(len(batches))
+    outcomes = [None] * len(batches)
+    total_start_time = time.perf_counter()
+
+    if batches:
+        with ThreadPoolExecutor(max_workers=max(1, int(max_workers))) as pool:
+            futures = {
+                pool.submit(_run_batch, classify_fn, batch): index
+                for index, batch in enumerate(batches)
+            }
+            completed = 0
+            for future in as_completed(futures):
+                index = futures[future]
+                outcomes[index] = future.result()
+                completed += 1
+                if on_batch_done:
+                    on_batch_done(index, outcomes[index], completed, len(batches))
+
+    total_time = time.perf_counter() - total_start_time
+
+    results = []
+    batch_times = []
+    errors = []
+    failed = []
+    recovery_calls = 0
+    gap_fill_calls = 0
+    with span("assemble", batches=len(outcomes)):
+        for outcome in outcomes:
+            results.extend(outcome['results'])
+            batch_times.extend(outcome['batch_times'])
+            errors.extend(outcome['errors'])
+            failed.extend(outcome['failed'])
+            recovery_calls += outcome['recovery_calls']
+            gap_fill_calls += outcome['gap_fill_calls']
+
+    stats = {
+        'total_time': total_time,
+        'batch_times': batch_times,
+        'avg_batch_time': sum(batch_times) / len(batch_times) if batch_times else 0,
+        'batch_latency': latency_percentiles(batch_times),
+        'num_batches': len(batches),
+        'max_workers': max_workers,
+        'throughput': len(responses) / total_time if total_time > 0 else 0,
+        'errors': errors,
+        'failed_responses': failed,
+        'recovery_calls': recovery_calls,
+        'gap_fill_calls': gap_fill_calls,
+    }
+    return results, stats
@@ -0,0 +1,201 @@
+"""Excel export of classification results."""
+import io
+
+import pandas as pd
+from openpyxl.chart import PieChart, BarChart, Reference
+from openpyxl.styles import Alignment, PatternFill, Font
+
+from pipeline.tracing import span
+from pipeline.usage import summarize_usage
+
+TYPE_ORDER = ['إيجابي', 'سلبي', 'محايد', 'خطأ']
+USAGE_SHEET = 'استهلاك النموذج'
+
+
+def results_to_rows(results):
+    """Flatten classification results into rows for the export sheets."""
+    rows = []
+    for result in results:
+        if isinstance(result, dict):
+            classification = result.get('classification', {})
+            rows.append({
+                'الاستجابة': result.get('response', ''),
+                'التصنيف': classification.get('category', ''),
+                'التصنيف الفرعي': classification.get('subcategory', ''),
+                'النوع': classification.get('type', ''),
+                'التفسير': classification.get('explanation', '')
+            })
+    return rows
+
+def write_usage_sheet(usage_records, writer):
+    """Write one row per model call (tokens, finish reason, cost) and a totals row."""
+    rows = [{
+        'الطلب': i,
+        'النوع': record['kind'],
+        'النموذج': record['model'],
+        'عدد الاستجابات': record['items'],
+        'رموز الإدخال': record['prompt_tokens'],
+        'رموز الإخراج': record['output_tokens'],
+        'سبب التوقف': record['finish_reason'],
+        'التكلفة التقديرية ($)': round(record['cost'], 6),
+    } for i, record in enumerate(usage_records, 1)]
+    totals = summarize_usage(usage_records)
+    rows.append({
+        'الطلب': 'الإجمالي',
+        'عدد الاستجابات': sum(record['items'] for record in usage_records),
+        'رموز الإدخال': totals['prompt_tokens'],
+        'رموز الإخراج': totals['output_tokens'],
+        'التكلفة التقديرية ($)': round(totals['cost'], 6),
+    })
+    pd.DataFrame(rows).to_excel(writer, sheet_name=USAGE_SHEET, index=False)
+    writer.sheets[USAGE_SHEET].sheet_view.rightToLeft = True
+
+def write_results_workbook(results, writer, usage_records=None):
+    """Write the styled results workbook (summary, charts and per-type sheets).
+
+    ``writer`` is a ``pd.ExcelWriter`` using the openpyxl engine. With
+    ``usage_records`` a sheet of per-call tokens and cost is added. Returns
+    False when there are no valid results to write.
+    """
+    all_results_df = pd.DataFrame(results_to_rows(results))
+    if all_results_df.empty:
+        return False
+
+    # Create summary sheet
+    total_responses = len(all_results_df)
+    positive_count = len(all_results_df[all_results_df['النوع'] == 'إيجابي'])
+    negative_count = len(all_results_df[all_results_df['النوع'] == 'سلبي'])
+    neutral_count = len(all_results_df[all_results_df['النوع'] == 'محايد'])
+
+    summary_data = {
+        'المقياس': ['إجمالي الاستجابات', 'التجارب الإيجابية', 'التجارب السلبية', 'التجارب المحايدة',
+                  'نسبة التجارب الإيجابية', 'نسبة التجارب السلبية', 'نسبة التجارب المحايدة'],
+        'القيمة': [
+            total_responses,
+            positive_count,
+            negative_count,
+            neutral_count,
+            f'{(positive_count/total_responses)*100:.1f}%',
+            f'{(negative_count/total_responses)*100:.1f}%',
+            f'{(neutral_count/total_responses)*100:.1f}%'
+        ]
+    }
+    summary_df = pd.DataFrame(summary_data)
+
+    # Category distribution
+    category_dist = all_results_df['التصنيف'].value_counts().reset_index()
+    category_dist.columns = ['التصنيف', 'العدد']
+    category_dist['النسبة'] = (category_dist['العدد'] / total_responses * 100).round(1).astype(str) + '%'
+
+    # Write sheets
+    summary_df.to_excel(writer, sheet_name='ملخص التحليل', index=False, startrow=1)
+    category_dist.to_excel(writer, sheet_name='ملخص التحليل', index=False, startrow=9)
+
+    # Sort all results by type and write to sheet
+    all_results_df['type_order'] = pd.Categorical(all_results_df['النوع'], categories=TYPE_ORDER, ordered=True)
+    all_results_df = all_results_df.sort_values('type_order')
+    all_results_df = all_results_df.drop('type_order', axis=1)
+    all_results_df.to_excel(writer, sheet_name='جميع النتائج', index=False)
+
+    # Write type-specific sheets
+    for df, sheet_name in [
+        (all_results_df[all_results_df['النوع'] == 'إيجابي'], 'التجارب الإيجابية'),
+        (all_results_df[all_results_df['النوع'] == 'سلبي'], 'التجارب السلبية'),
+        (all_results_df[all_results_df['النوع'] == 'محايد'], 'التجارب المحايدة'),
+        (all_results_df[all_results_df['النوع'] == 'خطأ'], 'الاستجابات غير المرتبطة')
+    ]:
+        if not df.empty:
+            df.to_excel(writer, sheet_name=sheet_name, index=False)
+
+    if usage_records:
+        write_usage_sheet(usage_records, writer)
+
+    # Apply styling and create charts
+    workbook = writer.book
+
+    # Create color fills for different sentiments
+    positive_fill = PatternFill(start_color='C6EFCE', end_color='C6EFCE', fill_type='solid')  # Light green
+    negative_fill = PatternFill(start_color='FFC7CE', end_color='FFC7CE', fill_type='solid')  # Light red
+    neutral_fill = PatternFill(start_color='F2F2F2', end_color='F2F2F2', fill_type='solid')   # Light gray
+    error_fill = PatternFill(start_color='808080', end_color='808080', fill_type='solid')     # Gray for errors
+    header_fill = PatternFill(start_color='4472C4', end_color='4472C4', fill_type='solid')    # Blue header
+
+    # Create charts sheet
+    charts_sheet = workbook.create_sheet('الرسوم البيانية')
+
+    # Create pie chart for sentiment distribution
+    pie = PieChart()
+    labels = Reference(workbook['ملخص التحليل'], min_row=2, max_row=4, min_col=1)
+    data = Reference(workbook['ملخص التحليل'], min_row=2, max_row=4, min_col=2)
+    pie.add_data(data)
+    pie.set_categories(labels)
+    pie.title = "توزيع التجارب"
+    charts_sheet.add_chart(pie, "A1")
+
+    # Create bar chart for top categories
+    bar = BarChart()
+    cat_labels = Reference(workbook['ملخص التحليل'], min_row=10, max_row=10+len(category_dist), min_col=1)
+    cat_data = Reference(workbook['ملخص التحليل'], min_row=10, max_row=10+len(category_dist), min_col=2)
+    bar.add_data(cat_data)
+    bar.set_categories(cat_labels)
+    bar.title = "توزيع التصنيفات"
+    charts_sheet.add_chart(bar, "A15")
+
+    # Apply styling to all sheets
+    for sheet_name in workbook.sheetnames:
+        ws = workbook[sheet_name]
+
+        # Set RTL
+        ws.sheet_view.rightToLeft = True
+
+        # Style headers
+        for cell in ws[1]:
+            if cell.value:
+                cell.fill = header_fill
+                cell.font = Font(bold=True, color="FFFFFF")  # White text
+                cell.alignment = Alignment(horizontal='right', vertical='center', wrap_text=True)
+
+        # Auto-fit columns and apply text wrapping
+        for column in ws.columns:
+            column = list(column)
+            max_length = max((len(str(cell.value)) for cell in column), default=0)
+            adjusted_width = min(max_length + 2, 50)  # Cap width at 50
+            ws.column_dimensions[column[0].column_letter].width = adjusted_width
+
+            # Apply text wrapping and alignment to all cells
+            for cell in column:
+                if cell.value:
+                    cell.alignment = Alignment(horizontal='right', vertical='center', wrap_text=True)
+
+        # Apply sentiment colors to data sheets
+        if sheet_name in ['جميع النتائج', 'التجارب الإيجابية', 'التجارب السلبية', 'التجارب المحايدة']:
+            # Find the sentiment column index
+            sentiment_col = None
+            for idx, cell in enumerate(ws[1], 1):
+                if cell.value == 'النوع':
+                    sentiment_col = idx
+                    break
+
+            if sentiment_col:
+                # Apply colors based on sentiment
+                fills = {
+                    'إيجابي': positive_fill,
+                    'سلبي': negative_fill,
+                    'محايد': neutral_fill,
+                    'خطأ': error_fill,
+                }
+                for row in ws.iter_rows(min_row=2):  # Skip header
+                    fill = fills.get(row[sentiment_col-1].value)
+                    if fill:
+                        for cell in row:
+                            cell.fill = fill
+
+    return True
+
+def build_results_workbook(results, usage_records=None):
+    """Return the results workbook as bytes, or None when there is nothing to export."""
+    output = io.BytesIO()
+    with span("excel_build", results=len(results)):
+        with pd.ExcelWriter(output, engine='openpyxl') as writer:
+            created = write_results_workbook(results, writer, usage_records)
+    return output.getvalue() if created else None
@@ -0,0 +1,352 @@
+"""Local stand-in for the parts of ``google.generativeai`` this app uses.
+
+Implements ``configure``, ``GenerativeModel`` (``generate_content`` and
+``start_chat``/``send_message``), ``upload_file`` and ``get_file`` without
+any network access, so throughput and resilience can be measured offline.
+
+Classification prompts get taxonomy-valid answers in the app's JSON
+format; suggestion prompts get one "المقترح:" line per experience. The
+behaviour is controlled through ``configure``::
+
+    fake_gemini.configure(api_key="unused", latency="lognormal", latency_mean=1.5,
+                          error_rate=0.05, truncation_rate=0.02, malformed_rate=0.02)
+
+Every option can also be set from a ``FAKE_GEMINI_<OPTION>`` environment
+variable (e.g. ``FAKE_GEMINI_ERROR_RATE=0.1``), which is how the Streamlit
+app picks them up when ``GEMINI_BACKEND = "fake"``.
+"""
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from pathlib import Path
+
+import yaml
+
+from pipeline.compact import SCHEMA_TAG, TaxonomyCodes
+
+DEFAULT_TAXONOMY_PATH = Path(__file__).resolve().parent.parent / "data" / "Classes.txt"
+
+DEFAULT_BEHAVIOR = {
+    'latency': "lognormal",      # fixed, uniform, normal or lognormal
+    'latency_mean': 1.0,         # Seconds per request before size costs
+    'latency_spread': 0.5,       # Std dev (normal), sigma (lognormal) or +/- range (uniform)
+    'per_1k_prompt_chars': 0.0,  # Extra seconds per 1000 prompt characters
+    'per_output_item': 0.02,     # Extra seconds per classified item
+    'per_1k_output_chars': 0.0,  # Extra seconds per 1000 answer characters (generation speed)
+    'stall_rate': 0.0,           # Requests that hang for stall_seconds on top of their latency
+    'stall_seconds': 45.0,       # Extra seconds of a stalled request
+    'error_rate': 0.0,           # Requests failing with a 429/500/503
+    'truncation_rate': 0.0,      # Answers cut off mid-JSON, as at max_output_tokens
+    'malformed_rate': 0.0,       # Answers with broken JSON syntax
+    'drop_rate': 0.0,            # Items silently left out of an answer
+    'mislabel_rate': 0.0,        # Items with a misspelled, misplaced or invented category/subcategory
+    'processing_time': 0.0,      # Seconds an uploaded file stays PROCESSING
+    'seed': None,
+}
+
+FILE_LIFETIME = timedelta(hours=48)  # Same as the Files API
+FIRST_CHUNK_SHARE = 0.3  # Part of a streamed request's latency spent before the first chunk
+STREAM_CHUNK_CHARS = 256
+
+_behavior = dict(DEFAULT_BEHAVIOR)
+_rng = random.Random()
+_rng_lock = threading.Lock()
+_files = {}
+
+NEGATIVE_HINTS = ("لا ", "غير", "سيء", "سيئ", "ضعيف", "يحتاج", "مشكلة", "تأخر", "يتأخر", "صعب", "قليل")
+POSITIVE_HINTS = ("ممتاز", "رائع", "سعيد", "جيد", "متعاون", "مفيد", "ساعد", "أحب", "حديث", "مجهز")
+
+
+class FakeAPIError(Exception):
+    """Error carrying an HTTP status ``code`` like the API's exceptions."""
+
+    def __init__(self, code, message):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
+def _env_behavior():
+    behavior = {}
+    for key, default in DEFAULT_BEHAVIOR.items():
+        value = os.environ.get(f"FAKE_GEMINI_{key.upper()}")
+        if value is None:
+            continue
+        behavior[key] = value if isinstance(default, str) else (int(value) if key == 'seed' else float(value))
+    return behavior
+
+def configure(api_key=None, **behavior):
+    """Accepts ``api_key`` like the real SDK and sets the fake's behaviour."""
+    unknown = set(behavior) - set(DEFAULT_BEHAVIOR)
+    if unknown:
+        raise TypeError(f"Unknown fake Gemini options: {', '.join(sorted(unknown))}")
+    _behavior.clear()
+    _behavior.update(DEFAULT_BEHAVIOR)
+    _behavior.update(_env_behavior())
+    _behavior.update(behavior)
+    with _rng_lock:
+        _rng.seed(_behavior['seed'])
+
+def _chance(rate):
+    with _rng_lock:
+        return rate > 0 and _rng.random() < rate
+
+def _sample_latency(prompt_chars, num_items, output_chars=0):
+    mean = _behavior['latency_mean']
+    spread = _behavior['latency_spread']
+    with _rng_lock:
+        if _behavior['latency'] == "uniform":
+            base = _rng.uniform(mean - spread, mean + spread)
+        elif _behavior['latency'] == "normal":
+            base = _rng.gauss(mean, spread)
+        elif _behavior['latency'] == "lognormal":
+            # Parameterised so the distribution's mean is latency_mean
+            base = _rng.lognormvariate(0, spread) * mean / math.exp(spread ** 2 / 2) if mean > 0 else 0
+        else:
+            base = mean
+    size_cost = (_behavior['per_1k_prompt_chars'] * prompt_chars / 1000 + _behavior['per_output_item'] * num_items
+                 + _behavior['per_1k_output_chars'] * output_chars / 1000)
+    stall = _behavior['stall_seconds'] if _chance(_behavior['stall_rate']) else 0.0
+    return max(0.0, base) + size_cost + stall
+
+
+class _State:
+    def __init__(self, name):
+        self.name = name
+
+
+class FakeFile:
+    """Uploaded file handle with the attributes the app reads."""
+
+    def __init__(self, path, mime_type):
+        self.name = f"files/{uuid.uuid4().hex[:12]}"
+        self.display_name = Path(path).name
+        self.uri = f"fake://{self.name}"
+        self.mime_type = mime_type
+        self.text = Path(path).read_text(encoding='utf-8')
+        self.ready_at = time.time() + _behavior['processing_time']
+        self.expiration_time = datetime.now(timezone.utc) + FILE_LIFETIME
+
+    @property
+    def state(self):
+        return _State("ACTIVE" if time.time() >= self.ready_at else "PROCESSING")
+
+    def __str__(self):
+        return self.text
+
+
+def upload_file(path, mime_type=None):
+    file = FakeFile(path, mime_type)
+    _files[file.name] = file
+    return file
+
+def get_file(name):
+    if name not in _files:
+        raise FakeAPIError(404, f"File {name} not found")
+    return _files[name]
+
+
+class UsageMetadata:
+    def __init__(self, prompt_token_count, candidates_token_count):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+        self.total_token_count = prompt_token_count + candidates_token_count
+
+
+class FakeCandidate:
+    def __init__(self, finish_reason):
+        self.finish_reason = _State(finish_reason)
+
+
+class FakeChunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeResponse:
+    """Model answer; iterating yields its chunks, paced out when streamed."""
+
+    def __init__(self, text, prompt_chars, stream_seconds=0.0, finish_reason="STOP"):
+        self.text = text
+        # Same rough chars-per-token ratio the batch planner assumes
+        self.usage_metadata = UsageMetadata(prompt_chars // 3, len(text) // 3)
+        self.candidates = [FakeCandidate(finish_reason)]
+        self._stream_seconds = stream_seconds
+
+    def __iter__(self):
+        chunks = [self.text[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(self.text), STREAM_CHUNK_CHARS)] or [""]
+        for chunk in chunks:
+            if self._stream_seconds:
+                time.sleep(self._stream_seconds / len(chunks))
+            yield FakeChunk(chunk)
+
+
+@lru_cache(maxsize=8)
+def _load_taxonomy(text):
+    data = yaml.safe_load(text) or {}
+    categories = data.get('categories', {}) or {}
+    pairs = tuple(
+        (category, subcategory)
+        for category, info in categories.items()
+        for subcategory in (info or {}).get('subcategories', []) or []
+    )
+    return pairs or (("خطأ", "خطأ"),)
+
+def _classify(text, taxonomy):
+    """Deterministic, taxonomy-valid classification of one response."""
+    digest = int(hashlib.md5(text.encode('utf-8')).hexdigest(), 16)
+    matches = [pair for pair in taxonomy if pair[1] in text or pair[0] in text]
+    category, subcategory = matches[0] if matches else taxonomy[digest % len(taxonomy)]
+    if any(hint in text for hint in NEGATIVE_HINTS):
+        type_ = "سلبي"
+    elif any(hint in text for hint in POSITIVE_HINTS):
+        type_ = "إيجابي"
+    else:
+        type_ = ("إيجابي", "سلبي", "محايد")[digest % 3]
+    return {
+        "type": type_,
+        "category": category,
+        "subcategory": subcategory,
+        "explanation": f"تصنيف تجريبي ضمن {subcategory}",
+    }
+
+def _mislabel(classification, taxonomy):
+    """Corrupt a classification's labels the way the model occasionally does."""
+    with _rng_lock:
+        kind = _rng.choice(("spelling", "parent", "invented"))
+        other = _rng.choice(taxonomy)
+    if kind == "spelling":
+        # Drop the hamza and swap taa marbuta, as in "الإرشاد الاكاديمي" / "المكتبه"
+        classification['subcategory'] = (
+            classification['subcategory'].replace('إ', 'ا').replace('أ', 'ا').replace('ة', 'ه')
+        )
+        classification['category'] = classification['category'].replace('ال', '', 1)
+    elif kind == "parent" and other[0] != classification['category']:
+        classification['category'] = other[0]
+    else:
+        classification['subcategory'] = "تصنيف غير معروف"
+
+@lru_cache(maxsize=8)
+def _load_codes(text):
+    return TaxonomyCodes.from_text(text)
+
+def _classification_answer(batch_text, taxonomy, codes=None):
+    """Answer in the full schema, or in the compact one when ``codes`` are given."""
+    items = []
+    for part in batch_text.split("\n---\n"):
+        label, _, response = part.partition(": ")
+        if not re.fullmatch(r"response_\d+", label.strip()):
+            continue
+        if _chance(_behavior['drop_rate']):
+            continue
+        if codes is not None:
+            t, c, s = codes.encode(_classify(response, taxonomy))
+            items.append({"i": int(label.strip()[len("response_"):]), "t": t, "c": c, "s": s})
+            continue
+        classification = _classify(response, taxonomy)
+        if _chance(_behavior['mislabel_rate']):
+            _mislabel(classification, taxonomy)
+        items.append({
+            "id": label.strip(),
+            "response": response,
+            "classification": classification,
+        })
+    return items, json.dumps(items, ensure_ascii=False, indent=2)
+
+def _suggestion_answer(prompt):
+    experiences = [line[2:] for line in prompt.splitlines() if line.startswith("- ")]
+    lines = [f"المقترح: مراجعة {experience[:40]} ومتابعة تحسينه مع الجهة المختصة." for experience in experiences]
+    return lines, "\n".join(lines)
+
+def _malform(text):
+    with _rng_lock:
+        kind = _rng.choice(("trailing_comma", "prose", "unquoted"))
+    if kind == "trailing_comma":
+        return text.replace("}\n]", "},\n]")
+    if kind == "prose":
+        return f"Here are the classifications:\n```json\n{text}\n```"
+    return re.sub(r'"(\w+)":', r'\1:', text, count=1)
+
+def _flatten(contents):
+    """Prompt parts as plain strings; taxonomy files are kept aside."""
+    if not isinstance(contents, (list, tuple)):
+        contents = [contents]
+    parts, files = [], []
+    for part in contents:
+        if isinstance(part, dict):
+            nested, nested_files = _flatten(part.get('parts', []))
+            parts.extend(nested)
+            files.extend(nested_files)
+        elif isinstance(part, FakeFile):
+            files.append(part)
+            parts.append(part.text)
+        else:
+            parts.append(str(part))
+    return parts, files
+
+
+class GenerativeModel:
+    def __init__(self, model_name="gemini-fake", generation_config=None, system_instruction=None, **kwargs):
+        self.model_name = model_name
+        self.generation_config = generation_config or {}
+        self.system_instruction = system_instruction
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        parts, files = _flatten(contents)
+        prompt = parts[-1] if parts else ""
+        prompt_chars = sum(len(part) for part in parts) + len(self.system_instruction or "")
+
+        if "response_1: " in prompt:
+            taxonomy_text = files[-1].text if files else DEFAULT_TAXONOMY_PATH.read_text(encoding='utf-8')
+            compact = SCHEMA_TAG in (self.system_instruction or "")
+            items, text = _classification_answer(
+                prompt, _load_taxonomy(taxonomy_text), _load_codes(taxonomy_text) if compact else None
+            )
+        elif "المقترح" in prompt:
+            items, text = _suggestion_answer(prompt)
+        else:
+            items, text = [], "تم."
+
+        latency = _sample_latency(prompt_chars, len(items), len(text))
+        time.sleep(latency * FIRST_CHUNK_SHARE if stream else latency)
+        if _chance(_behavior['error_rate']):
+            with _rng_lock:
+                code = _rng.choice((429, 500, 503))
+            raise FakeAPIError(code, "Simulated Gemini failure")
+        finish_reason = "STOP"
+        if _chance(_behavior['truncation_rate']):
+            with _rng_lock:
+                text = text[:_rng.randint(1, max(1, len(text) - 1))]
+            finish_reason = "MAX_TOKENS"
+        elif _chance(_behavior['malformed_rate']):
+            text = _malform(text)
+        return FakeResponse(text, prompt_chars, latency * (1 - FIRST_CHUNK_SHARE) if stream else 0.0, finish_reason)
+
+    def start_chat(self, history=None):
+        return ChatSession(self, history)
+
+
+class ChatSession:
+    """Chat session that replays its whole history on every message."""
+
+    def __init__(self, model, history=None):
+        self.model = model
+        self.history = list(history or [])
+
+    def send_message(self, content, stream=False, **kwargs):
+        response = self.model.generate_content(self.history + [content], stream=stream)
+        self.history.extend([
+            {"role": "user", "parts": [content]},
+            {"role": "model", "parts": [response.text]},
+        ])
+        return response
+
+
+configure()
@@ -0,0 +1,218 @@
+"""Gemini model setup shared by the app and the command-line classifier."""
+import time
+from pathlib import Path
+
+from pipeline.classifier import (
+    CLASSIFY_PROMPT,
+    GENERATION_CONFIG,
+    MODEL_NAME,
+    SYSTEM_INSTRUCTION,
+    StatelessSession,
+)
+from pipeline.compact import COMPACT_SYSTEM_INSTRUCTION, SCHEMA_COMPACT, SCHEMA_FULL
+from pipeline.pool import RequestPool, build_pool
+from pipeline.ratelimit import DEFAULT_REQUESTS_PER_MINUTE, DEFAULT_TOKENS_PER_MINUTE, call_with_retry
+
+FILE_POLL_INITIAL_INTERVAL = 0.25  # First wait between file state checks (seconds)
+FILE_POLL_MAX_INTERVAL = 4  # Waits double up to this while a file is processing
+FILE_EXPIRY_MARGIN = 3600  # Re-upload files this many seconds before they expire
+
+BACKEND_GEMINI = "gemini"
+BACKEND_FAKE = "fake"  # Local stand-in from pipeline/fake_gemini.py
+
+_backend = None
+
+
+def load_backend(name=BACKEND_GEMINI):
+    """Return the ``google.generativeai`` module, or the local stand-in for "fake"."""
+    if name == BACKEND_FAKE:
+        from pipeline import fake_gemini
+        return fake_gemini
+    import google.generativeai as genai
+    return genai
+
+def configure(api_key, backend=BACKEND_GEMINI):
+    """Select and configure the backend used by every helper in this module."""
+    global _backend
+    _backend = load_backend(backend)
+    _backend.configure(api_key=api_key)
+    return _backend
+
+def get_backend():
+    """The configured backend (the real SDK if ``configure`` was never called)."""
+    global _backend
+    if _backend is None:
+        _backend = load_backend()
+    return _backend
+
+class SDKClients:
+    """``google.generativeai`` clients bound to one API key.
+
+    The SDK only has a process-wide ``configure``, so this relies on its
+    internal ``client._ClientManager``, on models keeping their client in
+    ``_client`` and on ``types.file_types.File``. Every use of those
+    internals is here, and a missing one raises ``RuntimeError`` naming the
+    installed SDK version instead of failing somewhere in a request.
+    """
+
+    def __init__(self, api_key):
+        import google.generativeai as genai
+        self.version = getattr(genai, '__version__', 'unknown')
+        try:
+            from google.generativeai import client as genai_client
+            from google.generativeai.types import file_types
+        except ImportError as e:
+            raise self._unsupported(str(e))
+        manager_class = getattr(genai_client, '_ClientManager', None)
+        if manager_class is None or not all(
+            hasattr(manager_class, name) for name in ('configure', 'get_default_client')
+        ):
+            raise self._unsupported("google.generativeai.client._ClientManager is missing")
+        if not hasattr(file_types, 'File'):
+            raise self._unsupported("google.generativeai.types.file_types.File is missing")
+        self._file_class = file_types.File
+        self._manager = manager_class()
+        self._manager.configure(api_key=api_key)
+
+    def _unsupported(self, detail):
+        return RuntimeError(
+            f"Several Gemini API keys are not supported with google-generativeai {self.version} "
+            f"({detail}); use a single GEMINI_API_KEY or a version that has these internals"
+        )
+
+    def bind(self, model):
+        """Make ``model`` send its requests with this key."""
+        if not hasattr(model, '_client'):
+            raise self._unsupported("GenerativeModel has no _client attribute")
+        model._client = self._manager.get_default_client("generative")
+        return model
+
+    def upload_file(self, path, mime_type=None):
+        response = self._manager.get_default_client("file").create_file(
+            path=path, mime_type=mime_type, display_name=Path(path).name
+        )
+        return self._file_class(response)
+
+    def get_file(self, name):
+        return self._file_class(self._manager.get_default_client("file").get_file(name=name))
+
+
+class KeyClient:
+    """The backend calls this module makes, bound to one API key.
+
+    ``google.generativeai`` keeps a single process-wide API key, so each
+    key gets its own ``SDKClients``. The fake backend ignores keys.
+    """
+
+    def __init__(self, api_key, backend=BACKEND_GEMINI):
+        self.module = load_backend(backend)
+        self._clients = SDKClients(api_key) if backend != BACKEND_FAKE else None
+
+    def GenerativeModel(self, **kwargs):
+        model = self.module.GenerativeModel(**kwargs)
+        return self._clients.bind(model) if self._clients is not None else model
+
+    def upload_file(self, path, mime_type=None):
+        if self._clients is None:
+            return self.module.upload_file(path, mime_type=mime_type)
+        return self._clients.upload_file(path, mime_type=mime_type)
+
+    def get_file(self, name):
+        if self._clients is None:
+            return self.module.get_file(name)
+        return self._clients.get_file(name)
+
+def create_model(model_name=MODEL_NAME, schema=SCHEMA_FULL, client=None):
+    """Create the classification model with the shared config and instructions.
+
+    ``schema`` selects the answer format: "full" (echoed responses with
+    explanations) or "compact" (index and codes only). ``client`` (a
+    ``KeyClient``) binds the model to one API key.
+    """
+    return (client or get_backend()).GenerativeModel(
+        model_name=model_name,
+        generation_config=GENERATION_CONFIG,
+        system_instruction=COMPACT_SYSTEM_INSTRUCTION if schema == SCHEMA_COMPACT else SYSTEM_INSTRUCTION
+    )
+
+def upload_file(path, mime_type=None, limiter=None, client=None):
+    """Upload a file to Gemini (under ``client``'s key, if given) and return its handle."""
+    backend = client or get_backend()
+    file = call_with_retry(lambda: backend.upload_file(str(path), mime_type=mime_type), limiter=limiter)
+    print(f"Uploaded file '{file.display_name}' as: {file.uri}")
+    return file
+
+def wait_until_active(file, limiter=None, client=None):
+    """Block until an uploaded file finishes processing; raise if it fails.
+
+    A file already active on upload returns at once; otherwise the wait
+    between state checks doubles from ``FILE_POLL_INITIAL_INTERVAL`` up to
+    ``FILE_POLL_MAX_INTERVAL``.
+    """
+    name = file.name
+    backend = client or get_backend()
+    interval = FILE_POLL_INITIAL_INTERVAL
+    while file.state.name == "PROCESSING":
+        time.sleep(interval)
+        interval = min(interval * 2, FILE_POLL_MAX_INTERVAL)
+        file = call_with_retry(lambda: backend.get_file(name), limiter=limiter)
+    if file.state.name != "ACTIVE":
+        raise Exception(f"File {file.name} failed to process")
+    return file
+
+def file_expired(file, margin=FILE_EXPIRY_MARGIN):
+    """Whether an uploaded file expires (Gemini keeps files 48 hours) within ``margin`` seconds."""
+    expiration = getattr(file, 'expiration_time', None)
+    if expiration is None:
+        return False
+    return expiration.timestamp() - margin <= time.time()
+
+def create_session(model, taxonomy_file, mode="stateless", codes=None):
+    """Open a classification session carrying the taxonomy file.
+
+    ``mode`` is "stateless" (independent requests) or "chat" (shared history).
+    For the compact schema pass the taxonomy ``codes`` so their code table
+    is sent too.
+    """
+    context_parts = [CLASSIFY_PROMPT, taxonomy_file]
+    if codes is not None:
+        context_parts.append(codes.legend())
+    if mode == "stateless":
+        return StatelessSession(model, context_parts)
+    return model.start_chat(history=[{"role": "user", "parts": context_parts}])
+
+def create_session_pool(api_keys, model_names, taxonomy_path, backend=BACKEND_GEMINI, schema=SCHEMA_FULL,
+                        codes=None, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE,
+                        tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE, limiter=None):
+    """Stateless classification sessions for every API key and model, as one ``RequestPool``.
+
+    Uploaded files belong to one project, so the taxonomy file is uploaded
+    once per key. Returns ``(pool, taxonomy_files)``.
+    """
+    uploads = {}
+
+    def make_session(index, api_key, model_name):
+        if index not in uploads:
+            client = KeyClient(api_key, backend)
+            file = upload_file(taxonomy_path, mime_type="text/plain", limiter=limiter, client=client)
+            uploads[index] = (client, wait_until_active(file, limiter=limiter, client=client))
+        client, taxonomy_file = uploads[index]
+        return create_session(create_model(model_name, schema, client), taxonomy_file, "stateless", codes=codes)
+
+    pool = build_pool(api_keys, model_names, make_session, requests_per_minute, tokens_per_minute)
+    return pool, [taxonomy_file for _, taxonomy_file in uploads.values()]
+
+def make_session_factory(session):
+    """Return a factory opening fresh chat sessions seeded like session."""
+    if isinstance(session, (StatelessSession, RequestPool)):
+        return None
+    seed_history = list(session.history[:1])
+    return lambda: session.model.start_chat(history=seed_history)
+
+def cache_model_name(model_name, backend=BACKEND_GEMINI, schema=SCHEMA_FULL):
+    """Model name to key cached classifications by, so fake answers never mix with real ones.
+
+    Compact answers carry no explanation, so they are kept apart from full ones.
+    """
+    name = model_name if backend == BACKEND_GEMINI else f"{backend}:{model_name}"
+    return name if schema == SCHEMA_FULL else f"{name}+{schema}"
@@ -0,0 +1,178 @@
+"""Response ingestion from TXT, CSV and Excel files (no Streamlit dependency)."""
+import codecs
+
+import pandas as pd
+
+ARABIC_CODE_PAGES = ['cp1256', 'iso-8859-6']  # Tried in this order when the bytes are not UTF-8
+BOMS = [
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+SAMPLE_BYTES = 64 * 1024  # Bytes read from each of the start, middle and end of a file
+MAX_UTF8_CHAR_BYTES = 4
+DEFAULT_CHUNK_SIZE = 5000
+
+
+def arabic_share(text):
+    """Share of the non-ASCII characters of ``text`` that are Arabic letters or marks."""
+    non_ascii = [c for c in text if ord(c) > 127]
+    if not non_ascii:
+        return 0.0
+    return sum(1 for c in non_ascii if '\u0600' <= c <= '\u06ff') / len(non_ascii)
+
+def _is_utf8(part, at_start, at_end):
+    """Whether a sample part decodes as UTF-8, allowing characters cut at its edges."""
+    if not at_start:
+        # Skip continuation bytes of a character that began before the sample
+        skip = 0
+        while skip < min(len(part), MAX_UTF8_CHAR_BYTES - 1) and 0x80 <= part[skip] <= 0xBF:
+            skip += 1
+        part = part[skip:]
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(part, final=at_end)
+        return True
+    except UnicodeDecodeError:
+        return False
+
+def sniff_encoding(parts):
+    """Encoding of a file from byte samples of it, without parsing it.
+
+    ``parts`` is a list of ``(bytes, at_start, at_end)`` samples, the first
+    one from the start of the file. A BOM decides at once; bytes that are
+    valid UTF-8 throughout are UTF-8; anything else is decoded with each
+    Arabic code page and the one yielding the most Arabic letters wins
+    (Windows-1256 on a tie). Raises ``ValueError`` if the bytes fit none.
+    """
+    head = parts[0][0] if parts else b''
+    for bom, encoding in BOMS:
+        if head.startswith(bom):
+            return encoding
+    if all(_is_utf8(*part) for part in parts):
+        return 'utf-8'
+
+    sample = b''.join(part[0] for part in parts)
+    best, best_share = None, -1.0
+    for encoding in ARABIC_CODE_PAGES:
+        try:
+            share = arabic_share(sample.decode(encoding))
+        except UnicodeDecodeError:
+            continue
+        if share > best_share:
+            best, best_share = encoding, share
+    if best is None:
+        raise ValueError("Could not detect the file encoding")
+    return best
+
+def read_sample(file, sample_bytes=SAMPLE_BYTES):
+    """Byte samples from the start, middle and end of a path or binary file object.
+
+    Returns the parts ``sniff_encoding`` expects; a file object is left
+    at its start.
+    """
+    handle = file if hasattr(file, 'read') else open(file, 'rb')
+    try:
+        handle.seek(0, 2)
+        size = handle.tell()
+        offsets = [0]
+        if size > sample_bytes:
+            offsets += [max(sample_bytes, size // 2 - sample_bytes // 2), max(sample_bytes, size - sample_bytes)]
+        parts = []
+        for offset in dict.fromkeys(offsets):
+            handle.seek(offset)
+            data = handle.read(sample_bytes)
+            parts.append((data, offset == 0, offset + len(data) >= size))
+        return parts
+    finally:
+        if handle is file:
+            handle.seek(0)
+        else:
+            handle.close()
+
+def detect_csv_encoding(file):
+    """Encoding of a CSV file (path or binary file object), sniffed from a byte sample."""
+    return sniff_encoding(read_sample(file))
+
+def read_csv_with_encoding(file, **kwargs):
+    """Read a CSV file in the encoding sniffed from its bytes, or None if it cannot be read.
+
+    The file is parsed once. Only if a byte the sample did not cover turns
+    out not to be UTF-8 is it read again as Windows-1256.
+    """
+    try:
+        encoding = detect_csv_encoding(file)
+    except Exception as e:
+        print(f"Could not detect CSV encoding: {e}")
+        return None
+    try:
+        df = pd.read_csv(file, encoding=encoding, **kwargs)
+    except UnicodeDecodeError:
+        if encoding != 'utf-8':
+            return None
+        if hasattr(file, 'seek'):
+            file.seek(0)
+        encoding = ARABIC_CODE_PAGES[0]
+        try:
+            df = pd.read_csv(file, encoding=encoding, **kwargs)
+        except Exception:
+            return None
+    except Exception:
+        return None
+    if df.empty or len(df.columns) == 0:
+        return None
+    return df
+
+def split_text_responses(content, separator="\n"):
+    """Split raw text into non-empty, stripped responses."""
+    return [r.strip() for r in content.split(separator) if r.strip()]
+
+def column_responses(df, column_name):
+    """Non-empty responses from one column of a DataFrame."""
+    return df[column_name].dropna().tolist()
+
+def iter_response_chunks(path, file_type, column_name=None, separator="\n", chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield lists of at most ``chunk_size`` responses read from ``path``.
+
+    TXT and CSV files are streamed; Excel files are read whole (openpyxl
+    cannot stream a worksheet into pandas) and then sliced.
+    """
+    if file_type == 'txt':
+        if separator == "\n":
+            chunk = []
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        chunk.append(line.strip())
+                    if len(chunk) >= chunk_size:
+                        yield chunk
+                        chunk = []
+            if chunk:
+                yield chunk
+            return
+        with open(path, encoding='utf-8') as f:
+            responses = split_text_responses(f.read(), separator)
+    elif file_type == 'csv':
+        encoding = detect_csv_encoding(path)
+        for df in pd.read_csv(path, encoding=encoding, usecols=[column_name], chunksize=chunk_size):
+            chunk = column_responses(df, column_name)
+            if chunk:
+                yield chunk
+        return
+    elif file_type == 'excel':
+        responses = column_responses(pd.read_excel(path, usecols=[column_name]), column_name)
+    else:
+        raise ValueError(f"Unsupported file type: {file_type}")
+
+    for i in range(0, len(responses), chunk_size):
+        yield responses[i:i + chunk_size]
+
+def file_type_from_path(path):
+    """Infer the ingestion file type from a file name."""
+    suffix = str(path).lower().rsplit('.', 1)[-1]
+    if suffix == 'txt':
+        return 'txt'
+    if suffix == 'csv':
+        return 'csv'
+    if suffix in ('xlsx', 'xls'):
+        return 'excel'
+    raise ValueError(f"Unsupported file extension: {path}")
@@ -0,0 +1,164 @@
+"""Checkpointed, resumable classification jobs."""
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+
+STATUS_RUNNING = "running"
+STATUS_FINISHED = "finished"
+
+
+class JobStore:
+    """SQLite store of classification jobs and their per-batch checkpoints.
+
+    A job keeps its input responses and every classification completed so
+    far, so an interrupted run can resume where it stopped.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " job_id TEXT PRIMARY KEY,"
+            " name TEXT NOT NULL,"
+            " status TEXT NOT NULL,"
+            " total INTEGER NOT NULL,"
+            " responses TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " updated_at REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS job_results ("
+            " job_id TEXT NOT NULL,"
+            " response TEXT NOT NULL,"
+            " classification TEXT NOT NULL,"
+            " PRIMARY KEY (job_id, response));"
+        )
+        self._conn.commit()
+
+    def create_job(self, responses, name="", total=None):
+        """Register a new job for ``responses`` and return its ID.
+
+        ``total`` is the number of results the job expects to checkpoint
+        (defaults to the number of responses).
+        """
+        job_id = uuid.uuid4().hex[:12]
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (job_id, name, status, total, responses, created_at, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, name, STATUS_RUNNING, len(responses) if total is None else total,
+                 json.dumps(list(responses), ensure_ascii=False), now, now)
+            )
+            self._conn.commit()
+        return job_id
+
+    def checkpoint(self, job_id, results):
+        """Persist completed ``{"response", "classification"}`` results of a job."""
+        rows = [
+            (job_id, str(r['response']), json.dumps(r['classification'], ensure_ascii=False))
+            for r in results
+        ]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO job_results (job_id, response, classification) VALUES (?, ?, ?)",
+                rows
+            )
+            self._conn.execute("UPDATE jobs SET updated_at = ? WHERE job_id = ?", (time.time(), job_id))
+            self._conn.commit()
+
+    def load_responses(self, job_id):
+        """Input responses of a job."""
+        with self._lock:
+            row = self._conn.execute("SELECT responses FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            raise KeyError(f"Unknown job: {job_id}")
+        return json.loads(row[0])
+
+    def load_results(self, job_id):
+        """Completed classifications of a job as ``{response text: classification}``."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT response, classification FROM job_results WHERE job_id = ?", (job_id,)
+            ).fetchall()
+        return {response: json.loads(classification) for response, classification in rows}
+
+    def mark_finished(self, job_id):
+        """Mark a job finished and drop its checkpoint data."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, responses = '[]', updated_at = ? WHERE job_id = ?",
+                (STATUS_FINISHED, time.time(), job_id)
+            )
+            self._conn.execute("DELETE FROM job_results WHERE job_id = ?", (job_id,))
+            self._conn.commit()
+
+    def delete_job(self, job_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM job_results WHERE job_id = ?", (job_id,))
+            self._conn.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+            self._conn.commit()
+
+    def unfinished_jobs(self):
+        """Jobs that never finished, newest first, with their progress."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT j.job_id, j.name, j.total, j.created_at, j.updated_at,"
+                " (SELECT COUNT(*) FROM job_results r WHERE r.job_id = j.job_id)"
+                " FROM jobs j WHERE j.status != ? ORDER BY j.created_at DESC",
+                (STATUS_FINISHED,)
+            ).fetchall()
+        return [
+            {
+                'job_id': job_id,
+                'name': name,
+                'total': total,
+                'completed': completed,
+                'created_at': created_at,
+                'updated_at': updated_at,
+            }
+            for job_id, name, total, created_at, updated_at, completed in rows
+        ]
+
+
+def classify_resumable(responses, store, job_id, classify_fn, on_resumed=None):
+    """Classify responses under a job, skipping everything already checkpointed.
+
+    ``classify_fn(remaining)`` must return ``(results, stats)``; callers are
+    expected to checkpoint each completed batch through
+    ``store.checkpoint``. ``on_resumed(results)`` receives the results
+    restored from the checkpoint. Marks the job finished once nothing has
+    failed and adds ``resumed_responses`` to the stats.
+    """
+    done = store.load_results(job_id)
+    if on_resumed and done:
+        on_resumed([
+            {"response": response, "classification": done[str(response)]}
+            for response in responses
+            if str(response) in done
+        ])
+
+    remaining = [r for r in responses if str(r) not in done]
+    new_results, stats = classify_fn(remaining)
+    if stats.get('failed_responses'):
+        # Leave the job unfinished so a resume retries only the failures
+        store.checkpoint(job_id, new_results)
+    else:
+        store.mark_finished(job_id)
+
+    classified = dict(done)
+    classified.update({str(r['response']): r['classification'] for r in new_results})
+    results = [
+        {"response": response, "classification": classified[str(response)]}
+        for response in responses
+        if str(response) in classified
+    ]
+    stats = dict(stats)
+    stats['resumed_responses'] = len(responses) - len(remaining)
+    return results, stats
@@ -0,0 +1,155 @@
+"""Incremental parsing of the JSON array the model streams back."""
+import json
+import re
+
+# A whole string (group 1 is empty while its closing quote has not arrived) or a bracket
+_TOKEN = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*(")?|[{}\[\]]', re.S)
+_OPENING = re.compile(r'[{\[]')
+_DECODER = json.JSONDecoder()
+
+
+class JsonArrayStream:
+    """Incremental parser emitting the elements of a streamed JSON array.
+
+    ``feed`` takes text as it arrives and returns the elements completed by
+    it, each decoded as soon as its closing bracket is seen. Text before
+    the opening bracket (prose, a ```json fence) is ignored, and a bare
+    object without an enclosing array counts as a one-element array.
+
+    An element that fails to decode is skipped and its inner text is
+    scanned again, so objects that follow a missing brace are still
+    recovered; ``finish`` does the same for an element cut off by
+    truncation. Recovered inner objects that are not real elements (e.g. a
+    lone ``classification``) are left for the caller's validation to drop.
+    """
+
+    def __init__(self, element_depth=None):
+        self.items = []
+        self.skipped = 0  # Elements that could not be decoded
+        self.closed = False  # The closing bracket of the array was seen
+        self.truncated = False  # The stream ended inside an element
+        self._chunks = []
+        self._buffer = ""
+        self._pos = 0
+        self._depth = 0 if element_depth is None else element_depth
+        self._base = element_depth  # Depth at which elements start, once known
+        self._start = None  # Buffer offset of the element in progress
+        self._scanning = False  # Walking a broken element instead of decoding it whole
+
+    @property
+    def text(self):
+        """Everything fed so far."""
+        return "".join(self._chunks)
+
+    @property
+    def complete(self):
+        """Whether the output was a well-formed array with every element decoded."""
+        return (self.closed or self._base == 0) and not self.skipped and not self.truncated
+
+    def feed(self, text):
+        """Consume more output and return the elements it completed."""
+        self._chunks.append(text)
+        if self.closed:
+            return []
+        before = len(self.items)
+        self._buffer += text
+        self._scan()
+
+        # Drop text that no element in progress still needs
+        keep = self._start if self._start is not None else self._pos
+        self._buffer = self._buffer[keep:]
+        self._pos -= keep
+        if self._start is not None:
+            self._start = 0
+        return self.items[before:]
+
+    def finish(self):
+        """Signal the end of the stream; salvage a truncated last element."""
+        before = len(self.items)
+        if self._start is not None and not self.closed:
+            self.truncated = True
+            self._salvage(self._buffer[self._start + 1:])
+            self._start = None
+        return self.items[before:]
+
+    def _scan(self):
+        buffer = self._buffer
+        pos = self._pos
+        if self._base is None:
+            # Skip prose until the array (or a bare object) opens
+            match = _OPENING.search(buffer, pos)
+            if match is None:
+                self._pos = len(buffer)
+                return
+            if match.group() == '[':
+                self._base = self._depth = 1
+                pos = match.end()
+            else:
+                self._base = self._depth = 0
+                pos = match.start()
+
+        while True:
+            if self._start is not None and not self._scanning:
+                # Fast path: decode the whole element in one call
+                try:
+                    item, end = _DECODER.raw_decode(buffer, self._start)
+                except ValueError as e:
+                    if e.pos >= len(buffer) or e.msg.startswith("Unterminated string"):
+                        # Not complete yet; retry once more text arrives
+                        self._pos = self._start
+                        return
+                    # Broken element: walk it bracket by bracket to find its end
+                    self._scanning = True
+                    self._depth = self._base + 1
+                    pos = self._start + 1
+                else:
+                    self.items.append(item)
+                    self._start = None
+                    pos = end
+                    continue
+
+            match = _TOKEN.search(buffer, pos)
+            if match is None:
+                break
+            pos = match.end()
+            token = match.group()
+            if token[0] == '"':
+                if match.group(1) is None:
+                    # Unterminated string: rescan it once more text arrives
+                    self._pos = match.start()
+                    return
+                continue
+            if token in '{[':
+                if self._depth == self._base and self._start is None:
+                    self._start = match.start()
+                else:
+                    self._depth += 1
+                continue
+            if self._depth == self._base:
+                if self._base == 1:
+                    self.closed = True
+                    self._pos = pos
+                    return
+                continue  # Stray closer between bare objects
+            self._depth -= 1
+            if self._depth == self._base and self._start is not None:
+                self._emit(buffer[self._start:pos])
+                self._start = None
+                self._scanning = False
+        self._pos = len(buffer)
+
+    def _emit(self, element_text):
+        """Decode an element found by walking it; salvage its contents if broken."""
+        try:
+            self.items.append(json.loads(element_text))
+        except ValueError:
+            self.skipped += 1
+            self._salvage(element_text[1:])
+
+    def _salvage(self, inner_text):
+        """Recover complete objects nested in a broken or unterminated element."""
+        inner = JsonArrayStream(element_depth=0)
+        inner.feed(inner_text)
+        inner.finish()
+        self.items.extend(inner.items)
+
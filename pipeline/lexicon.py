@@ -0,0 +1,223 @@
+"""Rule and lexicon pre-classifier for short, obvious responses.
+
+Responses such as "المكتبة ممتازة", "السكن سيء جدا" or "لا شيء" are
+classified locally with a confidence score; only the ones below the
+threshold are sent to the model. A sentiment without a topic ("ممتاز")
+is left to the model, since 'خطأ' would count it as unrelated. Topic
+keywords are seeded from the category and subcategory names in the
+taxonomy file, plus a few common synonyms.
+"""
+import yaml
+
+from pipeline.arabic import normalize_arabic
+
+DEFAULT_CONFIDENCE_THRESHOLD = 0.85
+MAX_LOCAL_WORDS = 6  # Longer responses always go to the model
+NEGATION_WINDOW = 3  # Tokens before a sentiment word searched for a negator
+UNRELATED = 'خطأ'  # Category/subcategory used for responses naming no topic
+
+POSITIVE_WORDS = [
+    'ممتاز', 'ممتازة', 'رائع', 'رائعة', 'جيد', 'جيدة', 'جميل', 'جميلة', 'مفيد', 'مفيدة', 'ممتع', 'ممتعة',
+    'سعيد', 'سعيدة', 'مريح', 'مريحة', 'متعاون', 'متعاونة', 'منظم', 'منظمة', 'نظيف', 'نظيفة', 'مميز', 'مميزة',
+    'متميز', 'متميزة', 'أفضل', 'أحسن', 'شكرا', 'تمام', 'حلو', 'حلوة', 'إبداع', 'متعاونين', 'ممتازين',
+]
+NEGATIVE_WORDS = [
+    'سيء', 'سيئ', 'سيئة', 'سئ', 'ضعيف', 'ضعيفة', 'سلبي', 'سلبية', 'مزعج', 'مزعجة', 'متعب', 'متعبة', 'صعب',
+    'صعبة', 'فاشل', 'فاشلة', 'قذر', 'قذرة', 'متسخ', 'مزدحم', 'مزدحمة', 'متأخر', 'تأخير', 'مشكلة', 'مشاكل',
+    'غالي', 'غالية', 'سيئين', 'زفت', 'رديء', 'رديئة', 'مهمل', 'مهملة',
+]
+NEGATORS = ['لا', 'ليس', 'ليست', 'غير', 'ما', 'لم', 'لن', 'مش', 'مو']
+INTENSIFIERS = ['جدا', 'جداً', 'كثيرا', 'كثير', 'للغاية', 'حقا', 'فعلا', 'مرة', 'أكثر', 'أيضا']
+FUNCTION_WORDS = ['في', 'فيه', 'من', 'على', 'الى', 'إلى', 'عن', 'مع', 'و', 'هو', 'هي', 'كان', 'كانت', 'كل', 'بشكل']
+NIL_RESPONSES = [
+    'لا شيء', 'لاشيء', 'لا شي', 'لا يوجد', 'لايوجد', 'لا يوجد شيء', 'لا تعليق', 'لا اعرف', 'لا أعلم',
+    'ليس لدي', 'ليس لدي تعليق', 'لا', 'لا شيء يذكر', 'بدون', 'none', 'no', 'nothing', 'na', 'n a',
+]
+
+# Common words for the default subcategories, used when those subcategories exist
+SUBCATEGORY_KEYWORDS = {
+    'خدمات رقمية': ['بوابة', 'منصة', 'تطبيق', 'موقع', 'البلاك بورد'],
+    'البنية التقنية': ['انترنت', 'الانترنت', 'شبكة', 'واي فاي', 'الواي فاي', 'أجهزة', 'حاسب'],
+    'السكن': ['سكن', 'السكن الجامعي', 'غرفة', 'غرف'],
+    'الطعام': ['طعام', 'أكل', 'مطعم', 'كافتيريا', 'الكافتيريا', 'وجبات'],
+    'النقل': ['نقل', 'مواصلات', 'باص', 'باصات', 'حافلة', 'حافلات'],
+    'الإرشاد الأكاديمي': ['إرشاد', 'المرشد', 'مرشد'],
+    'الأنشطة': ['أنشطة', 'نشاط', 'فعاليات', 'الأنشطة الطلابية'],
+    'دعم الطلاب الدوليين': ['الطلاب الدوليين', 'وافدين', 'الوافدين', 'تأشيرة'],
+    'المكتبة': ['مكتبة', 'كتب', 'مراجع'],
+    'المختبرات': ['مختبر', 'معمل', 'معامل'],
+    'المرافق الرياضية': ['ملعب', 'ملاعب', 'رياضة', 'نادي', 'صالة رياضية'],
+    'أماكن الدراسة': ['قاعة', 'قاعات', 'قاعات الدراسة', 'أماكن المذاكرة'],
+    'مقررات': ['مقرر', 'مادة', 'مواد', 'المناهج', 'منهج'],
+    'برنامج': ['تخصص', 'التخصص', 'البرنامج'],
+    'عضو هيئة تدريس': ['دكتور', 'الدكتور', 'دكاترة', 'أستاذ', 'الأستاذ', 'أساتذة', 'محاضر', 'هيئة التدريس'],
+}
+PREFIXES = ('وال', 'بال', 'فال', 'كال', 'لل', 'ال', 'و', 'ف', 'ب')
+
+
+def _stem(token):
+    """Strip a leading conjunction/preposition and the definite article."""
+    for prefix in PREFIXES:
+        if token.startswith(prefix) and len(token) - len(prefix) >= 3:
+            return token[len(prefix):]
+    return token
+
+def _normalized_set(words):
+    return {normalize_arabic(word) for word in words}
+
+def _phrase(text):
+    return ' '.join(_stem(token) for token in normalize_arabic(text).split())
+
+
+class LexiconClassifier:
+    """Assigns type, category and a confidence score from word lists.
+
+    Confidence is high only for short responses made entirely of known
+    words with one clear sentiment and at most one topic; anything else
+    scores low and is left to the model.
+    """
+
+    def __init__(self, categories):
+        self.positive = {_stem(w) for w in _normalized_set(POSITIVE_WORDS)}
+        self.negative = {_stem(w) for w in _normalized_set(NEGATIVE_WORDS)}
+        self.negators = _normalized_set(NEGATORS)
+        self.fillers = _normalized_set(INTENSIFIERS) | _normalized_set(FUNCTION_WORDS)
+        self.nil_responses = _normalized_set(NIL_RESPONSES)
+
+        # Stemmed keyword phrase -> (category, subcategory)
+        self.topics = {}
+        keywords_by_name = {normalize_arabic(name): words for name, words in SUBCATEGORY_KEYWORDS.items()}
+        for category, info in (categories or {}).items():
+            for subcategory in (info or {}).get('subcategories', []) or []:
+                keywords = [subcategory] + keywords_by_name.get(normalize_arabic(subcategory), [])
+                for keyword in keywords:
+                    self.topics.setdefault(_phrase(keyword), (category, subcategory))
+        # First stemmed word -> (phrase, its words, topic), so a response only
+        # checks the phrases that can start at each of its tokens
+        self._topics_by_first = {}
+        for phrase, topic in self.topics.items():
+            words = phrase.split()
+            if words:
+                self._topics_by_first.setdefault(words[0], []).append((phrase, words, topic))
+
+    @classmethod
+    def from_file(cls, path):
+        """Build the lexicon from a taxonomy YAML file like data/Classes.txt."""
+        with open(path, 'r', encoding='utf-8') as f:
+            data = yaml.safe_load(f) or {}
+        return cls(data.get('categories', {}))
+
+    def _find_topics(self, stems):
+        """Topics whose keyword phrases occur in the stemmed tokens, and the tokens they cover."""
+        found = {}
+        covered = set()
+        for start, stem in enumerate(stems):
+            for phrase, words, topic in self._topics_by_first.get(stem, ()):
+                if stems[start:start + len(words)] == words:
+                    found[topic] = phrase
+                    covered.update(range(start, start + len(words)))
+        return found, covered
+
+    def _negated(self, tokens, i):
+        """Whether a negator precedes token ``i``, possibly past filler words ("ما في مشكلة")."""
+        for j in range(i - 1, max(-1, i - 1 - NEGATION_WINDOW), -1):
+            if tokens[j] in self.negators:
+                return True
+            if tokens[j] not in self.fillers:
+                return False
+        return False
+
+    def classify(self, text):
+        """Return ``(classification, confidence)`` for one response."""
+        normalized = normalize_arabic(text)
+        if not normalized or normalized in self.nil_responses:
+            return {
+                'type': 'محايد',
+                'category': UNRELATED,
+                'subcategory': UNRELATED,
+                'explanation': "تصنيف محلي: استجابة لا تتضمن تجربة",
+            }, 0.95
+
+        tokens = normalized.split()
+        # Quote the response's own words in the explanation when they line up
+        original = str(text).split()
+        words = original if len(original) == len(tokens) else tokens
+        stems = [_stem(token) for token in tokens]
+        topics, covered = self._find_topics(stems)
+
+        positive = negative = 0
+        cues = []
+        for i, stem in enumerate(stems):
+            if stem in self.positive or stem in self.negative:
+                polarity = 1 if stem in self.positive else -1
+                # "غير جيد", "ليس سيئا", "ما في مشكلة"
+                if self._negated(tokens, i):
+                    polarity = -polarity
+                if polarity > 0:
+                    positive += 1
+                else:
+                    negative += 1
+                cues.append(words[i])
+                covered.add(i)
+            elif tokens[i] in self.negators or tokens[i] in self.fillers:
+                covered.add(i)
+
+        if positive and not negative:
+            type_ = 'إيجابي'
+        elif negative and not positive:
+            type_ = 'سلبي'
+        else:
+            type_ = 'محايد'
+
+        category, subcategory = next(iter(topics)) if len(topics) == 1 else (UNRELATED, UNRELATED)
+        classification = {
+            'type': type_,
+            'category': category,
+            'subcategory': subcategory,
+            'explanation': f"تصنيف محلي: {' '.join(cues) or 'بدون كلمات دالة'}",
+        }
+
+        # Only a single clear sentiment, exactly one topic and no unknown
+        # words make a confident local answer
+        if not (positive or negative) or (positive and negative) or len(topics) != 1:
+            return classification, 0.3
+        coverage = len(covered) / len(tokens)
+        confidence = 0.95 * coverage
+        if len(tokens) > MAX_LOCAL_WORDS:
+            confidence = min(confidence, 0.6)
+        return classification, confidence
+
+
+def classify_with_lexicon(responses, lexicon, classify_fn, threshold=DEFAULT_CONFIDENCE_THRESHOLD, on_local=None):
+    """Classify confident responses locally and send the rest to ``classify_fn``.
+
+    ``classify_fn(remaining)`` must return ``(results, stats)``.
+    ``on_local(results)`` receives the local results before any request is
+    sent. Returns ``(results, stats)`` in input order with
+    ``local_responses`` added to the stats.
+    """
+    local = {}
+    for text in dict.fromkeys(str(r) for r in responses):
+        classification, confidence = lexicon.classify(text)
+        if confidence >= threshold:
+            local[text] = classification
+    if on_local and local:
+        on_local([
+            {"response": response, "classification": local[str(response)]}
+            for response in responses
+            if str(response) in local
+        ])
+
+    remaining = [r for r in responses if str(r) not in local]
+    new_results, stats = classify_fn(remaining)
+
+    classified = {str(r['response']): r['classification'] for r in new_results}
+    classified.update(local)
+    results = [
+        {"response": response, "classification": classified[str(response)]}
+        for response in responses
+        if str(response) in classified
+    ]
+    stats = dict(stats)
+    stats['local_responses'] = len(responses) - len(remaining)
+    return results, stats
@@ -0,0 +1,231 @@
+"""Pool of API keys and models that Gemini requests are spread over.
+
+One API key caps throughput at one project's quota. A ``RequestPool``
+holds one member per key and model, each with its own rate limiter, and
+sends every request to the member expected to answer first, judging by
+the quota it has left and the latency observed so far. A member that
+returns a quota error is sidelined for a while and requests go to the
+others.
+
+The pool stands in for a stateless session (``send_message``) or a model
+(``generate_content``), so the classifier and the suggestion page use it
+unchanged.
+"""
+import threading
+import time
+
+from pipeline.batching import estimate_text_tokens
+from pipeline.ratelimit import (
+    DEFAULT_REQUESTS_PER_MINUTE,
+    DEFAULT_TOKENS_PER_MINUTE,
+    RateLimiter,
+    get_shared_limiter,
+    is_quota_error,
+)
+
+DEFAULT_SIDELINE_SECONDS = 60.0  # A member returning a quota error gets no requests for this long
+PRIOR_LATENCY = 3.0  # Seconds assumed for a member nothing is known about yet
+LATENCY_SMOOTHING = 0.2  # Weight of the newest call in a member's moving latency
+
+
+class PoolMember:
+    """One API key and model: the session or model to call, its limiter and its record."""
+
+    def __init__(self, label, target, model_name, limiter):
+        self.label = label
+        self.target = target
+        self.model_name = model_name
+        self.limiter = limiter
+        self.latency = None
+        self.in_flight = 0
+        self.sidelined_until = 0.0
+        self.stats = {'calls': 0, 'errors': 0, 'quota_errors': 0}
+
+
+class TrackedResponse:
+    """Model answer that reports back to the pool once it has been read.
+
+    A streamed answer is done when iteration ends; any other answer is
+    done when it is returned. Everything else is read from the wrapped
+    response.
+    """
+
+    def __init__(self, response, model_name, on_done, stream):
+        self._response = response
+        self._on_done = on_done
+        self.model_name = model_name
+        if not stream:
+            on_done(None)
+
+    def __iter__(self):
+        try:
+            for chunk in self._response:
+                yield chunk
+        except Exception as e:
+            self._on_done(e)
+            raise
+        self._on_done(None)
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+
+class RequestPool:
+    """Spreads requests over several API key and model members.
+
+    Each request goes to the member expected to answer first: the time
+    until its limiter admits the request, plus its moving average latency
+    for the request itself and every request already in flight on it. Members are
+    sidelined for ``sideline_seconds`` after a quota error; when all of
+    them are, the one that comes back first is used.
+    """
+
+    def __init__(self, members, sideline_seconds=DEFAULT_SIDELINE_SECONDS):
+        if not members:
+            raise ValueError("A request pool needs at least one member")
+        self.members = list(members)
+        self.sideline_seconds = sideline_seconds
+        self._lock = threading.Lock()
+
+    @property
+    def model_name(self):
+        return self.members[0].model_name
+
+    def _expected_finish(self, member, tokens):
+        latencies = [m.latency for m in self.members if m.latency is not None]
+        latency = member.latency if member.latency is not None else (
+            sum(latencies) / len(latencies) if latencies else PRIOR_LATENCY
+        )
+        return member.limiter.wait_time(tokens) + (member.in_flight + 1) * latency
+
+    def choose(self, tokens=0):
+        """Pick the member for the next request and count it as in flight."""
+        with self._lock:
+            now = time.monotonic()
+            available = [m for m in self.members if m.sidelined_until <= now]
+            if not available:
+                available = [min(self.members, key=lambda m: m.sidelined_until)]
+            member = min(available, key=lambda m: self._expected_finish(m, tokens))
+            member.in_flight += 1
+            member.stats['calls'] += 1
+            return member
+
+    def release(self, member, seconds, error=None):
+        """Record how a request on ``member`` ended."""
+        with self._lock:
+            member.in_flight -= 1
+            if error is None:
+                member.latency = seconds if member.latency is None else (
+                    LATENCY_SMOOTHING * seconds + (1 - LATENCY_SMOOTHING) * member.latency
+                )
+                return
+            member.stats['errors'] += 1
+            if is_quota_error(error):
+                member.stats['quota_errors'] += 1
+                member.sidelined_until = time.monotonic() + self.sideline_seconds
+                print(f"Sidelining {member.label} for {self.sideline_seconds:.0f}s after quota error: {error}")
+
+    def _call(self, method, contents, stream, **kwargs):
+        tokens = estimate_text_tokens(str(contents))
+        member = self.choose(tokens)
+        released = []
+
+        def on_done(error):
+            if not released:
+                released.append(True)
+                self.release(member, time.perf_counter() - start_time, error)
+
+        member.limiter.acquire(tokens)
+        start_time = time.perf_counter()
+        try:
+            response = getattr(member.target, method)(contents, stream=stream, **kwargs)
+        except Exception as e:
+            on_done(e)
+            raise
+        return TrackedResponse(response, member.model_name, on_done, stream)
+
+    def send_message(self, text, stream=False):
+        """Send one classification batch through the chosen member's session."""
+        return self._call('send_message', text, stream)
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        """Generate with the chosen member's model."""
+        return self._call('generate_content', contents, stream, **kwargs)
+
+    def status(self):
+        """Per-member calls, errors, in-flight requests, latency and sideline time left."""
+        with self._lock:
+            now = time.monotonic()
+            return [
+                {
+                    'member': m.label,
+                    'model': m.model_name,
+                    'calls': m.stats['calls'],
+                    'in_flight': m.in_flight,
+                    'latency': m.latency or 0,
+                    'errors': m.stats['errors'],
+                    'quota_errors': m.stats['quota_errors'],
+                    'sidelined_seconds': max(0.0, m.sidelined_until - now),
+                }
+                for m in self.members
+            ]
+
+
+def api_keys_from_secrets(secrets):
+    """API keys from a secrets mapping: the GEMINI_API_KEYS list, or the single GEMINI_API_KEY."""
+    try:
+        keys = secrets.get("GEMINI_API_KEYS") or [secrets.get("GEMINI_API_KEY")]
+    except Exception:
+        return []
+    return [key for key in keys if key]
+
+def model_names_from_secrets(secrets, default):
+    """Model names from a secrets mapping (GEMINI_MODELS), else ``[default]``."""
+    try:
+        return list(secrets.get("GEMINI_MODELS") or [default])
+    except Exception:
+        return [default]
+
+def rate_limits_from_secrets(secrets):
+    """Requests and tokens per minute allowed for one API key and model."""
+    try:
+        return (int(secrets.get("GEMINI_REQUESTS_PER_MINUTE", DEFAULT_REQUESTS_PER_MINUTE)),
+                int(secrets.get("GEMINI_TOKENS_PER_MINUTE", DEFAULT_TOKENS_PER_MINUTE)))
+    except Exception:
+        return DEFAULT_REQUESTS_PER_MINUTE, DEFAULT_TOKENS_PER_MINUTE
+
+def pool_limiter(secrets, model_names):
+    """Process-wide limiter for requests spread over every API key and ``model_names``.
+
+    Quotas are counted per project and model, so the per-key limits from
+    secrets are multiplied by the number of keys and of these models.
+    Each set of models has its own limiter.
+    """
+    requests_per_minute, tokens_per_minute = rate_limits_from_secrets(secrets)
+    pool_size = max(1, len(api_keys_from_secrets(secrets))) * len(model_names)
+    return get_shared_limiter(requests_per_minute * pool_size, tokens_per_minute * pool_size,
+                              scope=tuple(model_names))
+
+def key_label(index, api_key):
+    """Name of an API key safe to show and log: its position and last characters."""
+    return f"key {index + 1} (…{str(api_key or '')[-4:]})"
+
+def build_pool(api_keys, model_names, make_target, requests_per_minute, tokens_per_minute,
+               sideline_seconds=DEFAULT_SIDELINE_SECONDS):
+    """Pool with one member per API key and model name.
+
+    ``make_target(key_index, api_key, model_name)`` returns the session or
+    model to call for that pair; it is called once per pair. Every member
+    gets its own limiter with the given per-key limits, as quotas are
+    counted per project and model.
+    """
+    members = []
+    for index, api_key in enumerate(api_keys):
+        for model_name in model_names:
+            members.append(PoolMember(
+                f"{key_label(index, api_key)} / {model_name}",
+                make_target(index, api_key, model_name),
+                model_name,
+                RateLimiter(requests_per_minute, tokens_per_minute),
+            ))
+    return RequestPool(members, sideline_seconds)
@@ -0,0 +1,193 @@
+"""Client-side rate limiting and retry with backoff for Gemini calls."""
+import random
+import threading
+import time
+
+try:
+    from google.api_core import exceptions as api_exceptions
+    RETRYABLE_EXCEPTIONS = (
+        api_exceptions.TooManyRequests,
+        api_exceptions.ResourceExhausted,
+        api_exceptions.InternalServerError,
+        api_exceptions.BadGateway,
+        api_exceptions.ServiceUnavailable,
+        api_exceptions.GatewayTimeout,
+        api_exceptions.DeadlineExceeded,
+    )
+    QUOTA_EXCEPTIONS = (api_exceptions.TooManyRequests, api_exceptions.ResourceExhausted)
+except ImportError:
+    RETRYABLE_EXCEPTIONS = ()
+    QUOTA_EXCEPTIONS = ()
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+QUOTA_STATUS_CODE = 429
+
+DEFAULT_REQUESTS_PER_MINUTE = 120
+DEFAULT_TOKENS_PER_MINUTE = 1000000
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BASE_DELAY = 1.0  # Seconds before the first retry (before jitter)
+DEFAULT_MAX_DELAY = 60.0
+
+
+class RetriesExhausted(Exception):
+    """Raised when a retryable Gemini error persists after every retry."""
+
+
+def is_retryable(error):
+    """Whether an error is a rate limit or transient server failure."""
+    if RETRYABLE_EXCEPTIONS and isinstance(error, RETRYABLE_EXCEPTIONS):
+        return True
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    code = getattr(error, 'code', None) or getattr(error, 'status_code', None)
+    return code in RETRYABLE_STATUS_CODES
+
+def is_quota_error(error):
+    """Whether an error means the API key or model ran out of quota."""
+    if QUOTA_EXCEPTIONS and isinstance(error, QUOTA_EXCEPTIONS):
+        return True
+    code = getattr(error, 'code', None) or getattr(error, 'status_code', None)
+    return code == QUOTA_STATUS_CODE
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at ``per_minute`` units per minute."""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.available = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """Seconds until ``amount`` units are available (0 if they are now)."""
+        deficit = min(amount, self.capacity) - self.available
+        return deficit / self.rate if deficit > 0 else 0.0
+
+    def take(self, amount):
+        self.available -= min(amount, self.capacity)
+
+
+class RateLimiter:
+    """Shared limiter enforcing requests/min and tokens/min across threads.
+
+    Keeps counters of calls, retries and time spent waiting so the UI can
+    report how long a run was throttled.
+    """
+
+    def __init__(self, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE,
+                 tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self._lock = threading.Lock()
+        self.stats = {
+            'calls': 0,
+            'retries': 0,
+            'failures': 0,
+            'throttled_seconds': 0.0,
+            'backoff_seconds': 0.0,
+        }
+
+    def acquire(self, tokens=0):
+        """Block until one request and ``tokens`` tokens fit the limits."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.requests.refill(now)
+                self.tokens.refill(now)
+                wait = max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+                if wait <= 0:
+                    self.requests.take(1)
+                    self.tokens.take(tokens)
+                    self.stats['calls'] += 1
+                    self.stats['throttled_seconds'] += waited
+                    return waited
+            time.sleep(wait)
+            waited += wait
+
+    def wait_time(self, tokens=0):
+        """Seconds until one request and ``tokens`` tokens would fit, without taking them."""
+        with self._lock:
+            now = time.monotonic()
+            self.requests.refill(now)
+            self.tokens.refill(now)
+            return max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+
+    def record(self, key, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def snapshot(self):
+        """Copy of the counters, e.g. to diff before and after a run."""
+        with self._lock:
+            return dict(self.stats)
+
+
+def call_with_retry(fn, limiter=None, tokens=0, max_retries=DEFAULT_MAX_RETRIES,
+                    base_delay=DEFAULT_BASE_DELAY, max_delay=DEFAULT_MAX_DELAY, breaker=None):
+    """Call ``fn()`` through the limiter, retrying transient errors.
+
+    Retries use exponential backoff with full jitter. Non-retryable errors
+    propagate immediately; retryable ones raise ``RetriesExhausted`` once
+    ``max_retries`` is reached. With a ``breaker`` (a
+    ``pipeline.resilience.CircuitBreaker``) every attempt is checked and
+    counted, so an open circuit raises ``CircuitOpen`` without calling.
+    """
+    attempt = 0
+    while True:
+        if breaker is not None:
+            breaker.before_call()
+        if limiter is not None:
+            limiter.acquire(tokens)
+        try:
+            result = fn()
+        except Exception as e:
+            if not is_retryable(e):
+                if breaker is not None:
+                    # The API answered; only this request was rejected
+                    breaker.record_success()
+                raise
+            if breaker is not None:
+                breaker.record_failure(e)
+            if attempt >= max_retries:
+                if limiter is not None:
+                    limiter.record('failures')
+                raise RetriesExhausted(f"{e} (after {attempt} retries)") from e
+            delay = random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+            attempt += 1
+            if limiter is not None:
+                limiter.record('retries')
+                limiter.record('backoff_seconds', delay)
+            print(f"Retrying Gemini call in {delay:.1f}s after error: {e}")
+            time.sleep(delay)
+        else:
+            if breaker is not None:
+                breaker.record_success()
+            return result
+
+
+_shared_limiters = {}
+_shared_limiter_lock = threading.Lock()
+
+
+def get_shared_limiter(requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE,
+                       tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE, scope=None):
+    """Process-wide limiter shared by every page and Streamlit session.
+
+    Callers whose requests count against different quotas (e.g. other
+    models) pass different ``scope`` values. The limits passed by the
+    first caller of a scope win.
+    """
+    with _shared_limiter_lock:
+        if scope not in _shared_limiters:
+            _shared_limiters[scope] = RateLimiter(requests_per_minute, tokens_per_minute)
+        return _shared_limiters[scope]
+
+def throttle_summary(before, after):
+    """Counter differences between two limiter snapshots."""
+    return {key: after[key] - before.get(key, 0) for key in after}
@@ -0,0 +1,257 @@
+"""Tail-latency and failure control for Gemini calls.
+
+``Hedger`` re-issues a batch whose call is slower than a high percentile
+of recent call latencies and keeps whichever answer arrives first, so one
+stuck request no longer holds up a run. ``CircuitBreaker`` stops calling
+the API after repeated failures and fails fast with ``CircuitOpen`` until
+a cool-down has passed and a trial call succeeds.
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from pipeline.ratelimit import RetriesExhausted
+from pipeline.tracing import percentile
+
+DEFAULT_HEDGE_PERCENTILE = 0.95  # Calls slower than this share of recent calls are hedged
+DEFAULT_INITIAL_HEDGE_DELAY = 15.0  # Seconds before hedging until enough latencies are known
+DEFAULT_MIN_HEDGE_DELAY = 2.0
+MIN_LATENCY_SAMPLES = 20
+CALL_POOL_SIZE = 32  # Threads running (possibly hedged) calls across all jobs
+LATENCY_WINDOW = 500  # Recent call latencies the hedge delay is computed from
+DEFAULT_MAX_HEDGE_SHARE = 0.1  # Most calls hedged, so a slow API is not sent twice the load
+DEFAULT_FAILURE_THRESHOLD = 5  # Consecutive failed calls that open the circuit
+DEFAULT_RESET_TIMEOUT = 30.0  # Seconds the circuit stays open before a trial call
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
+
+class CircuitOpen(RetriesExhausted):
+    """Raised instead of calling the API while the circuit is open.
+
+    A ``RetriesExhausted`` so the engine marks the batch as failed rather
+    than splitting it into more requests.
+    """
+
+
+def latency_percentiles(values):
+    """p50, p95 and p99 of a list of latencies in seconds."""
+    return {
+        'count': len(values),
+        'p50': percentile(values, 0.5),
+        'p95': percentile(values, 0.95),
+        'p99': percentile(values, 0.99),
+    }
+
+
+class LatencyTracker:
+    """Rolling window of recent call latencies, shared across threads."""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def values(self):
+        with self._lock:
+            return list(self._latencies)
+
+    def percentile(self, share, min_samples=MIN_LATENCY_SAMPLES):
+        """Latency at ``share``, or None while fewer than ``min_samples`` are known."""
+        values = self.values()
+        return percentile(values, share) if len(values) >= min_samples else None
+
+    def summary(self):
+        return latency_percentiles(self.values())
+
+
+class CircuitBreaker:
+    """Stops calls after ``failure_threshold`` consecutive failures.
+
+    Once open, calls raise ``CircuitOpen`` for ``reset_timeout`` seconds.
+    Then a single trial call is let through (half-open): its success
+    closes the circuit, its failure opens it again.
+    """
+
+    def __init__(self, failure_threshold=DEFAULT_FAILURE_THRESHOLD, reset_timeout=DEFAULT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CIRCUIT_CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.last_error = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+        self.stats = {'trips': 0, 'rejected': 0}
+
+    def before_call(self):
+        """Raise ``CircuitOpen`` unless a call may be made now."""
+        with self._lock:
+            if self.state == CIRCUIT_CLOSED:
+                return
+            retry_in = self.opened_at + self.reset_timeout - time.monotonic()
+            if self.state == CIRCUIT_OPEN and retry_in <= 0:
+                self.state = CIRCUIT_HALF_OPEN
+            if self.state == CIRCUIT_HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+            self.stats['rejected'] += 1
+            raise CircuitOpen(
+                f"Gemini calls paused after {self.consecutive_failures} consecutive failures "
+                f"(last error: {self.last_error})"
+            )
+
+    def record_success(self):
+        with self._lock:
+            self.state = CIRCUIT_CLOSED
+            self.consecutive_failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self, error):
+        with self._lock:
+            self.consecutive_failures += 1
+            self.last_error = str(error)
+            trial_failed = self.state == CIRCUIT_HALF_OPEN
+            self._trial_in_flight = False
+            if trial_failed or (self.state == CIRCUIT_CLOSED and self.consecutive_failures >= self.failure_threshold):
+                if self.state == CIRCUIT_CLOSED:
+                    self.stats['trips'] += 1
+                self.state = CIRCUIT_OPEN
+                self.opened_at = time.monotonic()
+
+    def status(self):
+        """State, failure count and seconds until the next trial call."""
+        with self._lock:
+            retry_in = 0
+            if self.state == CIRCUIT_OPEN:
+                retry_in = max(0, self.opened_at + self.reset_timeout - time.monotonic())
+            return {
+                'state': self.state,
+                'consecutive_failures': self.consecutive_failures,
+                'retry_in': retry_in,
+                'last_error': self.last_error,
+                'trips': self.stats['trips'],
+                'rejected': self.stats['rejected'],
+            }
+
+
+_call_pool = ThreadPoolExecutor(max_workers=CALL_POOL_SIZE, thread_name_prefix="gemini-call")
+
+
+class Hedger:
+    """Re-issues slow batch calls and keeps the first answer.
+
+    A call still running after the ``hedge_percentile`` latency of recent
+    calls (``initial_delay`` until ``MIN_LATENCY_SAMPLES`` are known) gets a
+    second, identical call; whichever succeeds first is returned and the
+    other one is left to finish in the background. At most
+    ``max_hedge_share`` of the calls are hedged, but always at least one.
+    Latencies are recorded in ``latencies``, which can be shared between
+    hedgers so the threshold carries over from one job to the next.
+    """
+
+    def __init__(self, latencies=None, hedge_percentile=DEFAULT_HEDGE_PERCENTILE,
+                 initial_delay=DEFAULT_INITIAL_HEDGE_DELAY, min_delay=DEFAULT_MIN_HEDGE_DELAY,
+                 max_hedge_share=DEFAULT_MAX_HEDGE_SHARE):
+        self.latencies = latencies if latencies is not None else LatencyTracker()
+        self.hedge_percentile = hedge_percentile
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.max_hedge_share = max_hedge_share
+        self._lock = threading.Lock()
+        self.stats = {'calls': 0, 'hedged': 0, 'hedge_wins': 0}
+        self._call_times = []
+
+    def hedge_delay(self):
+        """Seconds a call may run before it is hedged."""
+        threshold = self.latencies.percentile(self.hedge_percentile)
+        return max(self.min_delay, threshold if threshold is not None else self.initial_delay)
+
+    def _submit(self, classify_fn, batch):
+        submitted = time.perf_counter()
+        future = _call_pool.submit(classify_fn, batch)
+
+        def record(done):
+            if done.exception() is None:
+                self.latencies.record(time.perf_counter() - submitted)
+        future.add_done_callback(record)
+        return future
+
+    def _may_hedge(self):
+        with self._lock:
+            if self.stats['hedged'] >= max(1, self.max_hedge_share * self.stats['calls']):
+                return False
+            self.stats['hedged'] += 1
+            return True
+
+    def wrap(self, classify_fn):
+        """Return a hedged version of ``classify_fn(batch)``."""
+        def classify(batch):
+            start_time = time.perf_counter()
+            with self._lock:
+                self.stats['calls'] += 1
+            primary = self._submit(classify_fn, batch)
+            done, _ = wait([primary], timeout=self.hedge_delay())
+            if done or not self._may_hedge():
+                classifications, _ = primary.result()
+                return classifications, self._finish(start_time)
+
+            print(f"Hedging a batch of {len(batch)} responses after {time.perf_counter() - start_time:.1f}s")
+            hedge = self._submit(classify_fn, batch)
+            pending = {primary, hedge}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        if future is hedge:
+                            with self._lock:
+                                self.stats['hedge_wins'] += 1
+                        classifications, _ = future.result()
+                        return classifications, self._finish(start_time)
+            # Both calls failed: report the original call's error
+            raise primary.exception()
+
+        return classify
+
+    def _finish(self, start_time):
+        """Wall time of a (possibly hedged) call, as seen by the caller."""
+        elapsed = time.perf_counter() - start_time
+        with self._lock:
+            self._call_times.append(elapsed)
+        return elapsed
+
+    def summary(self):
+        """Hedging counters with p50/p95/p99 of the wall time per call."""
+        with self._lock:
+            summary = dict(self.stats)
+            call_times = list(self._call_times)
+        summary['latency'] = latency_percentiles(call_times)
+        summary['hedge_delay'] = self.hedge_delay()
+        return summary
+
+
+_shared_latencies = LatencyTracker()
+_shared_breaker = None
+_shared_breaker_lock = threading.Lock()
+
+
+def get_shared_latencies():
+    """Process-wide latency window, so hedge thresholds carry over between jobs."""
+    return _shared_latencies
+
+def get_shared_breaker(failure_threshold=DEFAULT_FAILURE_THRESHOLD, reset_timeout=DEFAULT_RESET_TIMEOUT):
+    """Process-wide circuit breaker shared by every page and Streamlit session.
+
+    The settings passed by the first caller win.
+    """
+    global _shared_breaker
+    with _shared_breaker_lock:
+        if _shared_breaker is None:
+            _shared_breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        return _shared_breaker
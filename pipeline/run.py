@@ -0,0 +1,64 @@
+"""Composition of the classification stages into one call."""
+from pipeline.batching import plan_batches
+from pipeline.cache import classify_with_cache
+from pipeline.dedup import classify_deduplicated
+from pipeline.engine import DEFAULT_MAX_WORKERS, classify_concurrently
+from pipeline.jobs import classify_resumable
+from pipeline.lexicon import DEFAULT_CONFIDENCE_THRESHOLD, classify_with_lexicon
+from pipeline.selftrain import DEFAULT_MODEL_THRESHOLD, classify_with_local_model
+from pipeline.tracing import span
+
+
+def classify_responses(responses, classify_fn, cache=None, job_store=None, job_id=None,
+                       max_workers=DEFAULT_MAX_WORKERS, batch_size=None, planner=plan_batches,
+                       on_batch_done=None, on_planned=None, on_cached=None, on_resumed=None,
+                       lexicon=None, local_threshold=DEFAULT_CONFIDENCE_THRESHOLD, on_local=None,
+                       local_model=None, local_model_threshold=DEFAULT_MODEL_THRESHOLD, label_store=None):
+    """Run responses through dedup, job resume, the local classifiers, cache and the engine.
+
+    Duplicates are collapsed first; with a ``job_store`` the responses
+    already checkpointed under ``job_id`` are restored; with a ``lexicon``
+    responses it classifies with at least ``local_threshold`` confidence
+    never reach the model, and likewise for a trained ``local_model`` at
+    ``local_model_threshold``; cache hits skip the model and only the
+    remaining misses are batched. Model labels are added to
+    ``label_store`` to train the next local model. A fixed ``batch_size``
+    replaces the token-budget ``planner``. ``on_planned(total)`` receives
+    the number of batches actually sent, once the earlier stages have
+    removed what they could. Returns ``(results, stats)`` in input order.
+    """
+    def run_engine(misses):
+        return classify_concurrently(
+            misses,
+            classify_fn,
+            batch_size,
+            max_workers=max_workers,
+            on_batch_done=on_batch_done,
+            planner=None if batch_size else planner,
+            on_planned=on_planned
+        )
+
+    def run_cached(remaining):
+        return classify_with_cache(remaining, cache, run_engine, on_cached=on_cached)
+
+    def run_local_model(remaining):
+        return classify_with_local_model(remaining, local_model, run_cached, threshold=local_model_threshold,
+                                         label_store=label_store, on_local=on_local)
+
+    def run_local(remaining):
+        if lexicon is None:
+            results, stats = run_local_model(remaining)
+            stats['local_responses'] = 0
+            return results, stats
+        return classify_with_lexicon(remaining, lexicon, run_local_model, threshold=local_threshold,
+                                     on_local=on_local)
+
+    def run_unique(unique_responses):
+        if job_store is None:
+            stats_results = run_local(unique_responses)
+            stats_results[1]['resumed_responses'] = 0
+            return stats_results
+        return classify_resumable(unique_responses, job_store, job_id, run_local, on_resumed=on_resumed)
+
+    with span("classify_responses", responses=len(responses)):
+        return classify_deduplicated(responses, run_unique)
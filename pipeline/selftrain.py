@@ -0,0 +1,252 @@
+"""Local text classifier trained on past model labels.
+
+Every result the model returns is kept in a ``LabelStore``. Once enough
+labels have accumulated, a ``LocalModel`` (TF-IDF character n-grams and
+calibrated linear classifiers, CPU only) predicts the type and the
+category/subcategory of new responses; only the ones it is unsure about
+are escalated to the model. ``evaluate_local_model`` measures agreement
+with held-out model labels at several confidence thresholds.
+
+scikit-learn is optional: without it no local model is trained and every
+response goes to the model as before.
+"""
+import json
+import random
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from pipeline.arabic import normalize_arabic
+
+DEFAULT_MODEL_THRESHOLD = 0.9
+MIN_TRAINING_LABELS = 300  # No local model below this many labels
+MAX_TRAINING_LABELS = 50000  # Most recent labels used for training
+MIN_CLASS_LABELS = 5  # Rarer labels are left to the model
+REPORT_THRESHOLDS = (0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.95, 0.98)
+_TOPIC_SEPARATOR = "\x1f"
+
+
+class LabelStore:
+    """SQLite store of model-labeled responses, namespaced by model and taxonomy."""
+
+    def __init__(self, path, model_name, taxonomy_hash):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.namespace = f"{model_name}\0{taxonomy_hash}"
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS labels ("
+            " namespace TEXT NOT NULL,"
+            " response TEXT NOT NULL,"
+            " classification TEXT NOT NULL,"
+            " labeled_at REAL NOT NULL,"
+            " PRIMARY KEY (namespace, response))"
+        )
+        self._conn.commit()
+
+    def add_many(self, results):
+        """Store ``{"response", "classification"}`` results returned by the model."""
+        now = time.time()
+        rows = [
+            (self.namespace, str(r['response']), json.dumps(r['classification'], ensure_ascii=False), now)
+            for r in results
+        ]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO labels (namespace, response, classification, labeled_at)"
+                " VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM labels WHERE namespace = ?", (self.namespace,)
+            ).fetchone()[0]
+
+    def load(self, limit=None):
+        """Stored labels, most recent first, as ``{"response", "classification"}`` results."""
+        query = "SELECT response, classification FROM labels WHERE namespace = ? ORDER BY labeled_at DESC"
+        params = (self.namespace,)
+        if limit:
+            query += " LIMIT ?"
+            params += (limit,)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [{"response": response, "classification": json.loads(c)} for response, c in rows]
+
+
+def _targets(labeled):
+    texts, types, topics = [], [], []
+    for result in labeled:
+        classification = result['classification']
+        texts.append(str(result['response']))
+        types.append(classification.get('type', ''))
+        topics.append(f"{classification.get('category', '')}{_TOPIC_SEPARATOR}{classification.get('subcategory', '')}")
+    return texts, types, topics
+
+def _common(texts, labels):
+    """Drop examples whose label is too rare to learn or calibrate."""
+    counts = {}
+    for label in labels:
+        counts[label] = counts.get(label, 0) + 1
+    keep = [i for i, label in enumerate(labels) if counts[label] >= MIN_CLASS_LABELS]
+    return [texts[i] for i in keep], [labels[i] for i in keep]
+
+
+class LocalModel:
+    """Character n-gram classifiers for type and category/subcategory.
+
+    Category and subcategory are predicted as one label so the pair always
+    exists in the taxonomy. The confidence of a prediction is the lower of
+    the two calibrated probabilities.
+    """
+
+    def __init__(self, type_classifier, topic_classifier, num_labels):
+        self.type_classifier = type_classifier
+        self.topic_classifier = topic_classifier
+        self.num_labels = num_labels
+
+    def predict(self, texts):
+        """Return ``[(classification, confidence)]`` for ``texts``."""
+        if not texts:
+            return []
+        texts = [str(t) for t in texts]
+        type_probs = self.type_classifier.predict_proba(texts)
+        topic_probs = self.topic_classifier.predict_proba(texts)
+        predictions = []
+        for type_row, topic_row in zip(type_probs, topic_probs):
+            type_index, topic_index = type_row.argmax(), topic_row.argmax()
+            category, subcategory = self.topic_classifier.classes_[topic_index].split(_TOPIC_SEPARATOR)
+            confidence = float(min(type_row[type_index], topic_row[topic_index]))
+            predictions.append(({
+                'type': self.type_classifier.classes_[type_index],
+                'category': category,
+                'subcategory': subcategory,
+                'explanation': f"تصنيف بالنموذج المحلي (الثقة {confidence:.2f})",
+            }, confidence))
+        return predictions
+
+
+def _make_classifier():
+    from sklearn.calibration import CalibratedClassifierCV
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.pipeline import make_pipeline
+    from sklearn.svm import LinearSVC
+
+    return make_pipeline(
+        TfidfVectorizer(analyzer='char_wb', ngram_range=(2, 5), min_df=2, sublinear_tf=True,
+                        preprocessor=normalize_arabic, max_features=200000),
+        CalibratedClassifierCV(LinearSVC(C=0.5), method='sigmoid', cv=3)
+    )
+
+def train_local_model(labeled, min_labels=MIN_TRAINING_LABELS):
+    """Train a ``LocalModel`` on model-labeled results, or return None.
+
+    None is returned when there are fewer than ``min_labels`` labels, when
+    a target has fewer than two learnable classes, or when scikit-learn is
+    not installed.
+    """
+    if len(labeled) < min_labels:
+        return None
+    texts, types, topics = _targets(labeled)
+    type_texts, types = _common(texts, types)
+    topic_texts, topics = _common(texts, topics)
+    if len(set(types)) < 2 or len(set(topics)) < 2:
+        return None
+    try:
+        type_classifier = _make_classifier().fit(type_texts, types)
+        topic_classifier = _make_classifier().fit(topic_texts, topics)
+    except ImportError:
+        print("scikit-learn is not installed; local model disabled")
+        return None
+    return LocalModel(type_classifier, topic_classifier, len(labeled))
+
+def evaluate_local_model(labeled, test_share=0.2, seed=0, thresholds=REPORT_THRESHOLDS):
+    """Train on part of the labels and compare predictions with the held-out rest.
+
+    Returns a report with the accuracy of each field on all held-out
+    labels and, per confidence threshold, the share of responses the local
+    model would keep (``coverage``) and how often those fully agree with
+    the model's label (``agreement``). Returns None if no model could be
+    trained.
+    """
+    labeled = list(labeled)
+    random.Random(seed).shuffle(labeled)
+    num_test = max(1, int(len(labeled) * test_share))
+    test, train = labeled[:num_test], labeled[num_test:]
+    model = train_local_model(train)
+    if model is None:
+        return None
+
+    predictions = model.predict([r['response'] for r in test])
+    matches = {field: 0 for field in ('type', 'category', 'subcategory', 'all')}
+    scored = []
+    for result, (predicted, confidence) in zip(test, predictions):
+        expected = result['classification']
+        agree = {field: predicted[field] == expected.get(field) for field in ('type', 'category', 'subcategory')}
+        agree['all'] = all(agree.values())
+        for field, ok in agree.items():
+            matches[field] += ok
+        scored.append((confidence, agree['all']))
+
+    by_threshold = []
+    for threshold in thresholds:
+        kept = [ok for confidence, ok in scored if confidence >= threshold]
+        by_threshold.append({
+            'threshold': threshold,
+            'coverage': len(kept) / len(scored),
+            'agreement': sum(kept) / len(kept) if kept else None,
+        })
+    return {
+        'train_labels': len(train),
+        'test_labels': len(test),
+        'accuracy': {field: count / len(test) for field, count in matches.items()},
+        'thresholds': by_threshold,
+    }
+
+
+def classify_with_local_model(responses, model, classify_fn, threshold=DEFAULT_MODEL_THRESHOLD,
+                              label_store=None, on_local=None):
+    """Keep confident local predictions and escalate the rest to ``classify_fn``.
+
+    ``classify_fn(remaining)`` must return ``(results, stats)``; its results
+    are added to ``label_store`` as training data for the next model.
+    ``model`` may be None, in which case everything is escalated.
+    ``on_local(results)`` receives the local results before any request is
+    sent. Returns ``(results, stats)`` in input order with
+    ``local_model_responses`` added to the stats.
+    """
+    local = {}
+    if model is not None:
+        unique_texts = list(dict.fromkeys(str(r) for r in responses))
+        for text, (classification, confidence) in zip(unique_texts, model.predict(unique_texts)):
+            if confidence >= threshold:
+                local[text] = classification
+    if on_local and local:
+        on_local([
+            {"response": response, "classification": local[str(response)]}
+            for response in responses
+            if str(response) in local
+        ])
+
+    remaining = [r for r in responses if str(r) not in local]
+    new_results, stats = classify_fn(remaining)
+    if label_store is not None:
+        label_store.add_many(new_results)
+
+    classified = {str(r['response']): r['classification'] for r in new_results}
+    classified.update(local)
+    results = [
+        {"response": response, "classification": classified[str(response)]}
+        for response in responses
+        if str(response) in classified
+    ]
+    stats = dict(stats)
+    stats['local_model_responses'] = len(responses) - len(remaining)
+    return results, stats
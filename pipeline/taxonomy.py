@@ -0,0 +1,126 @@
+"""Precompiled index of the taxonomy for validating model labels.
+
+Every category/subcategory pair the model returns is checked against the
+pairs in the taxonomy file with one dictionary lookup. Near misses are
+snapped to the closest valid pair instead of splitting the charts:
+
+- spelling variants that are equal once normalized ("المكتبه", "مكتبة")
+- a valid subcategory returned under the wrong category
+- small typos, matched with ``difflib`` on the normalized names
+
+Labels that match nothing are reported as invalid so only those items are
+requested again.
+"""
+import difflib
+
+import yaml
+
+from pipeline.arabic import normalize_arabic
+
+UNRELATED = 'خطأ'  # Category/subcategory used for invalid or unrelated responses
+FUZZY_CUTOFF = 0.8  # Least difflib similarity for a typo to be snapped
+MAX_SNAP_MEMO = 10000  # Resolved near misses remembered before the memo is cleared
+
+# Outcomes of TaxonomyIndex.snap
+LABEL_VALID = "valid"
+LABEL_SNAPPED = "snapped"
+LABEL_INVALID = "invalid"
+
+
+def label_key(text):
+    """Normalized form of a label, ignoring the definite article on each word."""
+    words = normalize_arabic(text).split()
+    return ' '.join(word[2:] if word.startswith('ال') and len(word) > 4 else word for word in words)
+
+
+class TaxonomyIndex:
+    """Valid category/subcategory pairs of a taxonomy, indexed for lookup.
+
+    A subcategory name may appear under several categories; under the
+    wrong one it is snapped to the first category listing it.
+    """
+
+    def __init__(self, categories):
+        self.pairs = {(UNRELATED, UNRELATED)}
+        self._categories = {}
+        self._subcategories = {}
+        for category, info in (categories or {}).items():
+            self._categories.setdefault(label_key(category), category)
+            for subcategory in (info or {}).get('subcategories', []) or []:
+                self.pairs.add((category, subcategory))
+                self._subcategories.setdefault(label_key(subcategory), []).append((category, subcategory))
+        self._snapped = {}
+
+    @classmethod
+    def from_text(cls, text):
+        data = yaml.safe_load(text) or {}
+        return cls(data.get('categories', {}))
+
+    @classmethod
+    def from_file(cls, path):
+        """Index of a taxonomy YAML file like data/Classes.txt."""
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls.from_text(f.read())
+
+    def _lookup(self, names, text):
+        """Value for the exact normalized key of ``text``, or its closest fuzzy match."""
+        key = label_key(text)
+        if key in names:
+            return names[key]
+        matches = difflib.get_close_matches(key, names, n=1, cutoff=FUZZY_CUTOFF)
+        return names[matches[0]] if matches else None
+
+    def _resolve(self, category, subcategory):
+        if UNRELATED in (category, subcategory):
+            return UNRELATED, UNRELATED
+        candidates = self._lookup(self._subcategories, subcategory)
+        if candidates is None:
+            return None
+        parent = self._lookup(self._categories, category)
+        for pair in candidates:
+            if pair[0] == parent:
+                return pair
+        return candidates[0]
+
+    def snap(self, category, subcategory):
+        """Valid ``(category, subcategory, outcome)`` for a returned pair.
+
+        ``outcome`` is ``LABEL_VALID`` for an exact match, ``LABEL_SNAPPED``
+        when a near miss was corrected and ``LABEL_INVALID`` (with ``None``
+        names) when nothing close exists. Resolved near misses are memoized,
+        so a misspelling the model repeats costs one lookup.
+        """
+        if (category, subcategory) in self.pairs:
+            return category, subcategory, LABEL_VALID
+        key = (category, subcategory)
+        if key in self._snapped:
+            pair = self._snapped[key]
+        else:
+            pair = self._resolve(category, subcategory)
+            if len(self._snapped) >= MAX_SNAP_MEMO:
+                self._snapped.clear()
+            self._snapped[key] = pair
+        if pair is None:
+            return None, None, LABEL_INVALID
+        return pair[0], pair[1], LABEL_SNAPPED
+
+    def validate_all(self, classifications):
+        """Snap the labels of aligned classifications in place.
+
+        ``classifications`` is a batch's aligned list; items whose labels
+        are invalid are replaced by ``None`` so the engine asks for them
+        again. Returns ``(classifications, snapped, invalid)`` counts.
+        """
+        snapped = invalid = 0
+        for position, item in enumerate(classifications):
+            if item is None:
+                continue
+            labels = item['classification']
+            category, subcategory, outcome = self.snap(labels['category'], labels['subcategory'])
+            if outcome == LABEL_INVALID:
+                classifications[position] = None
+                invalid += 1
+            elif outcome == LABEL_SNAPPED:
+                labels['category'], labels['subcategory'] = category, subcategory
+                snapped += 1
+        return classifications, snapped, invalid
@@ -0,0 +1,159 @@
+"""Timing spans of the hot path, written to a rotating JSONL trace file.
+
+Code is instrumented with::
+
+    with span("model_call", batch_size=len(batch)) as attributes:
+        ...
+        attributes['items'] = len(items)
+
+Every finished span is one JSON line with its name, start time, duration
+in milliseconds, thread and attributes. Tracing is off until
+``configure_tracing(path)`` is called, so spans cost next to nothing where
+it is never enabled. ``read_trace`` and ``summarize_spans`` aggregate the
+file and its rotated backups per span name.
+"""
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+DEFAULT_MAX_BYTES = 5 * 1024 * 1024  # Trace file size before it is rotated
+DEFAULT_BACKUP_COUNT = 3  # Rotated trace files kept
+
+_logger = logging.getLogger("pipeline.trace")
+_logger.setLevel(logging.INFO)
+_logger.propagate = False
+_handler = None
+_lock = threading.Lock()
+
+
+def configure_tracing(path, max_bytes=DEFAULT_MAX_BYTES, backup_count=DEFAULT_BACKUP_COUNT):
+    """Write spans to ``path`` from now on, or stop tracing when ``path`` is None.
+
+    Safe to call on every Streamlit rerun: configuring the same path again
+    keeps the open file.
+    """
+    global _handler
+    with _lock:
+        if _handler is not None and path is not None and _handler.baseFilename == str(Path(path).resolve()):
+            return
+        if _handler is not None:
+            _logger.removeHandler(_handler)
+            _handler.close()
+            _handler = None
+        if path is None:
+            return
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        _handler = RotatingFileHandler(str(Path(path).resolve()), maxBytes=max_bytes,
+                                       backupCount=backup_count, encoding='utf-8', delay=True)
+        _handler.setFormatter(logging.Formatter('%(message)s'))
+        _logger.addHandler(_handler)
+
+def record_span(name, duration, start=None, **attributes):
+    """Write a span whose ``duration`` in seconds the caller measured itself."""
+    if _handler is None:
+        return
+    entry = {
+        'name': name,
+        'start': round(start if start is not None else time.time() - duration, 6),
+        'duration_ms': round(duration * 1000, 3),
+        'thread': threading.current_thread().name,
+    }
+    if attributes:
+        entry['attributes'] = attributes
+    _logger.info(json.dumps(entry, ensure_ascii=False, default=str))
+
+@contextmanager
+def span(name, **attributes):
+    """Time the enclosed block as a span named ``name``.
+
+    Yields the attributes dict so the block can add what it learns (item
+    counts, batch sizes). An exception is recorded as the ``error``
+    attribute and re-raised.
+    """
+    if _handler is None:
+        yield attributes
+        return
+    start = time.time()
+    start_counter = time.perf_counter()
+    try:
+        yield attributes
+    except BaseException as e:
+        attributes['error'] = type(e).__name__
+        raise
+    finally:
+        record_span(name, time.perf_counter() - start_counter, start=start, **attributes)
+
+def trace_iter(name, iterable, **attributes):
+    """Yield from ``iterable``, recording the time spent producing each item as a span."""
+    iterator = iter(iterable)
+    while True:
+        start = time.time()
+        start_counter = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        record_span(name, time.perf_counter() - start_counter, start=start, items=len(item), **attributes)
+        yield item
+
+
+def read_trace(path, since=None):
+    """Spans from ``path`` and its rotated backups, oldest first.
+
+    Only spans that started at or after the ``since`` timestamp are
+    returned; unreadable lines are skipped.
+    """
+    path = Path(path)
+    files = [Path(f"{path}.{i}") for i in range(DEFAULT_BACKUP_COUNT, 0, -1)] + [path]
+    spans = []
+    for file in files:
+        if not file.exists():
+            continue
+        with open(file, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if since is None or entry.get('start', 0) >= since:
+                    spans.append(entry)
+    return spans
+
+def percentile(values, share):
+    """Nearest-rank percentile of ``values`` (``share`` between 0 and 1)."""
+    if not values:
+        return 0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(share * len(ordered))) - 1))]
+
+def summarize_spans(spans):
+    """Count, total seconds and mean/p50/p95/p99/max milliseconds per span name.
+
+    Rows are ordered by total time, largest first.
+    """
+    durations = {}
+    errors = {}
+    for entry in spans:
+        name = entry.get('name', '')
+        durations.setdefault(name, []).append(float(entry.get('duration_ms', 0)))
+        if (entry.get('attributes') or {}).get('error'):
+            errors[name] = errors.get(name, 0) + 1
+    rows = [
+        {
+            'name': name,
+            'count': len(values),
+            'total_seconds': sum(values) / 1000,
+            'mean_ms': sum(values) / len(values),
+            'p50_ms': percentile(values, 0.5),
+            'p95_ms': percentile(values, 0.95),
+            'p99_ms': percentile(values, 0.99),
+            'max_ms': max(values),
+            'errors': errors.get(name, 0),
+        }
+        for name, values in durations.items()
+    ]
+    return sorted(rows, key=lambda row: row['total_seconds'], reverse=True)
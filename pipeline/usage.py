@@ -0,0 +1,93 @@
+"""Token and cost accounting of model calls."""
+import threading
+import time
+
+# USD per million (prompt, output) tokens; unknown models use DEFAULT_PRICE
+MODEL_PRICES = {
+    'gemini-2.0-flash-exp': (0.10, 0.40),
+    'gemini-2.0-flash': (0.10, 0.40),
+    'gemini-1.5-flash': (0.075, 0.30),
+    'gemini-1.5-pro': (1.25, 5.00),
+    'gemini-pro': (0.50, 1.50),
+}
+DEFAULT_PRICE = (0.10, 0.40)
+
+
+def estimate_cost(model_name, prompt_tokens, output_tokens):
+    """Estimated cost in USD of one call from the published per-token prices."""
+    name = str(model_name or '').split('/')[-1]
+    if ':' in name:
+        # Fake backend names like "fake:gemini-2.0-flash-exp" are priced as the real model
+        name = name.split(':', 1)[1]
+    prompt_price, output_price = MODEL_PRICES.get(name, DEFAULT_PRICE)
+    return (prompt_tokens * prompt_price + output_tokens * output_price) / 1_000_000
+
+def response_usage(response, model_name):
+    """Tokens, finish reason and estimated cost of one answer.
+
+    For a streamed answer, call this only after every chunk was read; the
+    usage metadata is filled in with the last chunk.
+    """
+    metadata = getattr(response, 'usage_metadata', None)
+    prompt_tokens = int(getattr(metadata, 'prompt_token_count', 0) or 0)
+    output_tokens = int(getattr(metadata, 'candidates_token_count', 0) or 0)
+    try:
+        candidates = response.candidates or []
+    except Exception:
+        candidates = []
+    finish_reason = getattr(candidates[0], 'finish_reason', None) if candidates else None
+    return {
+        'model': str(model_name or '').split('/')[-1],
+        'prompt_tokens': prompt_tokens,
+        'output_tokens': output_tokens,
+        'finish_reason': getattr(finish_reason, 'name', None) or (str(finish_reason) if finish_reason else ''),
+        'cost': estimate_cost(model_name, prompt_tokens, output_tokens),
+    }
+
+
+class UsageTracker:
+    """Thread-safe record of the model calls made for a job, a run or a user."""
+
+    def __init__(self):
+        self._records = []
+        self._lock = threading.Lock()
+
+    def record(self, usage, kind="classification", items=0):
+        """Add one call's ``response_usage`` with what it was for and how many items it carried."""
+        entry = dict(usage, kind=kind, items=items, time=time.time())
+        with self._lock:
+            self._records.append(entry)
+
+    def extend(self, records):
+        """Add records collected by another tracker (e.g. a finished job's)."""
+        with self._lock:
+            self._records.extend(records)
+
+    def records(self):
+        with self._lock:
+            return list(self._records)
+
+    def summary(self):
+        """Totals over all recorded calls."""
+        return summarize_usage(self.records())
+
+
+def summarize_usage(records):
+    """Call count, token totals, cost and finish reasons of usage records."""
+    finish_reasons = {}
+    for record in records:
+        reason = record['finish_reason'] or 'UNKNOWN'
+        finish_reasons[reason] = finish_reasons.get(reason, 0) + 1
+    prompt_tokens = sum(r['prompt_tokens'] for r in records)
+    output_tokens = sum(r['output_tokens'] for r in records)
+    items = sum(r['items'] for r in records)
+    cost = sum(r['cost'] for r in records)
+    return {
+        'calls': len(records),
+        'prompt_tokens': prompt_tokens,
+        'output_tokens': output_tokens,
+        'total_tokens': prompt_tokens + output_tokens,
+        'cost': cost,
+        'cost_per_item': cost / items if items else 0,
+        'finish_reasons': finish_reasons,
+    }